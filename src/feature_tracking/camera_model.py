@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Pinhole camera model built from sensor_msgs/CameraInfo, to turn pixels into unit bearings.
+"""
+import numpy as np
+
+
+def calibration_hash(camera_info):
+    # type: (CameraInfo)->int
+    u"""
+    Hash of everything in a CameraInfo that changes the bearing of a pixel.
+    """
+    return hash((
+        camera_info.width,
+        camera_info.height,
+        camera_info.distortion_model,
+        tuple(camera_info.K),
+        tuple(camera_info.D)
+    ))
+
+
+class CameraIntrinsics(object):
+    u"""
+    Intrinsics of a camera with plumb_bob or rational_polynomial distortion.
+    """
+    def __init__(self, K, D, width, height, distortion_model="plumb_bob"):
+        # type: (np.ndarray, np.ndarray, int, int, str)->None
+        K = np.asarray(K, dtype=np.float).reshape((3, 3))
+        self.fx = K[0, 0]
+        self.fy = K[1, 1]
+        self.cx = K[0, 2]
+        self.cy = K[1, 2]
+        self.width = width
+        self.height = height
+
+        # k1, k2, p1, p2, k3, k4, k5, k6
+        self.distortion = np.zeros((8,))
+        D = np.asarray(D, dtype=np.float)
+        if distortion_model not in ("plumb_bob", "rational_polynomial") and np.any(D != 0):
+            raise ValueError("unsupported distortion model '{0}'".format(distortion_model))
+        self.distortion[0:min(D.shape[0], 8)] = D[0:8]
+        self.distorted = bool(np.any(self.distortion != 0))
+
+        self._lookup_table = None
+
+    @staticmethod
+    def from_camera_info(camera_info):
+        # type: (CameraInfo)->CameraIntrinsics
+        return CameraIntrinsics(
+            camera_info.K,
+            camera_info.D,
+            camera_info.width,
+            camera_info.height,
+            camera_info.distortion_model
+        )
+
+    def undistort(self, points_2d, iterations=5):
+        # type: (np.ndarray, int)->np.ndarray
+        u"""
+        Converts pixels to undistorted normalized image coordinates (x/z, y/z), with the same
+        fixed point iterations as cv2.undistortPoints.
+        :param points_2d: the pixels, size:(x, 2)
+        :return: the normalized coordinates, size:(x, 2)
+        """
+        x0 = (points_2d[:, 0] - self.cx) / self.fx
+        y0 = (points_2d[:, 1] - self.cy) / self.fy
+        if not self.distorted:
+            return np.stack([x0, y0], axis=1)
+
+        k1, k2, p1, p2, k3, k4, k5, k6 = self.distortion
+        x, y = x0, y0
+        for _ in xrange(iterations):
+            r2 = x * x + y * y
+            icdist = (1 + ((k6 * r2 + k5) * r2 + k4) * r2) / (1 + ((k3 * r2 + k2) * r2 + k1) * r2)
+            delta_x = 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+            delta_y = p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+            x = (x0 - delta_x) * icdist
+            y = (y0 - delta_y) * icdist
+        return np.stack([x, y], axis=1)
+
+    def pixels_to_bearings(self, points_2d):
+        # type: (np.ndarray)->np.ndarray
+        u"""
+        Unit bearings, in the camera optical frame, of the pixels.
+        Uses the lookup table if build_lookup_table was called.
+        :param points_2d: the pixels, size:(x, 2)
+        :return: the bearings, size:(x, 3)
+        """
+        if self._lookup_table is not None:
+            columns = np.clip(np.rint(points_2d[:, 0]).astype(np.intp), 0, self.width - 1)
+            rows = np.clip(np.rint(points_2d[:, 1]).astype(np.intp), 0, self.height - 1)
+            return self._lookup_table[rows, columns]
+
+        bearings = np.ones((points_2d.shape[0], 3))
+        bearings[:, 0:2] = self.undistort(points_2d)
+        bearings /= np.sqrt(np.einsum('ij,ij->i', bearings, bearings))[:, np.newaxis]
+        return bearings
+
+    def build_lookup_table(self):
+        # type: ()->None
+        u"""
+        Precomputes the bearing of every pixel, so pixels_to_bearings becomes a single gather
+        (to the closest pixel). Costs width*height*24 bytes.
+        """
+        columns, rows = np.meshgrid(np.arange(self.width, dtype=np.float), np.arange(self.height, dtype=np.float))
+        pixels = np.stack([columns.ravel(), rows.ravel()], axis=1)
+        # Computed, not gathered from a previous table
+        self._lookup_table = None
+        self._lookup_table = self.pixels_to_bearings(pixels).reshape((self.height, self.width, 3))
+
+
+class IntrinsicsCache(object):
+    u"""
+    CameraIntrinsics of every camera, keyed by frame_id. An entry is rebuilt only when the
+    calibration in the CameraInfo changes. The CameraInfo of the previous call is not even hashed
+    again, so a CameraInfoStore keeping the same message costs nothing per frame.
+    """
+    def __init__(self, use_lookup_tables=False):
+        self.use_lookup_tables = use_lookup_tables
+        self._entries = {}
+
+    def get(self, camera_info):
+        # type: (CameraInfo)->CameraIntrinsics
+        frame_id = camera_info.header.frame_id
+        entry = self._entries.get(frame_id)
+        if entry is not None and entry[2] is camera_info:
+            return entry[1]
+        current_hash = calibration_hash(camera_info)
+        if entry is None or entry[0] != current_hash:
+            intrinsics = CameraIntrinsics.from_camera_info(camera_info)
+            if self.use_lookup_tables:
+                intrinsics.build_lookup_table()
+        else:
+            intrinsics = entry[1]
+        self._entries[frame_id] = (current_hash, intrinsics, camera_info)
+        return intrinsics
+
+    def pixels_to_bearings(self, camera_info, points_2d):
+        # type: (CameraInfo, np.ndarray)->np.ndarray
+        return self.get(camera_info).pixels_to_bearings(points_2d)
+
+
+class CameraInfoStore(object):
+    u"""
+    Latest CameraInfo of every camera, keyed by camera index. The stored message is only replaced,
+    and its version bumped, when the calibration or the frame changes : the intrinsics are received
+    at every frame but almost never change.
+    """
+    def __init__(self):
+        # camera index -> (frame_id, calibration hash, version, CameraInfo), replaced as a whole
+        self._entries = {}
+
+    def update(self, camera_info, camera_index):
+        # type: (CameraInfo, int)->bool
+        u"""
+        :return: True if the stored CameraInfo changed
+        """
+        entry = self._entries.get(camera_index)
+        frame_id = camera_info.header.frame_id
+        current_hash = calibration_hash(camera_info)
+        if entry is not None and entry[0] == frame_id and entry[1] == current_hash:
+            return False
+        version = entry[2] + 1 if entry is not None else 1
+        self._entries[camera_index] = (frame_id, current_hash, version, camera_info)
+        return True
+
+    def get(self, camera_index):
+        # type: (int)->CameraInfo
+        u"""
+        :return: the CameraInfo of the camera, None if none was received
+        """
+        entry = self._entries.get(camera_index)
+        return entry[3] if entry is not None else None
+
+    def version(self, camera_index):
+        # type: (int)->int
+        u"""
+        :return: the number of different CameraInfo received from the camera
+        """
+        entry = self._entries.get(camera_index)
+        return entry[2] if entry is not None else 0
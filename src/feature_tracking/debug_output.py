@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Debug output of the detected points, kept off the localization path : nothing is built when
+nobody listens, and the messages are built and published by a background thread.
+"""
+import collections
+import threading
+
+import numpy as np
+
+import rospy
+from geometry_msgs.msg import Pose
+from geometry_msgs.msg import PoseArray
+from std_msgs.msg import Header
+
+
+def points_to_poses(points):
+    # type: (np.ndarray)->list[Pose]
+    u"""
+    :param points: size:(x, 3), or size:(x, 2) for points at z = 0
+    """
+    if points.shape[-1] < 3:
+        points = np.concatenate([points, np.zeros((points.shape[0], 3 - points.shape[-1]))], axis=1)
+    poses = []
+    for x, y, z in points[:, 0:3].tolist():
+        pose = Pose()
+        pose.position.x = x
+        pose.position.y = y
+        pose.position.z = z
+        poses.append(pose)
+    return poses
+
+
+class DebugPublisher(object):
+    u"""
+    Publishes PoseArray of points, followed by the static points (the arena) whose poses are built once.
+    publish only queues the request; a request holds either the points or a function returning them,
+    which is only called by the publisher thread. When the queue is full, the oldest request is dropped.
+    """
+    def __init__(self, publisher, static_points=None, enabled=True, queue_size=2):
+        # type: (rospy.Publisher, np.ndarray, bool, int)->None
+        u"""
+        :param publisher: may be None if not enabled
+        """
+        self.publisher = publisher
+        self.enabled = enabled
+        self.dropped_requests = 0
+        self._static_points = None
+        self._static_poses = []
+        self._queue = collections.deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._running = True
+        if static_points is not None:
+            self.set_static_points(static_points)
+
+        # Nothing is ever published when disabled, the thread is not even started
+        self._thread = None
+        if enabled:
+            self._thread = threading.Thread(target=self._run, name="debug_output")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def set_static_points(self, static_points):
+        # type: (np.ndarray)->None
+        u"""
+        The poses of the static points are built with the first message, not at node start.
+        """
+        self._static_points = static_points
+        self._static_poses = None
+
+    def is_active(self):
+        # type: ()->bool
+        u"""
+        True if a published message would be seen by someone.
+        """
+        return self.enabled and self.publisher.get_num_connections() > 0
+
+    def publish(self, frame, points, stamp=None):
+        # type: (str, np.ndarray|callable, rospy.Time)->None
+        u"""
+        :param frame: the frame of the points
+        :param points: the points size:(x, 3), or a function without arguments returning them
+        :param stamp: the stamp of the message, now if None
+        """
+        if not self.is_active():
+            return
+        if stamp is None:
+            stamp = rospy.Time.now()
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped_requests += 1
+            self._queue.append((frame, points, stamp))
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def build_message(self, frame, points, stamp):
+        # type: (str, np.ndarray|callable, rospy.Time)->PoseArray
+        if callable(points):
+            points = points()
+        message = PoseArray()
+        message.header = Header(stamp=stamp, frame_id=frame)
+        if self._static_poses is None:
+            self._static_poses = points_to_poses(self._static_points)
+        message.poses = points_to_poses(np.asarray(points)) + self._static_poses
+        return message
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and len(self._queue) == 0:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                request = self._queue.popleft()
+            try:
+                self.publisher.publish(self.build_message(*request))
+            except rospy.ROSException as e:
+                rospy.logwarn_throttle(5, "Debug output failed: {0}".format(e))
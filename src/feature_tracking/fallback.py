@@ -6,144 +6,140 @@ Fallback du merge des points.
 import threading
 import math
 import sys
+from multiprocessing.pool import ThreadPool
+
+# First, so the imports below are part of the startup profile
+import instrumentation
+g_import_start = instrumentation.monotonic()
 
 import numpy as np
 import quaternion
 
-import cv2
-import opengv
-
 import rospy
 import tf
 import message_filters
 
-from geometry_msgs.msg import Pose
 from geometry_msgs.msg import PoseArray
+from geometry_msgs.msg import PoseWithCovarianceStamped
 from sensor_msgs.msg import CameraInfo
-from std_msgs.msg import Header
+from tf2_msgs.msg import TFMessage
 import elikos_msgs.msg as elikos_msgs
 
 import message_interface as msgs
 import point_manipulation as pt_manip
 import point_matching as pt_match
 import message_filters_extras
+import transform_cache
+import camera_model
+import debug_output
+import pose_output
+import localizer
+import state_machine
+from localizer import LocalizationUnavailableException
 
 ###
 #
 # Classes
 #
 ###
-class LocalizationUnavailableException(Exception):
-    u"""
-    Excepition thrown when the drone cannot localize itself.
-    """
-    def __init__(self, message = "localization was unavailable", cause=None):
-        super(LocalizationUnavailableException, self).__init__(message + u', caused by ' + (repr(cause) if cause is not None else ''))
-        self.cause = cause
-
-
-class FullMessage:
-    def __init__(self, localization_msg, camera_info):
-        self.header = localization_msg.header
-        self.localization_msg = localization_msg
-        self.camera_info = camera_info
-
-
-class Configuration:
-    def __init__(self):
-        self.publish_fcu_on_failure = rospy.get_param(
-            "~publish_fcu_on_failure",
-            False
-        )
-        self.topic_localization_points_prefix = rospy.get_param(
-            "~topic_localization_points_prefix",
-            "localization/features_"
-        )
-        self.topic_camera_info_prefix = rospy.get_param(
-            "~topic_camera_info_prefix",
-            "localization/camera_info_"
-        )
-
-        self.initial_drone_position = np.array(
-            rospy.get_param("~initial_drone_pos", [0, 0, 0])
-        )
-        self.initial_drone_rotation = quaternion.as_quat_array(
-            np.array(
-                rospy.get_param("~initial_drone_rot", [1, 0, 0, 0])
-            )
-        )
-        self.stabilization_time = rospy.get_param(
-            "~stabilization_time",
-            3.0
-        )
-        self.camera_number = rospy.get_param(
-            "~camera_number",
-            1
-        )
-        self.watchdog_max_message_delay = rospy.get_param(
-            "~watchdog_max_message_delay",
-            1.0
-        )
-
-        self.frames = {}
-        self.frames["arena_center"] = rospy.get_param("~arena_center_frame_id", "elikos_arena_origin")
-        self.frames["fcu"] = rospy.get_param("~fcu_frame_id", "elikos_fcu")
-        self.frames["output"] = rospy.get_param("~output_position_fcu_frame_id", "elikos_vision")
-
-
-
 class GlobalState:
-    def __init__(self):
+    def __init__(self, configuration=None, sources=None):
+        u"""
+        :param configuration: the Configuration, read from the parameter server if None
+        :param sources: for every camera, the message filters giving its IntersectionArray and its
+         CameraInfo. If None, they are subscribed to on the topics of the configuration.
+        """
         self.last_fcu_position = None
-        self.configuration = Configuration()
+        # Set by init_node if the FCU pose comes from ~fcu_pose_topic instead of tf
+        self.fcu_pose_buffer = None
+        # Set by init_node if ~diagnostics_period is positive
+        self.diagnostics_publisher = None
+        self.diagnostics_timer = None
+        # Set by run_state_machine
+        self.state_machine = None
+        # Only subscribed to while waiting for the first transform of the FCU
+        self.tf_subscriber = None
+        self.configuration = configuration if configuration is not None else localizer.Configuration(rospy.get_param)
+
+        # The arena map, the caches and the estimators, everything that does not need ROS
+        self.localizer = localizer.Localizer(self.configuration)
+        self.instrumentation = self.localizer.instrumentation
 
         if self.configuration.camera_number <= 0:
             rospy.logwarn("Not listening on any camera. Have you checked the camera_number parameter?")
 
+        # Deserializes and transforms the intersections of the cameras concurrently, None to do it in the callback thread
+        self.preprocessing_pool = None
+        preprocessing_threads = self.configuration.preprocessing_threads or self.configuration.camera_number
+        if preprocessing_threads > 1 and self.configuration.camera_number > 1:
+            self.preprocessing_pool = ThreadPool(min(preprocessing_threads, self.configuration.camera_number))
+
         # Creating the message filters listeners.
         self.camera_listeners = []
+        self.intersection_buffers = []
+        # The intrinsics are latched : the intersections never wait for their CameraInfo
+        self.camera_info_store = camera_model.CameraInfoStore()
+
+        live_sources = sources is None
+        if live_sources:
+            raw_decoder = None
+            if self.configuration.raw_intersection_decoding:
+                raw_decoder = msgs.RawIntersectionDecoder()
+            sources = [self.subscribe_to_camera(i, raw_decoder) for i in xrange(self.configuration.camera_number)]
+
+        for i, (points_filter_subscriber, camera_info_filter_subscriber) in enumerate(sources):
+            camera_info_filter_subscriber.registerCallback(self.camera_info_store.update, i)
+            self.intersection_buffers.append(msgs.IntersectionBuffers())
+            self.camera_listeners.append(points_filter_subscriber)
+
+        # Streamed cameras are not bundled, each of their frames updates the pose on its own
+        self.synchonyser = None
+        if self.configuration.fusion_mode != "streaming":
+            # Replayed sources are fed faster than real time, their bundles have no wall time deadline
+            self.synchonyser = message_filters_extras.QuorumSynchronizer(
+                self.camera_listeners,
+                self.configuration.sync_quorum,
+                self.configuration.sync_slop,
+                self.configuration.sync_deadline,
+                message_filters_extras.rospy_timer if live_sources else None
+            )
 
+        self.current_callback = None
 
-        for i in xrange(self.configuration.camera_number):
-            points_subscriber_name = self.configuration.topic_localization_points_prefix + str(i)
-            camera_info_subscriber_name = self.configuration.topic_camera_info_prefix + str(i)
+        self.total_messages_processed = 0
+        self.last_message_time = rospy.Time(0)
 
+    def subscribe_to_camera(self, i, raw_decoder=None):
+        # type: (int, msgs.RawIntersectionDecoder)->tuple[message_filters.SimpleFilter, message_filters.Subscriber]
+        u"""
+        Subscribes to the intersections and the camera info of camera i.
+        :param raw_decoder: if not None, the intersections are read from the serialized messages
+        """
+        points_subscriber_name = self.configuration.topic_localization_points_prefix + str(i)
+        camera_info_subscriber_name = self.configuration.topic_camera_info_prefix + str(i)
+
+        if raw_decoder is not None:
+            # The points are read straight from the serialized message.
+            points_filter_subscriber = message_filters_extras.Combiner(
+                message_filters.Subscriber(
+                    points_subscriber_name,
+                    rospy.AnyMsg,
+                    queue_size=1
+                ),
+                raw_decoder.decode
+            )
+        else:
             points_filter_subscriber = message_filters.Subscriber(
                 points_subscriber_name,
                 elikos_msgs.IntersectionArray,
                 queue_size=1
             )
-            camera_info_filter_subscriber = message_filters.Subscriber(
-                camera_info_subscriber_name,
-                CameraInfo,
-                queue_size=8
-            )
-
-            message_filter_subscriber = message_filters.TimeSynchronizer(
-                [
-                    points_filter_subscriber,
-                    camera_info_filter_subscriber
-                ],
-                5
-            )
-
-            self.camera_listeners.append(
-                message_filters_extras.Combiner(
-                    message_filter_subscriber,
-                    lambda msg_pts, msg_ci : FullMessage(msg_pts, msg_ci)
-                )
-            )
-
-        self.synchonyser = message_filters.ApproximateTimeSynchronizer(
-            self.camera_listeners,
-            1,
-            0.2
+        camera_info_filter_subscriber = message_filters.Subscriber(
+            camera_info_subscriber_name,
+            CameraInfo,
+            queue_size=1
         )
-
-        self.current_callback = None
-
-        self.total_messages_processed = 0
-        self.last_message_time = rospy.Time(0)
+        return points_filter_subscriber, camera_info_filter_subscriber
 
     def register_a_processed_message(self):
         u"""
@@ -152,6 +148,8 @@ class GlobalState:
         """
         self.total_messages_processed += 1
         self.last_message_time = rospy.Time.now()
+        if self.state_machine is not None:
+            self.state_machine.dispatch(EVENT_MESSAGE)
 
 
 ###
@@ -174,28 +172,12 @@ def mean_of_times(times):
         count += 1
     return base_time + (sum_deltas / float(count))
 
-def closest_point(point_array, position):
-    """
-    @param node_array A numpy array of positions size:(x, 3)
-    @param position A numpy vector size:(3,)
-    @return the index of the closest node in the array of input nodes
-    @rtype ndarray(int)
-    """
-    if point_array.shape[0] is 0:
-        return None
-    deltas = point_array - position
-    dist_2 = np.einsum('ij,ij->i', deltas, deltas)
-    return np.argmin(dist_2)
-
 def match_points_2d(src, dst):
-    matched_estimation = np.empty((1, 0, 2))
-    matched_mesurement = np.empty((1, 0, 2))
-    for i in xrange(np.size(dst, axis=0)):
-        position = dst[i,:]
-        closest_point_index = closest_point(src, position)
-        matched_estimation = np.append(matched_estimation, np.array([[src[closest_point_index]]]), axis=1)
-        matched_mesurement = np.append(matched_mesurement, np.array([[position]]), axis=1)
-    return matched_estimation, matched_mesurement
+    # type: (np.ndarray|pt_match.SpatialIndex, np.ndarray)->tuple[np.ndarray, np.ndarray]
+    if not isinstance(src, pt_match.SpatialIndex):
+        src = pt_match.SpatialIndex(src)
+    closest_point_indices = src.query(dst)[1]
+    return src.points[closest_point_indices][np.newaxis], dst[np.newaxis]
 
 def yaw_from_quaterion(q):
     return math.atan2(2.0*(q.x*q.y + q.w*q.z), q.w*q.w + q.x*q.x - q.y*q.y - q.z*q.z)
@@ -216,175 +198,179 @@ def no_estimate(time, global_state):
             time)
 
 def input_localization_points(*args):
-    #type: (tuple[FullMessage, GlobalState])->None
-
-    global g_arena_points
+    #type: (tuple[elikos_msgs.IntersectionArray, GlobalState])->None
 
     #Last argument is the global state
     global_state = args[-1]
 
     global_state.register_a_processed_message()
+    instruments = global_state.instrumentation
+    frame_start = instruments.now()
 
-    time = mean_of_times(msg.header.stamp for msg in args[:-1])
-
-    #array of 3d points
-    camera_infos = []
-    intersections_2d = []
-    points_3d = []
-    list_of_matches = []
-
-    for full_msg in args[:-1]:
-        points_image, points_arena = msgs.deserialize_intersections(full_msg.localization_msg)
+    # The frames that fail to localize count in the total as well
+    try:
+        # The cameras missing from the bundle are None
+        cameras = [(camera_index, points_msg) for camera_index, points_msg in enumerate(args[:-1]) if points_msg is not None]
+        time = mean_of_times(points_msg.header.stamp for _, points_msg in cameras)
 
-        msg_time = full_msg.localization_msg.header.stamp
-        msg_frame = full_msg.localization_msg.header.frame_id
+        if global_state.preprocessing_pool is not None and len(cameras) > 1:
+            results = global_state.preprocessing_pool.map(lambda camera: preprocess_camera(global_state, *camera), cameras, 1)
+        else:
+            results = [preprocess_camera(global_state, camera_index, points_msg) for camera_index, points_msg in cameras]
+        observations = gather_observations(global_state, results)
+        stage_start = instruments.lap("preprocess", frame_start)
 
-        try:
-            transformed_points_arena = transform_points(
-                points_arena,
-                msg_frame,
-                global_state.configuration.frames["arena_center"],
-                msg_time
-            )
+        localize_observations(global_state, observations, time, stage_start, global_state.localizer.estimate)
+    finally:
+        instruments.record("total", instruments.now() - frame_start)
 
-            points_3d.append(transformed_points_arena)
 
-            camera_infos.append(full_msg.camera_info)
-            intersections_2d.append(points_image)
+def input_camera_points(points_msg, camera_index, global_state):
+    #type: (elikos_msgs.IntersectionArray, int, GlobalState)->None
+    u"""
+    Streaming fusion : the frame of a single camera updates the pose at its own stamp, and the pose
+    is published right away.
+    """
+    global_state.register_a_processed_message()
+    instruments = global_state.instrumentation
+    frame_start = instruments.now()
 
-            list_of_matches.append(pt_match.match_points(transformed_points_arena, g_arena_points))
+    try:
+        time = points_msg.header.stamp
+        observations = gather_observations(global_state, [preprocess_camera(global_state, camera_index, points_msg)])
+        stage_start = instruments.lap("preprocess", frame_start)
+        # Without its observation, the frame has nothing to update the pose with
+        if not observations:
+            return
+
+        localize_observations(
+            global_state,
+            observations,
+            time,
+            stage_start,
+            lambda frame, fcu_pose: global_state.localizer.update(frame, time.to_sec(), fcu_pose)
+        )
+    finally:
+        instruments.record("total", instruments.now() - frame_start)
 
-        except LocalizationUnavailableException:
-            rospy.logwarn("Localization unavailable for camera frame '{0}' at time {1}".format(msg_frame, msg_time))
 
+def gather_observations(global_state, results):
+    # type: (GlobalState, list[tuple[localizer.CameraObservation, float, float]])->list[localizer.CameraObservation]
+    u"""
+    Records the timings of preprocess_camera.
+    :return: the observations of the cameras that could be preprocessed
+    """
+    instruments = global_state.instrumentation
+    observations = []
+    for observation, deserialize_duration, transform_duration in results:
+        instruments.record("deserialize", deserialize_duration)
+        instruments.record("camera_transform", transform_duration)
+        if observation is not None:
+            observations.append(observation)
+        else:
+            instruments.increment("unavailable.camera_transform")
+    return observations
+
+
+def localize_observations(global_state, observations, time, stage_start, estimate):
+    # type: (GlobalState, list[localizer.CameraObservation], rospy.Time, float, callable)->None
+    u"""
+    The stages after the preprocessing, shared by the bundled and the streamed cameras : associates
+    the observations, looks up the pose of the FCU, estimates the pose and publishes it.
+    :param time: the time of the observations
+    :param stage_start: the end of the preprocessing
+    :param estimate: estimate(frame, fcu_pose) gives the LocalizationResult of the associated frame
+    """
+    instruments = global_state.instrumentation
 
-    all_3d_points = np.concatenate(points_3d)
-    number_of_points = all_3d_points.shape[0]
+    frame = global_state.localizer.associate(observations)
+    association = frame.association
+    if association.unmatched.size > 0 or association.rejected.size > 0:
+        rospy.logdebug("{0} intersections outside the gate, {1} rejected".format(
+            association.unmatched.size,
+            association.rejected.size
+        ))
 
-    matched_areana_points = pt_match.match_points(all_3d_points, g_arena_points)
+    g_debug_publisher.publish(
+        global_state.configuration.frames["arena_center"],
+        lambda: np.concatenate([frame.detected_points, frame.matched_points]),
+        time
+    )
+    stage_start = instruments.lap("associate", stage_start)
 
     try:
-        (trans_fcu2arena, rot_fcu2arena) = get_tf_transform(
-            global_state.configuration.frames["fcu"],
-            global_state.configuration.frames["arena_center"],
-            time,
-            rospy.Duration(0, 500000000)
-        )
+        (trans_fcu2arena, rot_fcu2arena) = get_fcu_pose(global_state, time)
         global_state.last_fcu_position = (trans_fcu2arena, rot_fcu2arena)
     except LocalizationUnavailableException:
+        instruments.increment("unavailable.fcu_pose")
         rospy.logerr("No FCU estimate at time {0}".format(time))
         no_estimate(time, global_state)
         return
+    stage_start = instruments.lap("fcu_pose", stage_start)
 
     try:
-        drone_pose = estimate_drone_pnp(
-            intersections_2d,
-            list_of_matches,
-            camera_infos,
-            global_state.configuration.frames["fcu"]
-        )
+        result = estimate(frame, (trans_fcu2arena, rot_fcu2arena))
     except LocalizationUnavailableException:
-        try:
-            drone_pose = estimate_drone_position_alone(
-                all_3d_points,
-                matched_areana_points,
-                #time,
-                global_state.last_fcu_position
-            )
-        except LocalizationUnavailableException:
-            try:
-                drone_pose = estimate_drone_simple(
-                    all_3d_points,
-                    matched_areana_points,
-                    global_state.last_fcu_position
-                )
-            except LocalizationUnavailableException:
-                rospy.logwarn("Not a single camera was able to detect an intersection!")
-                no_estimate(time, global_state)
-                return
+        rospy.logwarn("Not a single camera was able to detect an intersection!")
+        no_estimate(time, global_state)
+        return
+    stage_start = instruments.lap("estimate", stage_start)
 
     publish_fcu_transform(
         global_state,
-        drone_pose[0],
-        drone_pose[1],
-        time
+        result.translation,
+        result.rotation,
+        time,
+        result.covariance
     )
+    instruments.lap("submit", stage_start)
 
 
-def estimate_drone_pnp(point_list_2d, point_list_3d, camera_infos, fcu_frame):
-    #type: (list[np.ndarray], list[np.ndarray], list[CameraInfo], str)->tuple[np.ndarray, quaternion.quaternion]
-    bearings_list = []
-    camera_rotation_list = np.empty((len(camera_infos), 3, 3),np.float)
-    camera_translation_list = np.empty((len(camera_infos), 3),np.float)
-
-    for i, (points_2d, camera_info) in enumerate(zip(point_list_2d, camera_infos)):
-        camera_frame = camera_info.header.frame_id
-        try:
-            (trans_fcu2cam, rot_fcu2cam) = get_tf_transform(camera_frame, fcu_frame, camera_info.header.stamp, rospy.Duration.from_sec(0.01))
-            camera_rotation_list[i,:,:] = quaternion.as_rotation_matrix(rot_fcu2cam)
-            camera_translation_list[i,:] = trans_fcu2cam
-        except LocalizationUnavailableException:
-            continue
-
-        image2camera_center = np.array([-camera_info.width/2.0, -camera_info.height/2.0, camera_info.K[0]])
-
-        bearings = np.pad(points_2d, [(0, 0), (0, 1)], mode='constant') + image2camera_center
-        bearings = pt_manip.normalize_vectors(bearings)
-
-        bearings_list.append(bearings)#(quaternion.rotate_vectors(rot_fcu2cam, bearings))
-
-    if len(bearings_list) == 0:
-        raise LocalizationUnavailableException
-
-    #point_list_3d[0][0, 2] = 0.1;
-    fcu_pose_mat = opengv.epnp_multi_camera(bearings_list, point_list_3d, camera_translation_list, camera_rotation_list)
-    if fcu_pose_mat is None:
-        raise LocalizationUnavailableException
-    fcu_pose_mat = fcu_pose_mat[0]
-
-    if fcu_pose_mat[2,3] != fcu_pose_mat[2,3]:
-        raise LocalizationUnavailableException
-
-    rot = quaternion.from_rotation_matrix(fcu_pose_mat[0:3, 0:3])
-    trans = fcu_pose_mat[:, 3]
-
-    return trans, rot
-
-
-def estimate_drone_position_alone(detected_3d_points, matched_3d_points, fcu_pose):
-    # type: (np.ndarray, np.ndarray,tuple[np.ndarray, quaternion.quaternion])->tuple[np.ndarray, quaternion.quaternion]
-
-    if detected_3d_points.size == 0:
-        raise LocalizationUnavailableException
-
-    #Par rapport au FCU
-    detected_3d_points = pt_manip.transform_points_simple(detected_3d_points, -fcu_pose[0], fcu_pose[1].inverse())
-    matched_3d_points = pt_manip.transform_points_simple(matched_3d_points, -fcu_pose[0], fcu_pose[1].inverse())
-
-    tmp_publish("elikos_fcu", np.concatenate([detected_3d_points, matched_3d_points]))
-
-    deltas_fcu_to_real = detected_3d_points - matched_3d_points
-    dist = np.sqrt(np.sum(np.square(detected_3d_points), axis=1))
-
-    m = -0.25
-
-    weights_non_norm = np.maximum(dist * m + 1, 0)
-    weights = np.true_divide(weights_non_norm, np.sum(weights_non_norm, axis=0))
+def preprocess_camera(global_state, camera_index, points_msg):
+    # type: (GlobalState, int, elikos_msgs.IntersectionArray)->tuple[localizer.CameraObservation, float, float]
+    u"""
+    Deserializes the intersections of a camera and puts them in the arena frame. Runs on the
+    preprocessing pool, concurrently for every camera : the timings are returned to be recorded by
+    the callback thread.
+    :return: the observation, None if the CameraInfo or the camera transform is unavailable, and the
+     durations of the deserialization and of the transform
+    """
+    start = instrumentation.monotonic()
+    points_image, points_arena = global_state.intersection_buffers[camera_index].deserialize(points_msg)
+    deserialized = instrumentation.monotonic()
 
-    weighted_deltas = deltas_fcu_to_real * np.repeat(weights, 3, axis=0).reshape(deltas_fcu_to_real.shape)
+    msg_time = points_msg.header.stamp
+    msg_frame = points_msg.header.frame_id
 
-    delta_p = np.sum(weighted_deltas, axis=0)
+    camera_info = global_state.camera_info_store.get(camera_index)
+    if camera_info is None:
+        rospy.logwarn_throttle(5, "No CameraInfo received yet for camera {0}".format(camera_index))
+        return None, deserialized - start, 0.0
 
-    if delta_p[0] != delta_p[0] or\
-                    delta_p[1] != delta_p[1] or\
-                    delta_p[2] != delta_p[2]:
-        raise LocalizationUnavailableException
+    try:
+        transformed_points_arena = transform_points(
+            points_arena,
+            msg_frame,
+            global_state.configuration.frames["arena_center"],
+            msg_time
+        )
+        observation = localizer.CameraObservation(
+            points_image,
+            transformed_points_arena,
+            camera_info,
+            get_camera_extrinsics(camera_info.header.frame_id, global_state.configuration.frames["fcu"])
+        )
+    except LocalizationUnavailableException:
+        rospy.logwarn("Localization unavailable for camera frame '{0}' at time {1}".format(msg_frame, msg_time))
+        observation = None
 
-    return (fcu_pose[0] - delta_p, fcu_pose[1])
+    return observation, deserialized - start, instrumentation.monotonic() - deserialized
 
 
 def estimate_drone_rigid_transform(detected_3d_points, matched_3d_points, time, fcu_pose):
     # type: (np.ndarray, np.ndarray, rospy.Time, tuple[np.ndarray, quaternion.quaternion])->tuple[np.ndarray, quaternion.quaternion]
+    # Unused by the estimators, cv2 is too slow to import at every node start
+    import cv2
 
     trans_fcu2arena = fcu_pose[0]
     rot_fcu2arena = fcu_pose[1]
@@ -404,9 +390,9 @@ def estimate_drone_rigid_transform(detected_3d_points, matched_3d_points, time,
     if transform is None:
         raise LocalizationUnavailableException
 
-    tmp_publish(
-        global_state.configuration.frames["arena_center"],
-        np.concatenate([transform_arena_pts, transform_detected_pts])
+    g_debug_publisher.publish(
+        "elikos_fcu",
+        lambda: np.concatenate([transform_arena_pts, transform_detected_pts])
     )
 
     angle_delta = math.atan2(transform[0, 0], transform[1, 0])
@@ -432,13 +418,6 @@ def estimate_drone_rigid_transform(detected_3d_points, matched_3d_points, time,
     return (trans, delta_rot * rot_fcu2arena)
 
 
-def estimate_drone_simple(points_in_3d, matched_points_in_3d, fcu_pose):
-    if points_in_3d.shape[0] > 0:
-        dt = np.mean(matched_points_in_3d - points_in_3d, axis=0)
-        return (fcu_pose[0] + dt, fcu_pose[1])
-    else:
-        raise LocalizationUnavailableException
-
 def transform_points(input_points_3d, input_points_frame, dest_frame, frame_time):
     (trans_ref2dst, rot_ref2dst) = get_tf_transform(
         input_points_frame,
@@ -447,74 +426,124 @@ def transform_points(input_points_3d, input_points_frame, dest_frame, frame_time
         rospy.Duration(0, 5000000)#5ms
     )
 
-    input_points_3d = quaternion.rotate_vectors(rot_ref2dst, input_points_3d)
-    input_points_3d += trans_ref2dst
-
-    return input_points_3d
-
+    return pt_manip.RigidTransform(trans_ref2dst, rot_ref2dst).apply(input_points_3d)
 
-def publish_fcu_transform(global_state, trans, rot, frame_time):
-    # type: (GlobalState, np.ndarray, quaternion.quaternion, rospy.Time)->None
 
-    global g_tf_broadcaster
+def publish_diagnostics(global_state):
+    # type: (GlobalState)->None
+    u"""
+    Publishes the current state, the stage timings and the estimator counters.
+    """
+    from diagnostic_msgs.msg import DiagnosticArray
+    from diagnostic_msgs.msg import DiagnosticStatus
+    from diagnostic_msgs.msg import KeyValue
+
+    status = DiagnosticStatus()
+    status.level = DiagnosticStatus.OK
+    status.name = rospy.get_name() + ": pipeline"
+    status.message = "{0} frames processed".format(global_state.total_messages_processed)
+    values = global_state.instrumentation.summary()
+    if global_state.synchonyser is not None:
+        values += global_state.synchonyser.summary()
+    if global_state.state_machine is not None:
+        values = global_state.state_machine.summary() + values
+    status.values = [KeyValue(key, value) for key, value in values]
+
+    diagnostics = DiagnosticArray()
+    diagnostics.header.stamp = rospy.Time.now()
+    diagnostics.status = [status]
+    global_state.diagnostics_publisher.publish(diagnostics)
+
+
+def publish_fcu_transform(global_state, trans, rot, frame_time, covariance=None):
+    # type: (GlobalState, np.ndarray, quaternion.quaternion, rospy.Time, np.ndarray)->None
+    u"""
+    Hands the pose to the output thread, never blocks.
+    """
+    g_pose_output.submit(trans, rot, frame_time, covariance)
 
-    g_tf_broadcaster.sendTransform(
-        trans,
-        pt_manip.create_tf_from_quaterion(rot),
-        frame_time,
-        global_state.configuration.frames["output"],
-        global_state.configuration.frames["arena_center"]
-    )
 
+def get_tf_transform(source_frame, dest_frame, time, timeout):
+    # type: (str, str, rospy.Time, rospy.Duration)->(np.ndarray, quaternion.quaternion)
+    global g_tf_cache
+    try:
+        return g_tf_cache.lookup(source_frame, dest_frame, time, timeout)
+    except transform_cache.TransformUnavailableException as e:
+        raise LocalizationUnavailableException(message="Tf lookup failed", cause=e)
 
-def tmp_publish(frame, camera_points):
-    global g_arena_points
-    output_message = PoseArray()
 
-    for i in xrange(np.size(camera_points, axis=0)):
-        p = Pose()
-        p.position.x = camera_points[i, 0]
-        p.position.y = camera_points[i, 1]
-        p.position.z = camera_points[i, 2]
+def get_fcu_pose(global_state, time):
+    # type: (GlobalState, rospy.Time)->(np.ndarray, quaternion.quaternion)
+    u"""
+    Pose of the FCU in the arena at time. From the pose stream if there is one, in which case
+    this never blocks, from tf otherwise.
+    """
+    if global_state.fcu_pose_buffer is None:
+        return get_tf_transform(
+            global_state.configuration.frames["fcu"],
+            global_state.configuration.frames["arena_center"],
+            time,
+            rospy.Duration(0, 500000000)
+        )
+    try:
+        return global_state.fcu_pose_buffer.lookup(time)
+    except transform_cache.TransformUnavailableException as e:
+        raise LocalizationUnavailableException(message="FCU pose unavailable", cause=e)
 
-        output_message.poses.append(p)
-    for i in xrange(np.size(g_arena_points, axis=0)):
-        p = Pose()
-        p.position.x = g_arena_points[i, 0]
-        p.position.y = g_arena_points[i, 1]
-        p.position.z = g_arena_points[i, 2]
 
-        output_message.poses.append(p)
+def get_latest_fcu_pose(global_state):
+    # type: (GlobalState)->(np.ndarray, quaternion.quaternion)
+    u"""
+    Latest pose of the FCU in tf, without waiting for it.
+    """
+    fcu_frame = global_state.configuration.frames["fcu"]
+    arena_frame = global_state.configuration.frames["arena_center"]
+    try:
+        latest_time = g_tf_cache.listener.getLatestCommonTime(arena_frame, fcu_frame)
+    except tf.Exception as e:
+        raise LocalizationUnavailableException(message="No FCU transform yet", cause=e)
+    return get_tf_transform(fcu_frame, arena_frame, latest_time, None)
 
-    output_message.header = Header()
-    output_message.header.stamp = rospy.Time.now()
-    output_message.header.frame_id = frame
 
-    g_pub_dbg.publish(output_message)
+def get_static_tf_transform(source_frame, dest_frame):
+    # type: (str, str)->transform_cache.StaticTransform
+    u"""
+    Same as get_tf_transform, for transforms that never change. They are only looked up once.
+    """
+    global g_tf_cache
+    try:
+        return g_tf_cache.lookup_static(source_frame, dest_frame)
+    except transform_cache.TransformUnavailableException as e:
+        raise LocalizationUnavailableException(message="Static tf lookup failed", cause=e)
 
 
-def get_tf_transform(source_frame, dest_frame, time, timeout):
-    # type: (str, str, rospy.Time, rospy.Duration)->(np.ndarray, quaternion.quaternion)
-    global g_tf_listener
+def get_camera_extrinsics(camera_frame, fcu_frame):
+    # type: (str, str)->transform_cache.StaticTransform
+    u"""
+    Pose of a camera in the fcu frame, None if it is unknown.
+    """
     try:
-        g_tf_listener.waitForTransform(dest_frame, source_frame, time, timeout)
-    except tf.Exception as e:
-        raise LocalizationUnavailableException(message="Tf lookup failed", cause=e)
-
-    (trans, rot) = g_tf_listener.lookupTransform(dest_frame, source_frame, time)
-    return np.array(trans), pt_manip.create_quaterion_from_tf(rot)
+        return get_static_tf_transform(camera_frame, fcu_frame)
+    except LocalizationUnavailableException:
+        return None
 
 
 def publish_fcu_if_no_pos():
     pass
 
 
+def create_odometry_publisher(topic):
+    # type: (str)->rospy.Publisher
+    from nav_msgs.msg import Odometry
+    return rospy.Publisher(topic, Odometry, queue_size=1)
+
+
 def init_node():
     # type: ()->GlobalState
     """
     Initialises the node.
     """
-    global g_tf_listener, g_pub_dbg, g_tf_broadcaster
+    global g_tf_listener, g_tf_cache, g_debug_publisher, g_tf_broadcaster, g_pose_output
     rospy.init_node("feature_tracking")
 
     global_state = GlobalState()
@@ -522,9 +551,47 @@ def init_node():
     rospy.loginfo("Publishing on %s", global_state.configuration.frames["output"])
 
     g_tf_listener = tf.TransformListener()
+    g_tf_cache = transform_cache.TransformCache(g_tf_listener)
+
+    if global_state.configuration.fcu_pose_topic:
+        global_state.fcu_pose_buffer = transform_cache.PoseStreamBuffer(
+            global_state.configuration.fcu_pose_topic,
+            global_state.configuration.frames["arena_center"],
+            g_tf_cache,
+            global_state.configuration.fcu_pose_max_extrapolation,
+            global_state.configuration.fcu_pose_max_staleness
+        )
     g_tf_broadcaster = tf.TransformBroadcaster()
+    g_pose_output = pose_output.PoseOutput(
+        g_tf_broadcaster,
+        global_state.configuration.frames["arena_center"],
+        global_state.configuration.frames["output"],
+        rospy.Publisher(
+            global_state.configuration.pose_with_covariance_topic,
+            PoseWithCovarianceStamped,
+            queue_size=1
+        ) if global_state.configuration.pose_with_covariance_topic else None,
+        create_odometry_publisher(global_state.configuration.odometry_topic) if global_state.configuration.odometry_topic else None,
+        global_state.instrumentation
+    )
+
+    if global_state.configuration.diagnostics_period > 0:
+        from diagnostic_msgs.msg import DiagnosticArray
+        global_state.diagnostics_publisher = rospy.Publisher("/diagnostics", DiagnosticArray, queue_size=1)
+        global_state.diagnostics_timer = rospy.Timer(
+            rospy.Duration(global_state.configuration.diagnostics_period),
+            lambda event: publish_diagnostics(global_state)
+        )
 
-    g_pub_dbg = rospy.Publisher("/localization/features_debug", PoseArray, queue_size=10)
+    g_debug_publisher = debug_output.DebugPublisher(
+        rospy.Publisher(
+            "/localization/features_debug",
+            PoseArray,
+            queue_size=10
+        ) if global_state.configuration.debug_output else None,
+        static_points=global_state.localizer.arena_map.points,
+        enabled=global_state.configuration.debug_output
+    )
 
     #Read params from the parameter server
     return global_state
@@ -534,11 +601,24 @@ def start_listening_for_localization(global_state):
     if start_listening_for_localization.inited is False:
         print "Listen started"
         start_listening_for_localization.inited = True
+        connect_localization(global_state)
+start_listening_for_localization.inited = False
+
+
+def connect_localization(global_state):
+    # type: (GlobalState)->None
+    u"""
+    Feeds the bundles of the synchronizer to input_localization_points, or every camera frame to
+    input_camera_points when ~fusion_mode is "streaming".
+    """
+    if global_state.synchonyser is None:
+        for camera_index, camera_listener in enumerate(global_state.camera_listeners):
+            camera_listener.registerCallback(input_camera_points, camera_index, global_state)
+    else:
         global_state.synchonyser.registerCallback(
             input_localization_points,
             global_state
         )
-start_listening_for_localization.inited = False
 
 
 ###
@@ -546,103 +626,134 @@ start_listening_for_localization.inited = False
 # State machine
 #
 ###
-def state_init(global_state, time_since_state_begin):
-    # type: (GlobalState, rospy.Duration)->function
+# Events of the states, besides state_machine.ENTER and state_machine.EXIT
+EVENT_MESSAGE = "message"
+EVENT_TF = "tf"
+EVENT_PUBLISH_INITIAL = "publish_initial"
+EVENT_STABILIZED = "stabilized"
+EVENT_NO_MESSAGES = "no_messages"
+EVENT_WATCHDOG = "watchdog"
 
+# The initial pose is sent at this period until the localization starts
+INITIAL_POSE_PERIOD = 0.05
+
+
+def publish_initial_pose(global_state):
+    # type: (GlobalState)->None
     publish_fcu_transform(
         global_state,
         global_state.configuration.initial_drone_position,
         global_state.configuration.initial_drone_rotation,
         rospy.Time.now()
     )
-    try:
-        global_state.last_fcu_position = get_tf_transform(
-            global_state.configuration.frames["fcu"],
-            global_state.configuration.frames["arena_center"],
-            rospy.Time.now(),
-            rospy.Duration(1)
-        )
-    except LocalizationUnavailableException:
-        rospy.loginfo("no fcu at time {0}".format(rospy.Time.now()));
-        global_state.last_fcu_position = None
 
-    if global_state.last_fcu_position is not None:
-        return state_stablization
-    else:
+
+def start_publishing_initial_pose(global_state):
+    # type: (GlobalState)->None
+    u"""
+    Publishes the initial pose now, then from a single periodic timer until the state is left.
+    """
+    publish_initial_pose(global_state)
+    global_state.state_machine.set_timer(EVENT_PUBLISH_INITIAL, INITIAL_POSE_PERIOD, oneshot=False)
+
+
+def state_init(global_state, event):
+    # type: (GlobalState, str)->function
+    u"""
+    Waits for the first transform of the FCU, checked whenever tf receives something.
+    """
+    if event == state_machine.EXIT:
+        global_state.tf_subscriber.unregister()
+        global_state.tf_subscriber = None
         return state_init
 
+    if event == state_machine.ENTER:
+        global_state.tf_subscriber = rospy.Subscriber(
+            "/tf",
+            TFMessage,
+            lambda message: global_state.state_machine.dispatch(EVENT_TF),
+            queue_size=1
+        )
+        start_publishing_initial_pose(global_state)
+    elif event == EVENT_PUBLISH_INITIAL:
+        publish_initial_pose(global_state)
+    if event in (state_machine.ENTER, EVENT_TF):
+        try:
+            global_state.last_fcu_position = get_latest_fcu_pose(global_state)
+            return state_stablization
+        except LocalizationUnavailableException:
+            pass
 
-def state_stablization(global_state, time_since_state_begin):
-    # type: (GlobalState, rospy.Duration)->function
+    return state_init
 
-    publish_fcu_transform(
-        global_state,
-        global_state.configuration.initial_drone_position,
-        global_state.configuration.initial_drone_rotation,
-        rospy.Time.now()
-    )
-    if time_since_state_begin.to_sec() > global_state.configuration.stabilization_time:
+
+def state_stablization(global_state, event):
+    # type: (GlobalState, str)->function
+    if event == state_machine.ENTER:
+        global_state.state_machine.set_timer(EVENT_STABILIZED, global_state.configuration.stabilization_time)
+        start_publishing_initial_pose(global_state)
+    elif event == EVENT_PUBLISH_INITIAL:
+        publish_initial_pose(global_state)
+    if event == EVENT_STABILIZED:
         return state_climb
-    else:
-        return state_stablization
+    return state_stablization
 
 
-def state_climb(global_state, time_since_state_begin):
-    # type: (GlobalState, rospy.Duration)->function
+def state_climb(global_state, event):
+    # type: (GlobalState, str)->function
     #TODO this state
-    start_listening_for_localization(global_state)
-    return state_wait_for_message
+    if event == state_machine.ENTER:
+        start_listening_for_localization(global_state)
+        return state_wait_for_message
+    return state_climb
 
 
-def state_wait_for_message(global_state, time_since_state_begin):
-    if global_state.total_messages_processed > 0:
+def state_wait_for_message(global_state, event):
+    # type: (GlobalState, str)->function
+    if event == state_machine.ENTER:
+        if global_state.total_messages_processed > 0:
+            return state_normal
+        global_state.state_machine.set_timer(EVENT_NO_MESSAGES, 2.0)
+    elif event == EVENT_MESSAGE:
         return state_normal
-    elif time_since_state_begin.to_sec() > 2:
+    elif event == EVENT_NO_MESSAGES:
         return state_warn_no_messages
-    else:
-        return state_wait_for_message
+    return state_wait_for_message
 
 
-def state_warn_no_messages(global_state, time_since_state_begin):
-    rospy.logwarn("No messagess were yet processed. Check camera pipeline. Rechecking in 2 seconds")
+def state_warn_no_messages(global_state, event):
+    # type: (GlobalState, str)->function
+    # Also run on EXIT, when it leaves right away
+    if event == state_machine.ENTER:
+        rospy.logwarn("No messagess were yet processed. Check camera pipeline. Rechecking in 2 seconds")
     return state_wait_for_message
 
 
-def state_normal(global_state, time_since_state_begin):
-    # type: (GlobalState, rospy.Duration)->function
+def state_normal(global_state, event):
+    # type: (GlobalState, str)->function
     #TODO this state
 
-    # watchdog
-    duration_since_last_message = (rospy.Time.now() - global_state.last_message_time).to_sec()
-    if duration_since_last_message > global_state.configuration.watchdog_max_message_delay:
-        rospy.logerr("No messages processed in the last {0} seconds".format(duration_since_last_message))
-
+    if event in (state_machine.ENTER, EVENT_WATCHDOG):
+        global_state.state_machine.set_timer(EVENT_WATCHDOG, global_state.configuration.watchdog_max_message_delay)
+    if event == EVENT_WATCHDOG:
+        duration_since_last_message = (rospy.Time.now() - global_state.last_message_time).to_sec()
+        if duration_since_last_message > global_state.configuration.watchdog_max_message_delay:
+            rospy.logerr("No messages processed in the last {0} seconds".format(duration_since_last_message))
 
     return state_normal
 
 
-
 def run_state_machine(global_state):
     # type: (GlobalState)->None
-    current_state = state_init
-
-    last_state_change_time = rospy.Time.now()
-
-    r = rospy.Rate(20)
-
-    while not rospy.is_shutdown():
-        next_state = current_state(
-            global_state,
-            rospy.Time.now() - last_state_change_time
-        )
-        if next_state is not current_state:
-            last_state_change_time = rospy.Time.now()
-            current_state = next_state
-            rospy.logdebug("State is now %s", next_state)
-        try:
-            r.sleep()
-        except rospy.ROSInterruptException:
-            pass # Ros should be shutdown
+    u"""
+    Starts the state machine. It runs from the callbacks of the messages, tf and its timers.
+    """
+    global_state.state_machine = state_machine.StateMachine(
+        global_state,
+        message_filters_extras.rospy_timer,
+        global_state.instrumentation
+    )
+    global_state.state_machine.start(state_init)
 
 
 ###node_configuration
@@ -651,19 +762,24 @@ def run_state_machine(global_state):
 #
 ###
 g_tf_listener = None
+g_tf_cache = None
 g_tf_broadcaster = None
-
-g_arena_points = pt_match.create_grid_mesh(side_points_number=21, side_mesure=20) - np.array([10, 10, 0])
+g_pose_output = None
+g_debug_publisher = None
 
 
 
 if __name__ == '__main__':
+    init_start = instrumentation.monotonic()
     global_state = init_node()
-
-    g_arena_points = pt_match.create_grid_mesh(
-        side_mesure=rospy.get_param("~arena_size", 20),
-        side_points_number=rospy.get_param("~arena_intersection_num", 21)
-    )
+    init_end = instrumentation.monotonic()
+    global_state.instrumentation.record("startup.imports", init_start - g_import_start)
+    global_state.instrumentation.record("startup.init_node", init_end - init_start)
+    rospy.loginfo("Started in {0:.3f} s : imports {1:.3f} s, init_node {2:.3f} s".format(
+        init_end - g_import_start,
+        init_start - g_import_start,
+        init_end - init_start
+    ))
 
     initial_drone_position = np.array(
         rospy.get_param("~initial_drone_pos", [0, 0, 0])
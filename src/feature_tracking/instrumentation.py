@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Always-on timing of the localization pipeline : a fixed-size latency histogram per stage and event
+counters. Recording is a few list operations under a lock, so it can stay on the hot path of every
+thread.
+"""
+import bisect
+import ctypes
+import ctypes.util
+import os
+import threading
+import time
+
+
+def _clock_gettime_monotonic():
+    u"""
+    time.monotonic does not exist before python 3.3, CLOCK_MONOTONIC is read through ctypes instead.
+    """
+    class Timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+    librt = ctypes.CDLL(ctypes.util.find_library("rt") or "libc.so.6", use_errno=True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+    timespec = Timespec()
+    timespec_pointer = ctypes.pointer(timespec)
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, timespec_pointer) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return timespec.tv_sec + timespec.tv_nsec * 1e-9
+    return monotonic
+
+
+if hasattr(time, "monotonic"):
+    monotonic = time.monotonic
+else:
+    try:
+        monotonic = _clock_gettime_monotonic()
+    except (OSError, AttributeError):
+        # Not monotonic, only if the C library has no clock_gettime
+        monotonic = time.time
+
+# Bin upper bounds of the histograms, in seconds : 10 bins per decade from 10 us to 10 s
+DEFAULT_BOUNDS = tuple(10 ** (exponent / 10.0) for exponent in xrange(-50, 11))
+
+
+class LatencyHistogram(object):
+    u"""
+    Counts of durations in fixed bins, with the number, sum and maximum of the durations.
+    Percentiles are the upper bound of the bin where they fall, at most the maximum.
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, duration):
+        # type: (float)->None
+        self.counts[bisect.bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.maximum:
+            self.maximum = duration
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def percentile(self, fraction):
+        # type: (float)->float
+        u"""
+        :param fraction: between 0 and 1
+        """
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        cumulated = 0
+        for bin_index, bin_count in enumerate(self.counts):
+            cumulated += bin_count
+            if cumulated >= rank and bin_count > 0:
+                return min(self.bounds[bin_index], self.maximum) if bin_index < len(self.bounds) else self.maximum
+        return self.maximum
+
+
+class Instrumentation(object):
+    u"""
+    Histograms of the stages and counters of events, created on their first use. Safe to record from
+    any thread : the streamed cameras, the output thread and the timers all record in the same one.
+    Typical usage, where every lap records the time since the previous one :
+        start = instrumentation.now()
+        ...
+        start = instrumentation.lap("deserialize", start)
+        ...
+        instrumentation.lap("estimate", start)
+        instrumentation.increment("estimator.upnp")
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def now():
+        return monotonic()
+
+    def record(self, stage, duration):
+        # type: (str, float)->None
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = LatencyHistogram(self.bounds)
+                self.histograms[stage] = histogram
+            histogram.record(duration)
+
+    def lap(self, stage, start):
+        # type: (str, float)->float
+        u"""
+        Records the time since start in the histogram of stage.
+        :return: the current time, the start of the next stage
+        """
+        end = monotonic()
+        self.record(stage, end - start)
+        return end
+
+    def increment(self, counter):
+        # type: (str)->None
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+
+    def summary(self):
+        # type: ()->list[tuple[str, str]]
+        u"""
+        Key-value pairs of every histogram and counter, sorted by name, with durations in ms.
+        """
+        values = []
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                values.append((stage, "n={0} mean={1:.3f} p50={2:.3f} p95={3:.3f} max={4:.3f} ms".format(
+                    histogram.count,
+                    histogram.mean() * 1e3,
+                    histogram.percentile(0.5) * 1e3,
+                    histogram.percentile(0.95) * 1e3,
+                    histogram.maximum * 1e3
+                )))
+            for counter, count in sorted(self.counters.items()):
+                values.append((counter, str(count)))
+        return values
@@ -0,0 +1,616 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Estimation core of the localization, without ROS : the association of the detected intersections
+with the arena map and the pose estimators, with the map, the caches and the configuration kept in a
+Localizer. fallback.py only resolves the transforms and moves the messages around it ; replay tools
+and worker processes can drive it directly.
+"""
+import threading
+
+import numpy as np
+import quaternion
+
+import point_matching as pt_match
+import camera_model
+import pose_estimators
+import instrumentation
+
+
+class LocalizationUnavailableException(Exception):
+    u"""
+    Excepition thrown when the drone cannot localize itself.
+    """
+    def __init__(self, message = "localization was unavailable", cause=None):
+        super(LocalizationUnavailableException, self).__init__(message + u', caused by ' + (repr(cause) if cause is not None else ''))
+        self.cause = cause
+
+
+class Configuration:
+    def __init__(self, get_param):
+        u"""
+        :param get_param: reads a parameter, called with its private name and its default value.
+         rospy.get_param on the node, a dictionary lookup when replaying without a ROS master.
+        """
+        self.publish_fcu_on_failure = get_param(
+            "~publish_fcu_on_failure",
+            False
+        )
+        self.topic_localization_points_prefix = get_param(
+            "~topic_localization_points_prefix",
+            "localization/features_"
+        )
+        self.topic_camera_info_prefix = get_param(
+            "~topic_camera_info_prefix",
+            "localization/camera_info_"
+        )
+
+        self.initial_drone_position = np.array(
+            get_param("~initial_drone_pos", [0, 0, 0])
+        )
+        self.initial_drone_rotation = quaternion.as_quat_array(
+            np.array(
+                get_param("~initial_drone_rot", [1, 0, 0, 0])
+            )
+        )
+        self.stabilization_time = get_param(
+            "~stabilization_time",
+            3.0
+        )
+        self.camera_number = get_param(
+            "~camera_number",
+            1
+        )
+        self.watchdog_max_message_delay = get_param(
+            "~watchdog_max_message_delay",
+            1.0
+        )
+        self.arena_map_file = get_param(
+            "~arena_map_file",
+            ""
+        )
+        self.arena_map_cache = get_param(
+            "~arena_map_cache",
+            False
+        )
+        self.arena_size = get_param(
+            "~arena_size",
+            20
+        )
+        self.arena_intersection_num = get_param(
+            "~arena_intersection_num",
+            21
+        )
+        self.association_gate = get_param(
+            "~association_gate",
+            0.4
+        )
+        self.sync_quorum = get_param(
+            "~sync_quorum",
+            0
+        )
+        self.sync_slop = get_param(
+            "~sync_slop",
+            0.2
+        )
+        self.sync_deadline = get_param(
+            "~sync_deadline",
+            0.05
+        )
+        self.preprocessing_threads = get_param(
+            "~preprocessing_threads",
+            1
+        )
+        self.fusion_mode = get_param(
+            "~fusion_mode",
+            "bundle"
+        )
+        self.streaming_bearing_noise = get_param(
+            "~streaming_bearing_noise",
+            0.005
+        )
+        self.streaming_translation_noise = get_param(
+            "~streaming_translation_noise",
+            0.05
+        )
+        self.streaming_rotation_noise = get_param(
+            "~streaming_rotation_noise",
+            0.01
+        )
+        self.streaming_max_gap = get_param(
+            "~streaming_max_gap",
+            1.0
+        )
+        self.raw_intersection_decoding = get_param(
+            "~raw_intersection_decoding",
+            False
+        )
+        self.fcu_pose_topic = get_param(
+            "~fcu_pose_topic",
+            ""
+        )
+        self.fcu_pose_max_extrapolation = get_param(
+            "~fcu_pose_max_extrapolation",
+            0.05
+        )
+        self.fcu_pose_max_staleness = get_param(
+            "~fcu_pose_max_staleness",
+            0.25
+        )
+        self.bearing_lookup_tables = get_param(
+            "~bearing_lookup_tables",
+            False
+        )
+        self.debug_output = get_param(
+            "~debug_output",
+            True
+        )
+        self.pose_with_covariance_topic = get_param(
+            "~pose_with_covariance_topic",
+            ""
+        )
+        self.odometry_topic = get_param(
+            "~odometry_topic",
+            ""
+        )
+        self.diagnostics_period = get_param(
+            "~diagnostics_period",
+            1.0
+        )
+        self.pose_estimator = get_param(
+            "~pose_estimator",
+            "upnp"
+        )
+        self.ransac_threshold = get_param(
+            "~ransac_threshold",
+            0.02
+        )
+        self.ransac_confidence = get_param(
+            "~ransac_confidence",
+            0.99
+        )
+        self.ransac_max_hypotheses = get_param(
+            "~ransac_max_hypotheses",
+            500
+        )
+        self.ransac_max_refinement = get_param(
+            "~ransac_max_refinement",
+            0.25
+        )
+        self.position_robust_loss = get_param(
+            "~position_robust_loss",
+            "huber"
+        )
+        self.position_robust_scale = get_param(
+            "~position_robust_scale",
+            0.1
+        )
+        self.position_min_distance = get_param(
+            "~position_min_distance",
+            0.1
+        )
+        self.incremental_max_iterations = get_param(
+            "~incremental_max_iterations",
+            5
+        )
+        self.incremental_max_angular_error = get_param(
+            "~incremental_max_angular_error",
+            0.02
+        )
+        self.incremental_huber_threshold = get_param(
+            "~incremental_huber_threshold",
+            0.01
+        )
+
+        self.frames = {}
+        self.frames["arena_center"] = get_param("~arena_center_frame_id", "elikos_arena_origin")
+        self.frames["fcu"] = get_param("~fcu_frame_id", "elikos_fcu")
+        self.frames["output"] = get_param("~output_position_fcu_frame_id", "elikos_vision")
+
+
+def load_arena_map(configuration):
+    # type: (Configuration)->pt_match.GridLattice|pt_match.SpatialIndex
+    u"""
+    The landmarks of ~arena_map_file for irregular maps, the regular grid of the arena otherwise.
+    """
+    if configuration.arena_map_file:
+        return pt_match.SpatialIndex(pt_match.load_landmarks(configuration.arena_map_file, configuration.arena_map_cache))
+    return pt_match.GridLattice(
+        side_mesure=configuration.arena_size,
+        side_points_number=configuration.arena_intersection_num
+    )
+
+
+class CameraObservation(object):
+    u"""
+    The intersections detected by a camera in a frame.
+    """
+    def __init__(self, points_2d, points_3d, camera_info, extrinsics=None):
+        # type: (np.ndarray, np.ndarray, CameraInfo, transform_cache.StaticTransform)->None
+        u"""
+        :param points_2d: the pixels of the intersections size:(n, 2)
+        :param points_3d: the intersections projected on the ground, in the arena frame size:(n, 3)
+        :param camera_info: anything with the fields of a sensor_msgs/CameraInfo
+        :param extrinsics: the pose of the camera in the fcu frame, with a translation and a
+         rotation_matrix. The camera is left out of the PnP estimators if None.
+        """
+        self.points_2d = points_2d
+        self.points_3d = points_3d
+        self.camera_info = camera_info
+        self.extrinsics = extrinsics
+
+
+class AssociatedFrame(object):
+    u"""
+    The observations of a frame, reduced to the intersections associated with the arena map.
+    """
+    def __init__(self, observations, all_3d_points, association):
+        # type: (list[CameraObservation], np.ndarray, pt_match.Association)->None
+        u"""
+        :param all_3d_points: the points_3d of every observation, concatenated
+        """
+        self.observations = observations
+        self.association = association
+
+        points_per_camera = [observation.points_3d.shape[0] for observation in observations]
+        camera_splits = np.cumsum(points_per_camera)[:-1]
+        accepted_per_camera = np.split(association.accepted, camera_splits)
+        # Per camera
+        self.points_2d = [
+            observation.points_2d[accepted] for observation, accepted in zip(observations, accepted_per_camera)
+        ]
+        self.matched_per_camera = [
+            matches[accepted] for matches, accepted in zip(np.split(association.matched_points, camera_splits), accepted_per_camera)
+        ]
+        # Merged, size:(x, 3)
+        self.detected_points = all_3d_points[association.accepted]
+        self.matched_points = association.matched_points[association.accepted]
+
+
+class LocalizationResult(object):
+    def __init__(self, translation, rotation, covariance, estimator):
+        # type: (np.ndarray, quaternion.quaternion, np.ndarray, str)->None
+        self.translation = translation
+        self.rotation = rotation
+        # 6x6, None if the estimator does not give one
+        self.covariance = covariance
+        # The estimator that gave the pose, after the fallbacks
+        self.estimator = estimator
+
+
+class Localizer(object):
+    u"""
+    Estimates the pose of the drone from the intersections seen by the cameras and the pose of the
+    FCU. Holds everything that lives from a frame to the next : the arena map, the camera
+    intrinsics, the warm started estimator, the association cache and the streaming filter.
+    """
+    def __init__(self, configuration, arena_map=None, instruments=None):
+        # type: (Configuration, pt_match.GridLattice|pt_match.SpatialIndex, instrumentation.Instrumentation)->None
+        u"""
+        :param arena_map: loaded from the configuration if None
+        :param instruments: records the "associate" and "estimate" stages and the estimator counters
+        """
+        self.configuration = configuration
+        self.arena_map = arena_map if arena_map is not None else load_arena_map(configuration)
+        self.instrumentation = instruments if instruments is not None else instrumentation.Instrumentation()
+        self.intrinsics_cache = camera_model.IntrinsicsCache(configuration.bearing_lookup_tables)
+
+        # Warm started from the previous frame when ~pose_estimator is "incremental"
+        self.incremental_estimator = pose_estimators.IncrementalPoseEstimator(
+            configuration.incremental_max_iterations,
+            configuration.incremental_max_angular_error,
+            configuration.incremental_huber_threshold
+        )
+        self.association_cache = pt_match.AssociationCache()
+
+        # Updated by every camera frame when ~fusion_mode is "streaming"
+        self.sequential_filter = pose_estimators.SequentialPoseFilter(
+            configuration.streaming_bearing_noise,
+            configuration.streaming_translation_noise,
+            configuration.streaming_rotation_noise,
+            configuration.streaming_max_gap,
+            configuration.incremental_max_iterations,
+            configuration.incremental_max_angular_error,
+            configuration.incremental_huber_threshold
+        )
+        # The cameras are streamed from their own callback threads
+        self.sequential_lock = threading.Lock()
+
+    def reset(self):
+        u"""
+        Forgets the previous frames.
+        """
+        self.incremental_estimator.reset()
+        self.association_cache.clear()
+        with self.sequential_lock:
+            self.sequential_filter.reset()
+
+    def associate(self, observations):
+        # type: (list[CameraObservation])->AssociatedFrame
+        points_per_camera = [observation.points_3d.shape[0] for observation in observations]
+        all_3d_points = np.concatenate([observation.points_3d for observation in observations]) if observations else np.empty((0, 3))
+        camera_ids = np.repeat(np.arange(len(observations)), points_per_camera)
+
+        # Streamed frames alternate between the cameras, the cache would miss every time
+        if self.configuration.pose_estimator == "incremental" and self.configuration.fusion_mode != "streaming":
+            association = self.association_cache.associate(
+                all_3d_points,
+                self.arena_map,
+                self.configuration.association_gate,
+                camera_ids
+            )
+        else:
+            association = pt_match.associate_points(
+                all_3d_points,
+                self.arena_map,
+                self.configuration.association_gate,
+                camera_ids
+            )
+        return AssociatedFrame(observations, all_3d_points, association)
+
+    def estimate(self, frame, fcu_pose):
+        # type: (AssociatedFrame, tuple[np.ndarray, quaternion.quaternion])->LocalizationResult
+        u"""
+        Estimates the pose with ~pose_estimator, falling back on the position alone, then on the
+        mean delta of the intersections.
+        :param fcu_pose: the translation and rotation of the FCU in the arena at the time of the frame
+        :raise LocalizationUnavailableException: if not a single intersection could be used
+        """
+        instruments = self.instrumentation
+        estimator = self.configuration.pose_estimator
+        try:
+            if estimator == "ransac":
+                drone_pose = estimate_drone_ransac(
+                    self.pnp_correspondences(frame),
+                    fcu_pose,
+                    self.configuration
+                )
+            elif estimator == "incremental":
+                drone_pose = estimate_drone_incremental(
+                    self.pnp_correspondences(frame),
+                    self.incremental_estimator
+                )
+            else:
+                drone_pose = estimate_drone_pnp(self.pnp_correspondences(frame))
+        except LocalizationUnavailableException:
+            instruments.increment("unavailable." + estimator)
+            estimator = "position_alone"
+            try:
+                drone_pose = estimate_drone_position_alone(
+                    frame.detected_points,
+                    frame.matched_points,
+                    fcu_pose,
+                    self.configuration
+                )
+            except LocalizationUnavailableException:
+                instruments.increment("unavailable.position_alone")
+                estimator = "simple"
+                try:
+                    drone_pose = estimate_drone_simple(
+                        frame.detected_points,
+                        frame.matched_points,
+                        fcu_pose
+                    )
+                except LocalizationUnavailableException:
+                    instruments.increment("unavailable.simple")
+                    raise
+        instruments.increment("estimator." + estimator)
+
+        return LocalizationResult(
+            drone_pose[0],
+            drone_pose[1],
+            drone_pose[2] if len(drone_pose) > 2 else None,
+            estimator
+        )
+
+    def update(self, frame, stamp, fcu_pose):
+        # type: (AssociatedFrame, float, tuple[np.ndarray, quaternion.quaternion])->LocalizationResult
+        u"""
+        Streaming fusion : moves the running pose to stamp by the motion of the FCU, then corrects it
+        with frame, usually the observation of a single camera. On cold start, or when the update
+        fails, the running pose is seeded again from estimate.
+        :param stamp: the time of the frame, in seconds
+        :param fcu_pose: the translation and rotation of the FCU in the arena at stamp
+        :raise LocalizationUnavailableException: if the filter is not seeded and estimate fails
+        """
+        fcu_rotation_matrix = quaternion.as_rotation_matrix(fcu_pose[1])
+        with self.sequential_lock:
+            sequential_filter = self.sequential_filter
+            if sequential_filter.predict(stamp, fcu_pose[0], fcu_rotation_matrix):
+                try:
+                    updated = sequential_filter.update(*self.pnp_correspondences(frame))
+                except LocalizationUnavailableException:
+                    updated = False
+                if updated:
+                    self.instrumentation.increment("estimator.sequential")
+                    return LocalizationResult(
+                        sequential_filter.translation,
+                        quaternion.from_rotation_matrix(sequential_filter.rotation_matrix),
+                        sequential_filter.arena_covariance(),
+                        "sequential"
+                    )
+                self.instrumentation.increment("unavailable.sequential")
+                sequential_filter.reset()
+
+            result = self.estimate(frame, fcu_pose)
+            sequential_filter.seed(
+                stamp,
+                fcu_pose[0],
+                fcu_rotation_matrix,
+                result.translation,
+                quaternion.as_rotation_matrix(result.rotation),
+                result.covariance
+            )
+            return result
+
+    def localize(self, observations, fcu_pose):
+        # type: (list[CameraObservation], tuple[np.ndarray, quaternion.quaternion])->LocalizationResult
+        u"""
+        associate then estimate, timed as the "associate" and "estimate" stages.
+        """
+        stage_start = self.instrumentation.now()
+        frame = self.associate(observations)
+        stage_start = self.instrumentation.lap("associate", stage_start)
+        try:
+            return self.estimate(frame, fcu_pose)
+        finally:
+            self.instrumentation.lap("estimate", stage_start)
+
+    def pnp_correspondences(self, frame):
+        # type: (AssociatedFrame)->tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        return prepare_pnp_correspondences(
+            frame.points_2d,
+            frame.matched_per_camera,
+            [observation.camera_info for observation in frame.observations],
+            [observation.extrinsics for observation in frame.observations],
+            self.intrinsics_cache
+        )
+
+
+def prepare_pnp_correspondences(point_list_2d, point_list_3d, camera_infos, camera_extrinsics, intrinsics_cache):
+    #type: (list[np.ndarray], list[np.ndarray], list[CameraInfo], list[transform_cache.StaticTransform], camera_model.IntrinsicsCache)->tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    u"""
+    Flattens the correspondences of every camera for the pose solvers. Cameras without extrinsics are skipped.
+    :return: the bearings size:(x, 3), the arena points size:(x, 3), the camera index of every
+     correspondence size:(x,), the camera translations size:(c, 3) and rotations size:(c, 3, 3) in the fcu frame
+    """
+    camera_rotations = np.tile(np.identity(3), (len(camera_infos), 1, 1))
+    camera_translations = np.zeros((len(camera_infos), 3))
+    bearings_list = []
+    coordinates_list = []
+    camera_indices_list = []
+
+    for i, (points_2d, points_3d, camera_info, extrinsics) in enumerate(zip(point_list_2d, point_list_3d, camera_infos, camera_extrinsics)):
+        if extrinsics is None:
+            continue
+        camera_rotations[i,:,:] = extrinsics.rotation_matrix
+        camera_translations[i,:] = extrinsics.translation
+
+        bearings_list.append(intrinsics_cache.pixels_to_bearings(camera_info, points_2d))
+        coordinates_list.append(points_3d)
+        camera_indices_list.append(np.full((points_2d.shape[0],), i, dtype=np.intp))
+
+    if len(bearings_list) == 0:
+        raise LocalizationUnavailableException
+
+    return (
+        np.concatenate(bearings_list),
+        np.concatenate(coordinates_list),
+        np.concatenate(camera_indices_list),
+        camera_translations,
+        camera_rotations
+    )
+
+
+def solve_upnp(correspondences):
+    # type: (tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray])->np.ndarray
+    u"""
+    The pose of the FCU by UPnP, as a 3x4 matrix.
+    opengv is only imported here : the estimators that do not need it work without it.
+    """
+    import opengv
+    try:
+        fcu_pose_mat = opengv.solve(*correspondences)
+    except ValueError as e:
+        raise LocalizationUnavailableException(message="Invalid PnP input", cause=e)
+    if fcu_pose_mat is None:
+        raise LocalizationUnavailableException
+    return fcu_pose_mat
+
+
+def estimate_drone_pnp(correspondences):
+    #type: (tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray])->tuple[np.ndarray, quaternion.quaternion]
+    fcu_pose_mat = solve_upnp(correspondences)
+
+    rot = quaternion.from_rotation_matrix(fcu_pose_mat[0:3, 0:3])
+    trans = fcu_pose_mat[:, 3]
+
+    return trans, rot
+
+
+def estimate_drone_ransac(correspondences, fcu_pose, configuration):
+    #type: (tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray], tuple[np.ndarray, quaternion.quaternion], Configuration)->tuple[np.ndarray, quaternion.quaternion, np.ndarray]
+    u"""
+    Robust to mismatched intersections : the position is found by LO-RANSAC with the rotation of the
+    FCU, then the rotation is refined by UPnP on the inliers only.
+    :return: the translation, the rotation and the 6x6 covariance of the pose
+    """
+    bearings, landmarks, camera_indices, camera_translations, camera_rotations = correspondences
+
+    points, directions = pose_estimators.rays_in_arena(
+        bearings, landmarks, camera_indices, camera_translations, camera_rotations,
+        quaternion.as_rotation_matrix(fcu_pose[1])
+    )
+    result = pose_estimators.ransac_translation(
+        points,
+        directions,
+        configuration.ransac_threshold,
+        confidence=configuration.ransac_confidence,
+        max_hypotheses=configuration.ransac_max_hypotheses
+    )
+    if result is None:
+        raise LocalizationUnavailableException
+    trans, translation_covariance, inliers = result
+    rot = fcu_pose[1]
+
+    try:
+        fcu_pose_mat = solve_upnp(
+            (bearings[inliers], landmarks[inliers], camera_indices[inliers], camera_translations, camera_rotations)
+        )
+    except LocalizationUnavailableException:
+        fcu_pose_mat = None
+    if fcu_pose_mat is not None and np.linalg.norm(fcu_pose_mat[:, 3] - trans) <= configuration.ransac_max_refinement:
+        trans = fcu_pose_mat[:, 3]
+        rot = quaternion.from_rotation_matrix(fcu_pose_mat[0:3, 0:3])
+
+    return trans, rot, pose_estimators.pose_covariance(translation_covariance)
+
+
+def estimate_drone_incremental(correspondences, estimator):
+    #type: (tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray], pose_estimators.IncrementalPoseEstimator)->tuple[np.ndarray, quaternion.quaternion, np.ndarray]
+    u"""
+    Refines the pose of the previous frame by Gauss-Newton. On cold start, or when the refinement
+    fails, the estimator is seeded again from UPnP.
+    :return: the translation, the rotation and the 6x6 covariance of the pose
+    """
+    result = estimator.estimate(*correspondences)
+    if result is None:
+        fcu_pose_mat = solve_upnp(correspondences)
+        estimator.reset(fcu_pose_mat[:, 3], fcu_pose_mat[0:3, 0:3])
+        result = estimator.estimate(*correspondences)
+        if result is None:
+            raise LocalizationUnavailableException(message="UPnP pose does not explain the bearings")
+
+    trans, rotation_matrix, covariance = result
+    return trans, quaternion.from_rotation_matrix(rotation_matrix), covariance
+
+
+def estimate_drone_position_alone(detected_3d_points, matched_3d_points, fcu_pose, configuration):
+    # type: (np.ndarray, np.ndarray, tuple[np.ndarray, quaternion.quaternion], Configuration)->tuple[np.ndarray, quaternion.quaternion, np.ndarray]
+    u"""
+    Corrects the position of the FCU by the robust mean of the deltas between the detected and
+    matched intersections, the closest intersections weighing more. The rotation of the FCU is kept.
+    :return: the translation, the rotation and the 6x6 covariance of the pose
+    """
+    if detected_3d_points.size == 0:
+        raise LocalizationUnavailableException
+
+    result = pose_estimators.robust_translation(
+        detected_3d_points - matched_3d_points,
+        pose_estimators.inverse_square_distances(fcu_pose[0], detected_3d_points, configuration.position_min_distance),
+        configuration.position_robust_scale,
+        configuration.position_robust_loss
+    )
+    if result is None or not np.all(np.isfinite(result[0])):
+        raise LocalizationUnavailableException
+    delta_p, translation_covariance, _ = result
+
+    return fcu_pose[0] - delta_p, fcu_pose[1], pose_estimators.pose_covariance(translation_covariance)
+
+
+def estimate_drone_simple(points_in_3d, matched_points_in_3d, fcu_pose):
+    if points_in_3d.shape[0] > 0:
+        dt = np.mean(matched_points_in_3d - points_in_3d, axis=0)
+        return (fcu_pose[0] + dt, fcu_pose[1])
+    else:
+        raise LocalizationUnavailableException
@@ -1,3 +1,7 @@
+import collections
+import threading
+
+import rospy
 import message_filters
 
 
@@ -13,3 +17,159 @@ class Combiner(message_filters.SimpleFilter):
 
     def passMessage(self, *args):
         self.signalMessage(self.combiner_function(*args))
+
+
+def rospy_timer(delay, callback, oneshot=True):
+    # type: (float, callable, bool)->rospy.Timer
+    u"""
+    Calls callback without arguments after delay seconds, and then every delay seconds if not oneshot.
+    """
+    return rospy.Timer(rospy.Duration(delay), lambda event: callback(), oneshot=oneshot)
+
+
+class QuorumSynchronizer(message_filters.SimpleFilter):
+    u"""
+    Bundles the messages of several inputs with close stamps, without waiting for the slow ones.
+    The bundle opened by the first message is emitted as soon as quorum inputs are in it, when its
+    deadline expires, or when a message that cannot join it arrives (a newer stamp, or a second
+    message of an input already in it). The callbacks get one message per input, in the order of
+    the inputs, None for the inputs missing from the bundle.
+    Only the messages older than the open bundle, or in the time of a bundle already emitted, are
+    dropped : the bundles never go back in time. They are counted in dropped_messages.
+
+    The callbacks run outside of the lock of the bundles, one bundle at a time and in order : a slow
+    callback never delays the inputs nor the deadline. The bundles emitted while it runs wait for
+    it, and when more than queue_size wait, the oldest are dropped with their messages.
+    """
+    def __init__(self, fs, quorum, slop, deadline=None, schedule=rospy_timer, queue_size=1):
+        # type: (list[message_filters.SimpleFilter], int, float, float, callable, int)->None
+        u"""
+        :param fs: the inputs
+        :param quorum: the number of inputs that emits the bundle right away, all of them if 0
+        :param slop: the maximal difference (s) between the stamp of a message and the stamp of the
+         first message of the bundle
+        :param deadline: the maximal wall time (s) a bundle stays open, unlimited if None
+        :param schedule: schedule(delay, callback) calls callback after delay seconds and returns a
+         handle with a shutdown method. The deadline is not enforced if None.
+        :param queue_size: the number of emitted bundles that wait for the callbacks
+        """
+        message_filters.SimpleFilter.__init__(self)
+        self.input_number = len(fs)
+        self.quorum = quorum if quorum > 0 else self.input_number
+        self.slop = slop
+        self.deadline = deadline
+        self.schedule = schedule
+        self.queue_size = queue_size
+
+        self.emitted_bundles = 0
+        # Emitted with at least one missing input
+        self.partial_bundles = 0
+        self.expired_bundles = 0
+        self.dropped_messages = 0
+
+        self.lock = threading.Lock()
+        self._bundle = [None] * self.input_number
+        self._bundle_size = 0
+        self._bundle_stamp = None
+        self._emitted_stamp = None
+        self._bundle_id = 0
+        self._timer = None
+        # Emitted, waiting for the callbacks
+        self._pending = collections.deque()
+        # Held by the thread running the callbacks
+        self._delivery_lock = threading.Lock()
+
+        self.input_connections = [
+            f.registerCallback(self.add, i) for i, f in enumerate(fs)
+        ]
+
+    def add(self, message, input_index):
+        self._add(message, input_index)
+        self._deliver()
+
+    def _add(self, message, input_index):
+        with self.lock:
+            stamp = message.header.stamp.to_sec()
+            if self._bundle_stamp is None:
+                if self._emitted_stamp is not None and stamp <= self._emitted_stamp + self.slop:
+                    self.dropped_messages += 1
+                    return
+            else:
+                if stamp < self._bundle_stamp - self.slop:
+                    self.dropped_messages += 1
+                    return
+                if stamp > self._bundle_stamp + self.slop or self._bundle[input_index] is not None:
+                    self._emit()
+
+            if self._bundle_stamp is None:
+                self._bundle_stamp = stamp
+                self._bundle_id += 1
+                if self.deadline is not None and self.schedule is not None:
+                    bundle_id = self._bundle_id
+                    self._timer = self.schedule(self.deadline, lambda: self._expire(bundle_id))
+            self._bundle[input_index] = message
+            self._bundle_size += 1
+
+            if self._bundle_size >= self.quorum:
+                self._emit()
+
+    def summary(self):
+        # type: ()->list[tuple[str, str]]
+        return [
+            ("sync.emitted_bundles", str(self.emitted_bundles)),
+            ("sync.partial_bundles", str(self.partial_bundles)),
+            ("sync.expired_bundles", str(self.expired_bundles)),
+            ("sync.dropped_messages", str(self.dropped_messages)),
+        ]
+
+    def _expire(self, bundle_id):
+        with self.lock:
+            # Already emitted
+            if bundle_id != self._bundle_id or self._bundle_stamp is None:
+                return
+            self.expired_bundles += 1
+            self._timer = None
+            self._emit()
+        self._deliver()
+
+    def _emit(self):
+        # Under the lock, only queues the bundle for _deliver
+        bundle = self._bundle
+        if self._bundle_size < self.input_number:
+            self.partial_bundles += 1
+        self.emitted_bundles += 1
+
+        self._bundle = [None] * self.input_number
+        self._bundle_size = 0
+        self._emitted_stamp = self._bundle_stamp
+        self._bundle_stamp = None
+        if self._timer is not None:
+            self._timer.shutdown()
+            self._timer = None
+
+        self._pending.append(bundle)
+        while len(self._pending) > self.queue_size:
+            dropped = self._pending.popleft()
+            self.dropped_messages += sum(1 for message in dropped if message is not None)
+
+    def _deliver(self):
+        u"""
+        Runs the callbacks on the pending bundles, without the lock. If another thread is already
+        running them, it will run the new bundles too.
+        """
+        while True:
+            if not self._delivery_lock.acquire(False):
+                return
+            try:
+                while True:
+                    with self.lock:
+                        if not self._pending:
+                            break
+                        bundle = self._pending.popleft()
+                    self.signalMessage(*bundle)
+            finally:
+                self._delivery_lock.release()
+            # Queued after the last check, by a thread that could not take the delivery lock
+            with self.lock:
+                if not self._pending:
+                    return
@@ -3,25 +3,248 @@
 u"""
 Interface to serialize en deserealize ros messages.
 """
+import itertools
+
 import numpy as np
+import genpy
+from std_msgs.msg import Header
 import elikos_msgs.msg as elikos_msgs
 
+# Nombre d'intersections lues par np.fromiter à la fois : borne la taille du tableau temporaire
+_DESERIALIZATION_CHUNK = 128
+
+
+def _intersection_values(intersections):
+    u"""
+    Toutes les valeurs des intersections à la suite : x et y en 2d puis x, y et z en 3d.
+    """
+    for intersection in intersections:
+        image_position = intersection.imagePosition
+        arena_position = intersection.arenaPosition
+        yield image_position.x
+        yield image_position.y
+        yield arena_position.x
+        yield arena_position.y
+        yield arena_position.z
+
+
+def _fill_intersections(intersections, points_2d, points_3d):
+    u"""
+    Écrit les intersections dans points_2d et points_3d, déjà de la bonne taille. Les valeurs sont lues
+    en une seule passe par np.fromiter, par morceaux d'au plus _DESERIALIZATION_CHUNK intersections.
+    """
+    values = _intersection_values(intersections)
+    intersection_number = points_2d.shape[0]
+    for start in xrange(0, intersection_number, _DESERIALIZATION_CHUNK):
+        stop = min(start + _DESERIALIZATION_CHUNK, intersection_number)
+        chunk = np.fromiter(
+            itertools.islice(values, 5 * (stop - start)),
+            dtype=np.float,
+            count=5 * (stop - start)
+        ).reshape((stop - start, 5))
+        points_2d[start:stop] = chunk[:, 0:2]
+        points_3d[start:stop] = chunk[:, 2:5]
+
+
+def _output_array(out, rows, columns):
+    u"""
+    Retourne les `rows` premières lignes de out, ou un nouveau tableau si out est None.
+    """
+    if out is None:
+        return np.empty((rows, columns))
+    if out.shape[0] < rows or out.shape[1] != columns:
+        raise ValueError("output buffer of shape {0} cannot hold ({1}, {2})".format(out.shape, rows, columns))
+    return out[0:rows]
+
 
-def deserialize_intersections(localization_points):
-    # type: (elikos_msgs.IntersectionArray)->(np.ndarray,np.ndarray)
+def deserialize_intersections(localization_points, out_2d=None, out_3d=None):
+    # type: (elikos_msgs.IntersectionArray, np.ndarray, np.ndarray)->(np.ndarray,np.ndarray)
     u"""
     Prens un message de localisation et retourne un message de points.
+    Toutes les valeurs sont lues en une seule passe. Si out_2d et out_3d sont donnés,
+    les points y sont écrits et les tableaux retournés sont des vues sur leurs premières lignes.
+    Seul un tableau temporaire d'au plus _DESERIALIZATION_CHUNK intersections est alloué en plus.
     :param localization_points: le message
+    :param out_2d: tableau de taille (n, 2) avec n >= nombre d'intersections, ou None
+    :param out_3d: tableau de taille (n, 3) avec n >= nombre d'intersections, ou None
     :return: un tuple d'un tableau des intersection en 2d et 3d
     """
-    intersection_number = len(localization_points.intersections)
-    array_2d_pts = np.empty((intersection_number,2))
-    array_3d_pts = np.empty((intersection_number,3))
-    for i, intersection in enumerate(localization_points.intersections):
-        array_2d_pts[i] = (intersection.imagePosition.x, intersection.imagePosition.y)
-        array_3d_pts[i] = (intersection.arenaPosition.x, intersection.arenaPosition.y, intersection.arenaPosition.z)
+    if isinstance(localization_points, RawIntersectionArray):
+        localization_points = localization_points.copy_into(out_2d, out_3d)
+        return localization_points.points_2d, localization_points.points_3d
+
+    intersections = localization_points.intersections
+    intersection_number = len(intersections)
+
+    array_2d_pts = _output_array(out_2d, intersection_number, 2)
+    array_3d_pts = _output_array(out_3d, intersection_number, 3)
+    _fill_intersections(intersections, array_2d_pts, array_3d_pts)
 
     return array_2d_pts, array_3d_pts
 
 
+class IntersectionBuffers(object):
+    u"""
+    Tampons réutilisés d'une trame à l'autre pour deserialize_intersections.
+    Les tampons grandissent au besoin, donc une fois la taille maximale atteinte, seuls les morceaux
+    temporaires de np.fromiter sont alloués.
+    """
+    def __init__(self, capacity=64):
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.points_2d = np.empty((capacity, 2))
+        self.points_3d = np.empty((capacity, 3))
+
+    def deserialize(self, localization_points):
+        # type: (elikos_msgs.IntersectionArray)->(np.ndarray,np.ndarray)
+        u"""
+        Comme deserialize_intersections. Les tableaux retournés sont valides jusqu'au prochain appel.
+        """
+        if isinstance(localization_points, RawIntersectionArray):
+            return localization_points.points_2d, localization_points.points_3d
+
+        intersections = localization_points.intersections
+        intersection_number = len(intersections)
+        if intersection_number > self.points_2d.shape[0]:
+            self._allocate(max(intersection_number, 2 * self.points_2d.shape[0]))
+
+        points_2d = self.points_2d[0:intersection_number]
+        points_3d = self.points_3d[0:intersection_number]
+        _fill_intersections(intersections, points_2d, points_3d)
+        return points_2d, points_3d
+
+
+###
+#
+# Décodage direct des messages sérialisés
+#
+###
+_PRIMITIVE_DTYPES = {
+    'bool': 'u1', 'byte': 'i1', 'char': 'u1',
+    'int8': 'i1', 'uint8': 'u1', 'int16': '<i2', 'uint16': '<u2',
+    'int32': '<i4', 'uint32': '<u4', 'int64': '<i8', 'uint64': '<u8',
+    'float32': '<f4', 'float64': '<f8',
+    'time': [('secs', '<u4'), ('nsecs', '<u4')],
+    'duration': [('secs', '<i4'), ('nsecs', '<i4')],
+}
+
+
+def message_dtype(message_class):
+    # type: (type)->np.dtype
+    u"""
+    Crée le dtype numpy structuré qui a exactement la disposition sérialisée du message.
+    Seuls les messages de taille fixe (pas de string ni de tableaux de taille variable) ont un dtype.
+    :param message_class: la classe genpy du message
+    :return: le dtype, sans alignement, comme la sérialisation ROS
+    """
+    fields = []
+    for name, slot_type in zip(message_class.__slots__, message_class._slot_types):
+        base_type, _, length = slot_type.partition('[')
+        if base_type in _PRIMITIVE_DTYPES:
+            field_dtype = np.dtype(_PRIMITIVE_DTYPES[base_type])
+        elif base_type == 'string':
+            raise ValueError("{0}.{1} is a string, the message has no fixed size".format(message_class._type, name))
+        else:
+            field_dtype = message_dtype(genpy.message.get_message_class(base_type))
+
+        if length == '':
+            fields.append((name, field_dtype))
+        elif length == ']':
+            raise ValueError("{0}.{1} is a variable length array, the message has no fixed size".format(message_class._type, name))
+        else:
+            fields.append((name, field_dtype, (int(length[:-1]),)))
+    return np.dtype(fields)
+
+
+def _field_offset(record_dtype, path):
+    # type: (np.dtype, str)->(np.dtype, int)
+    u"""
+    Type et position en octets du champ `path` (par exemple "arenaPosition.x") dans record_dtype.
+    """
+    offset = 0
+    for name in path.split('.'):
+        record_dtype, field_offset = record_dtype.fields[name][0:2]
+        offset += field_offset
+    return record_dtype, offset
+
+
+class RawIntersectionArray(object):
+    u"""
+    IntersectionArray décodé par RawIntersectionDecoder : seulement l'en-tête et les points.
+    Les points sont des vues en lecture seule sur le tampon sérialisé.
+    """
+    def __init__(self, header, points_2d, points_3d):
+        self.header = header
+        self.points_2d = points_2d
+        self.points_3d = points_3d
+
+    def copy_into(self, out_2d=None, out_3d=None):
+        # type: (np.ndarray, np.ndarray)->RawIntersectionArray
+        u"""
+        Copie les points dans out_2d et out_3d (ou dans de nouveaux tableaux s'ils sont None).
+        """
+        intersection_number = self.points_2d.shape[0]
+        points_2d = _output_array(out_2d, intersection_number, 2)
+        points_3d = _output_array(out_3d, intersection_number, 3)
+        points_2d[...] = self.points_2d
+        points_3d[...] = self.points_3d
+        return RawIntersectionArray(self.header, points_2d, points_3d)
+
+
+class RawIntersectionDecoder(object):
+    u"""
+    Décode un elikos_msgs.IntersectionArray sérialisé (reçu en rospy.AnyMsg) sans créer
+    d'objet python par intersection : les points sont lus directement dans le tampon avec
+    un pas fixe. La disposition est déduite de la définition des messages à la construction,
+    qui échoue (ValueError) si Intersection n'a pas une taille fixe.
+    """
+    def __init__(self,
+                 image_fields=("imagePosition.x", "imagePosition.y"),
+                 arena_fields=("arenaPosition.x", "arenaPosition.y", "arenaPosition.z")):
+        if list(elikos_msgs.IntersectionArray._slot_types) != ['std_msgs/Header', 'elikos_msgs/Intersection[]']:
+            raise ValueError("unexpected IntersectionArray layout {0}".format(elikos_msgs.IntersectionArray._slot_types))
+
+        self.record_dtype = message_dtype(elikos_msgs.Intersection)
+        self.image_offset = self._contiguous_float64_offset(image_fields)
+        self.arena_offset = self._contiguous_float64_offset(arena_fields)
+
+    def _contiguous_float64_offset(self, fields):
+        # type: (tuple[str])->int
+        offsets = []
+        for field in fields:
+            field_dtype, offset = _field_offset(self.record_dtype, field)
+            if field_dtype != np.dtype('<f8'):
+                raise ValueError("{0} is not a float64".format(field))
+            offsets.append(offset)
+        if offsets != list(range(offsets[0], offsets[0] + 8 * len(offsets), 8)):
+            raise ValueError("fields {0} are not contiguous".format(fields))
+        return offsets[0]
+
+    def decode(self, raw_message):
+        # type: (rospy.AnyMsg)->RawIntersectionArray
+        buff = raw_message._buff
+
+        header = Header()
+        header.deserialize(buff)
+        # seq, stamp.secs, stamp.nsecs, len(frame_id), frame_id, len(intersections)
+        offset = 16 + int(np.frombuffer(buff, dtype='<u4', count=1, offset=12)[0])
+        intersection_number = int(np.frombuffer(buff, dtype='<u4', count=1, offset=offset)[0])
+        offset += 4
+
+        if intersection_number == 0:
+            return RawIntersectionArray(header, np.empty((0, 2)), np.empty((0, 3)))
+
+        stride = self.record_dtype.itemsize
+        if len(buff) < offset + intersection_number * stride:
+            raise genpy.DeserializationError("IntersectionArray buffer is too short")
 
+        points_2d = np.ndarray(
+            shape=(intersection_number, 2), dtype='<f8', buffer=buff,
+            offset=offset + self.image_offset, strides=(stride, 8)
+        )
+        points_3d = np.ndarray(
+            shape=(intersection_number, 3), dtype='<f8', buffer=buff,
+            offset=offset + self.arena_offset, strides=(stride, 8)
+        )
+        return RawIntersectionArray(header, points_2d, points_3d)
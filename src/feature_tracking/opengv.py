@@ -4,4 +4,104 @@ import numpy as np
 
 def epnp_multi_camera(bearings, coordinates, camera_translations, camera_rotations):
     # type: (list[np.ndarray], list[np.ndarray], np.ndarray, np.ndarray)->np.ndarray
-    return _pyopengv.epnp_multi_camera(bearings, coordinates, camera_translations, camera_rotations, "upnp")
\ No newline at end of file
+    return _pyopengv.epnp_multi_camera(bearings, coordinates, camera_translations, camera_rotations, "upnp")
+
+
+def validate_correspondences(bearings, coordinates, camera_indices, camera_translations, camera_rotations):
+    # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)->None
+    """
+    Checks the inputs of solve_stacked, for the whole stack at once.
+    :raise ValueError: if the shapes do not match or if a value is not finite
+    """
+    if bearings.shape != coordinates.shape or bearings.ndim != 3 or bearings.shape[-1] != 3:
+        raise ValueError("bearings {0} and coordinates {1} must both be (frames, points, 3)".format(bearings.shape, coordinates.shape))
+    if camera_indices.shape[-1] != bearings.shape[1]:
+        raise ValueError("there are {0} camera indices for {1} points".format(camera_indices.shape[-1], bearings.shape[1]))
+    if camera_translations.shape[0] != camera_rotations.shape[0]:
+        raise ValueError("there are {0} camera translations for {1} rotations".format(camera_translations.shape[0], camera_rotations.shape[0]))
+    if camera_indices.size > 0 and (np.min(camera_indices) < 0 or np.max(camera_indices) >= camera_translations.shape[0]):
+        raise ValueError("camera index out of range")
+    if not (np.all(np.isfinite(bearings)) and np.all(np.isfinite(coordinates))):
+        raise ValueError("bearings and coordinates must be finite")
+    if not (np.all(np.isfinite(camera_translations)) and np.all(np.isfinite(camera_rotations))):
+        raise ValueError("camera extrinsics must be finite")
+
+
+def _first_valid_pose(solutions):
+    # type: (list[np.ndarray])->np.ndarray
+    if solutions is None:
+        return None
+    for pose in solutions:
+        pose = np.asarray(pose)
+        if pose.shape == (3, 4) and np.all(np.isfinite(pose)):
+            return pose
+    return None
+
+
+def solve_stacked(bearings, coordinates, camera_indices, camera_translations, camera_rotations, algorithm="upnp", min_points=3):
+    # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, str, int)->list[np.ndarray]
+    """
+    Solves the multi-camera absolute pose of a stack of frames (or RANSAC hypotheses) with the
+    same number of correspondences. The stack is validated, sorted by camera and converted once;
+    only the native solve is done frame by frame.
+    :param bearings: unit bearings in their camera frame, size:(frames, points, 3)
+    :param coordinates: the matching points in the world frame, size:(frames, points, 3)
+    :param camera_indices: the camera of every point, shared by all the frames size:(points,),
+     or size:(frames, points)
+    :param camera_translations: position of every camera in the body frame, size:(cameras, 3)
+    :param camera_rotations: rotation of every camera in the body frame, size:(cameras, 3, 3)
+    :return: a list with the [R|t] pose (size:(3, 4)) of the body in the world of every frame,
+     or None for frames without a finite solution
+    """
+    bearings = np.asarray(bearings, dtype=np.float)
+    coordinates = np.asarray(coordinates, dtype=np.float)
+    camera_indices = np.asarray(camera_indices, dtype=np.intp)
+    camera_translations = np.ascontiguousarray(camera_translations, dtype=np.float)
+    camera_rotations = np.ascontiguousarray(camera_rotations, dtype=np.float)
+    validate_correspondences(bearings, coordinates, camera_indices, camera_translations, camera_rotations)
+
+    frames_number = bearings.shape[0]
+    if bearings.shape[1] < min_points:
+        return [None] * frames_number
+
+    camera_number = camera_translations.shape[0]
+    if camera_indices.ndim == 1:
+        camera_indices = np.broadcast_to(camera_indices, bearings.shape[0:2])
+
+    # Sort every frame by camera, then split it in one contiguous array per camera
+    order = np.argsort(camera_indices, axis=1, kind='mergesort')
+    rows = np.arange(frames_number)[:, np.newaxis]
+    bearings = np.ascontiguousarray(bearings[rows, order])
+    coordinates = np.ascontiguousarray(coordinates[rows, order])
+    counts = np.apply_along_axis(np.bincount, 1, camera_indices, minlength=camera_number)
+    splits = np.cumsum(counts, axis=1)[:, :-1]
+
+    poses = []
+    for frame in xrange(frames_number):
+        used_cameras = counts[frame] > 0
+        bearings_list = [b for b, used in zip(np.split(bearings[frame], splits[frame]), used_cameras) if used]
+        coordinates_list = [c for c, used in zip(np.split(coordinates[frame], splits[frame]), used_cameras) if used]
+        poses.append(_first_valid_pose(_pyopengv.epnp_multi_camera(
+            bearings_list,
+            coordinates_list,
+            camera_translations[used_cameras],
+            camera_rotations[used_cameras],
+            algorithm
+        )))
+    return poses
+
+
+def solve(bearings, coordinates, camera_indices, camera_translations, camera_rotations, algorithm="upnp"):
+    # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, str)->np.ndarray
+    """
+    solve_stacked for a single frame, size:(points, 3).
+    :return: the [R|t] pose of the body in the world, or None
+    """
+    return solve_stacked(
+        bearings[np.newaxis],
+        coordinates[np.newaxis],
+        camera_indices,
+        camera_translations,
+        camera_rotations,
+        algorithm
+    )[0]
@@ -32,13 +32,107 @@ def transform_points(matrix, points):
 
 
 def transform_points_simple(points, translation, rotation):
-    tranlation_matrix = create_translation_matrix(translation)
-    rotation_matrix = create_rotation_matrix(rotation)
-    return transform_points(
-        np.matmul(tranlation_matrix, rotation_matrix),
-        points
+    # type: (np.ndarray, np.ndarray, qt.quaternion) -> np.ndarray
+    return RigidTransform(translation, rotation).apply(points)
+
+
+class RigidTransform(object):
+    u"""
+    The rigid transform x -> R.x + t, like the pose of a frame in another. Points are transformed
+    without homogeneous coordinates, and the rotation matrix is only computed once, on first use.
+    """
+    __slots__ = ("translation", "rotation", "_rotation_matrix")
+
+    def __init__(self, translation, rotation, rotation_matrix=None):
+        # type: (np.ndarray, qt.quaternion, np.ndarray)->None
+        u"""
+        :param rotation: a unit quaternion
+        :param rotation_matrix: the matrix of rotation if it is already known, computed when needed if None
+        """
+        self.translation = np.asarray(translation, dtype=np.float)
+        self.rotation = rotation
+        self._rotation_matrix = rotation_matrix
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        # type: (np.ndarray)->RigidTransform
+        u"""
+        :param matrix: a 3x4 or 4x4 transformation matrix
+        """
+        return cls(matrix[0:3, 3], qt.from_rotation_matrix(matrix[0:3, 0:3]), matrix[0:3, 0:3])
+
+    @property
+    def rotation_matrix(self):
+        # type: ()->np.ndarray
+        if self._rotation_matrix is None:
+            self._rotation_matrix = qt.as_rotation_matrix(self.rotation)
+        return self._rotation_matrix
+
+    def apply(self, points):
+        # type: (np.ndarray)->np.ndarray
+        u"""
+        :param points: size:(x, 3) or size:(3,)
+        """
+        return np.dot(points, self.rotation_matrix.T) + self.translation
+
+    def compose(self, other):
+        # type: (RigidTransform)->RigidTransform
+        u"""
+        The transform applying other, then self.
+        """
+        rotation_matrix = None
+        if self._rotation_matrix is not None and other._rotation_matrix is not None:
+            rotation_matrix = np.dot(self._rotation_matrix, other._rotation_matrix)
+        return RigidTransform(self.apply(other.translation), self.rotation * other.rotation, rotation_matrix)
+
+    def inverse(self):
+        # type: ()->RigidTransform
+        rotation_matrix = self.rotation_matrix.T
+        return RigidTransform(-np.dot(rotation_matrix, self.translation), self.rotation.conjugate(), rotation_matrix)
+
+    def as_matrix(self):
+        # type: ()->np.ndarray
+        matrix = np.identity(4)
+        matrix[0:3, 0:3] = self.rotation_matrix
+        matrix[0:3, 3] = self.translation
+        return matrix
+
+
+def apply_transforms(translations, rotation_matrices, points):
+    # type: (np.ndarray, np.ndarray, np.ndarray)->np.ndarray
+    u"""
+    Applies a stack of k transforms to the same m points at once, like the hypotheses of an estimator.
+    :param translations: size:(k, 3)
+    :param rotation_matrices: size:(k, 3, 3)
+    :param points: size:(m, 3)
+    :return: the points transformed by every transform size:(k, m, 3)
+    """
+    return np.einsum('kij,mj->kmi', rotation_matrices, points) + translations[:, np.newaxis]
+
+
+def compose_transforms(translations_a, rotation_matrices_a, translations_b, rotation_matrices_b):
+    # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray)->tuple[np.ndarray, np.ndarray]
+    u"""
+    The transforms applying b, then a, for stacks of transforms that broadcast together.
+    :return: the translations size:(..., 3) and the rotation matrices size:(..., 3, 3)
+    """
+    return (
+        np.einsum('...ij,...j->...i', rotation_matrices_a, translations_b) + translations_a,
+        np.matmul(rotation_matrices_a, rotation_matrices_b)
     )
 
+
+def invert_transforms(translations, rotation_matrices):
+    # type: (np.ndarray, np.ndarray)->tuple[np.ndarray, np.ndarray]
+    u"""
+    :param translations: size:(..., 3)
+    :param rotation_matrices: size:(..., 3, 3)
+    :return: the translations and the rotation matrices of the inverse transforms
+    """
+    inverse_rotation_matrices = np.swapaxes(rotation_matrices, -1, -2)
+    return -np.einsum('...ij,...j->...i', inverse_rotation_matrices, translations), inverse_rotation_matrices
+
+
 def create_translation_matrix(translation):
     return np.array([
         [1, 0, 0, translation[0]],
@@ -67,9 +161,7 @@ def create_tf_from_quaterion(quaterion):
 
 def tf_to_matrix(tf_translation, tf_quaterion):
     # type: (tuple, tuple)->np.ndarray
-    tranlation_matrix = create_translation_matrix(tf_translation)
-    rotation_matrix = create_rotation_matrix(qt.quaternion(tf_quaterion[3], tf_quaterion[0], tf_quaterion[1], tf_quaterion[2]))
-    return np.matmul(tranlation_matrix, rotation_matrix)
+    return RigidTransform(tf_translation, create_quaterion_from_tf(tf_quaterion)).as_matrix()
 
 
 def create_3d_projection_matrix(plane):
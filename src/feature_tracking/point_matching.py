@@ -3,6 +3,8 @@
 u"""
 Matches points based on the system state, and predictions of the fcu's filter.
 """
+import os
+
 import numpy as np
 
 
@@ -35,23 +37,342 @@ def closest_point(point_array, position):
     return np.argmin(dist_2)
 
 
-def match_points(input_points, points_to_match_to):
+def closest_points(point_array, positions):
     # type: (np.ndarray, np.ndarray)->np.ndarray
     u"""
+    Vectorized version of closest_point, for a whole batch of positions.
+    Uses |a - b|² = |a|² - 2a.b + |b|², so only one (y, x) distance matrix is built.
+    :param point_array: a numpy array of positions size:(x, n)
+    :param positions: a numpy array of positions size:(y, n)
+    :return: the index of the closest point in point_array for every position, size:(y,)
+    """
+    if point_array.shape[0] == 0:
+        return None
+    dist_2 = np.einsum('ij,ij->i', positions, positions)[:, np.newaxis] \
+        - 2 * np.dot(positions, point_array.T) \
+        + np.einsum('ij,ij->i', point_array, point_array)[np.newaxis, :]
+    return np.argmin(dist_2, axis=1)
+
+
+_NEIGHBOURHOOD_3X3 = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1]), axis=-1).reshape((9, 2))
+
+
+class GridLattice(object):
+    u"""
+    Regular arena lattice, the same one as create_grid_mesh(side_points_number, side_mesure).
+    Since the intersections are evenly spaced, the closest intersection of a point is found
+    arithmetically by rounding its coordinates, in O(1) per point instead of a scan of the mesh.
+    """
+    def __init__(self, side_points_number, side_mesure):
+        self.side_points_number = side_points_number
+        self.side_mesure = side_mesure
+        self.points = create_grid_mesh(side_points_number, side_mesure)
+        self.origin = self.points[0]
+        self.spacing = np.true_divide(side_mesure, side_points_number - 1)
+
+    def snap(self, input_points):
+        # type: (np.ndarray)->(np.ndarray, np.ndarray, np.ndarray)
+        u"""
+        Snaps every input point to the closest intersection of the lattice.
+        :param input_points: the points to snap, size:(x, n) with n >= 2
+        :return: a tuple of the snapped points size:(x, n), the euclidean distance between
+         each point and its intersection size:(x,) and the (i, j) lattice indices size:(x, 2),
+         i along the x axis and j along the y axis.
+        """
+        lattice_indices = np.rint((input_points[:, 0:2] - self.origin[0:2]) / self.spacing).astype(np.intp)
+        np.clip(lattice_indices, 0, self.side_points_number - 1, out=lattice_indices)
+
+        matched_points = np.empty(input_points.shape)
+        matched_points[:, 0:2] = lattice_indices * self.spacing + self.origin[0:2]
+        matched_points[:, 2:] = self.origin[2:input_points.shape[-1]]
+
+        deltas = input_points - matched_points
+        residuals = np.sqrt(np.einsum('ij,ij->i', deltas, deltas))
+
+        return matched_points, residuals, lattice_indices
+
+    def query(self, positions, k=1, distance_upper_bound=np.inf):
+        # type: (np.ndarray, int, float)->(np.ndarray, np.ndarray)
+        u"""
+        Same as SpatialIndex.query. The neighbours are searched among the 3x3 intersections
+        around the closest one, which holds the k closest intersections for k <= 4.
+        """
+        closest = np.rint((positions[:, 0:2] - self.origin[0:2]) / self.spacing).astype(np.intp)
+        np.clip(closest, 0, self.side_points_number - 1, out=closest)
+
+        lattice_indices = closest[:, np.newaxis, :] + _NEIGHBOURHOOD_3X3[np.newaxis, :, :]
+        outside = np.any((lattice_indices < 0) | (lattice_indices >= self.side_points_number), axis=2)
+        indices = lattice_indices[..., 1] * self.side_points_number + lattice_indices[..., 0]
+        indices[outside] = 0
+
+        deltas = positions[:, np.newaxis, :] - self.points[indices][..., 0:positions.shape[-1]]
+        distances = np.sqrt(np.einsum('ijk,ijk->ij', deltas, deltas))
+        distances[outside] = np.inf
+
+        order = np.argsort(distances, axis=1)[:, 0:k]
+        rows = np.arange(positions.shape[0])[:, np.newaxis]
+        distances = distances[rows, order]
+        indices = indices[rows, order]
+
+        # Neighbours off the grid keep an infinite distance even without an upper bound
+        missing = ~np.isfinite(distances) | (distances > distance_upper_bound)
+        distances[missing] = np.inf
+        indices[missing] = self.points.shape[0]
+
+        if k == 1:
+            return distances[:, 0], indices[:, 0]
+        return distances, indices
+
+    def flat_indices(self, lattice_indices):
+        # type: (np.ndarray)->np.ndarray
+        u"""
+        Converts (i, j) lattice indices to indices in self.points.
+        """
+        return lattice_indices[:, 1] * self.side_points_number + lattice_indices[:, 0]
+
+
+class SpatialIndex(object):
+    u"""
+    KD-tree over an arbitrary set of arena landmarks (surveyed intersections, extra markers, ...).
+    Build it once from the map, then query it with whole batches of points.
+    """
+    def __init__(self, points, leafsize=16):
+        # scipy is only imported for irregular maps, the GridLattice does not need it
+        from scipy.spatial import cKDTree
+        self.points = np.asarray(points, dtype=np.float)
+        self.tree = cKDTree(self.points, leafsize=leafsize)
+
+    def query(self, positions, k=1, distance_upper_bound=np.inf):
+        # type: (np.ndarray, int, float)->(np.ndarray, np.ndarray)
+        u"""
+        Finds the k closest landmarks of every position.
+        :param positions: the positions, size:(x, n)
+        :param k: the number of neighbours to find
+        :param distance_upper_bound: neighbours further than this are not returned
+        :return: a tuple of the distances and of the landmark indices, size:(x,) if k is 1, (x, k) otherwise.
+         Missing neighbours have an infinite distance and an index of len(self.points).
+        """
+        return self.tree.query(positions, k=k, distance_upper_bound=distance_upper_bound)
+
+    def query_radius(self, positions, radius):
+        # type: (np.ndarray, float)->list[list[int]]
+        u"""
+        Finds all the landmarks within radius of every position.
+        :return: a list containing the list of landmark indices of every position
+        """
+        return self.tree.query_ball_point(positions, radius)
+
+    def snap(self, input_points):
+        # type: (np.ndarray)->(np.ndarray, np.ndarray, np.ndarray)
+        u"""
+        Same as GridLattice.snap, but the indices are indices in self.points.
+        """
+        residuals, indices = self.query(input_points)
+        return self.points[indices], residuals, indices
+
+
+def load_landmarks(path, cache=False):
+    # type: (str, bool)->np.ndarray
+    u"""
+    Loads an arena map, either a .npy file or a text file with one "x y z" landmark per line.
+    :param cache: if True, a text map is parsed once : the landmarks are saved next to it in
+     path + ".npy", which is loaded instead as long as it is newer than the text file. If False,
+     the text file is parsed every time and nothing is written.
+    :return: the landmarks, size:(x, 3)
+    """
+    if path.endswith(".npy"):
+        return np.load(path)
+    if not cache:
+        return np.loadtxt(path, ndmin=2)
+
+    cache_path = path + ".npy"
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            return np.load(cache_path)
+    except (OSError, IOError, ValueError):
+        pass
+    landmarks = np.loadtxt(path, ndmin=2)
+    try:
+        np.save(cache_path, landmarks)
+    except (OSError, IOError):
+        # Read-only map directory, the text file is parsed every time
+        pass
+    return landmarks
+
+
+def match_points(input_points, points_to_match_to):
+    # type: (np.ndarray, np.ndarray|GridLattice|SpatialIndex)->np.ndarray
+    u"""
     Typical usage : for a 20mx20m arena with 21 intersections :
-    match_points(detected_intersections, create_grid_mesh(21, 20))
+    match_points(detected_intersections, GridLattice(21, 20))
     gives the arena points corresponding to the index of detected intersections,
     'snapped' using the closest euclidean distance, with repetitions.
+    Use associate_points for a one-to-one matching.
+    Irregular maps should be given as a SpatialIndex. If points_to_match_to is a plain
+    array of points, a nearest neighbour search over all of them is used instead.
     :param input_points: the points to match (detected_intersections)
-    :param points_to_match_to: the points to match to (arena_intersections)
+    :param points_to_match_to: the points to match to (arena_intersections), a GridLattice or a SpatialIndex
     :return: the matched points from points_to_match_to using input_points indexing
     """
+    if input_points.shape[0] == 0:
+        return np.empty((0, input_points.shape[-1]))
+
+    if not isinstance(points_to_match_to, np.ndarray):
+        return points_to_match_to.snap(input_points)[0]
+
+    if points_to_match_to.shape[0] == 0:
+        return np.empty((0, input_points.shape[-1]))
+
+    return points_to_match_to[closest_points(points_to_match_to, input_points)]
+
+
+class Association(object):
+    u"""
+    Result of associate_points. Every array is indexed like the associated points.
+    """
+    def __init__(self, accepted, landmark_indices, matched_points, residuals, unmatched, rejected):
+        # Boolean mask of the points that were assigned a landmark
+        self.accepted = accepted
+        # Index of the assigned landmark, -1 if the point was not accepted
+        self.landmark_indices = landmark_indices
+        # Assigned landmark, nan if the point was not accepted
+        self.matched_points = matched_points
+        # Gating distance (euclidean or mahalanobis) to the assigned landmark, inf if the point was not accepted
+        self.residuals = residuals
+        # Indices of the points without any landmark inside the gate
+        self.unmatched = unmatched
+        # Indices of the points whose candidate landmarks were all taken by closer points
+        self.rejected = rejected
+
+
+def associate_points(input_points, arena_map, gate, camera_ids=None, covariance=None, candidates=3):
+    # type: (np.ndarray, GridLattice|SpatialIndex|np.ndarray, float, np.ndarray, np.ndarray, int)->Association
+    u"""
+    One-to-one association of points to the landmarks of arena_map. Unlike match_points,
+    a landmark is assigned at most once per camera, and only if it is inside the gate.
+    The points of all the cameras are associated in one call; the same landmark can be
+    assigned once in every camera.
+    Assignment is greedy over the sparse graph of the `candidates` closest landmarks of
+    every point: the closest pairs are assigned first.
+    :param input_points: the points to associate, size:(x, n)
+    :param arena_map: the landmarks, a GridLattice, a SpatialIndex or an array of points
+    :param gate: the maximal distance between a point and its landmark. It is a mahalanobis
+     distance if covariance is given, an euclidean distance otherwise.
+    :param camera_ids: the camera of every point, size:(x,). All the points are from the same camera if None.
+    :param covariance: the covariance of the points, either shared size:(n, n) or size:(x, n, n)
+    :param candidates: the number of landmarks considered for every point
+    :return: the Association
+    """
+    if isinstance(arena_map, np.ndarray):
+        arena_map = SpatialIndex(arena_map)
+
+    points_number = input_points.shape[0]
+    landmarks_number = arena_map.points.shape[0]
+    if points_number == 0:
+        empty = np.empty((0,), dtype=np.intp)
+        return Association(np.empty((0,), dtype=np.bool), empty, np.empty(input_points.shape), np.empty((0,)), empty, empty)
+    if camera_ids is None:
+        camera_ids = np.zeros((points_number,), dtype=np.intp)
+
+    search_radius = gate
+    if covariance is not None:
+        information = np.linalg.inv(covariance)
+        search_radius = gate * np.sqrt(np.max(np.linalg.eigvalsh(covariance)))
+
+    distances, indices = arena_map.query(input_points, k=candidates, distance_upper_bound=search_radius)
+    distances = distances.reshape((points_number, -1))
+    indices = indices.reshape((points_number, -1))
+    valid = np.isfinite(distances)
+
+    if covariance is not None:
+        deltas = input_points[:, np.newaxis, :] - arena_map.points[np.minimum(indices, landmarks_number - 1)]
+        if information.ndim == 2:
+            distances = np.sqrt(np.einsum('ijk,kl,ijl->ij', deltas, information, deltas))
+        else:
+            distances = np.sqrt(np.einsum('ijk,ikl,ijl->ij', deltas, information, deltas))
+        valid &= distances <= gate
+
+    # Sparse candidate graph, sorted by cost. A landmark seen by two cameras is two different keys.
+    edge_points, edge_candidates = np.nonzero(valid)
+    edge_keys = camera_ids[edge_points] * landmarks_number + indices[edge_points, edge_candidates]
+    edge_costs = distances[edge_points, edge_candidates]
+    order = np.argsort(edge_costs, kind='mergesort')
+    edge_points, edge_keys, edge_costs = edge_points[order], edge_keys[order], edge_costs[order]
+
+    landmark_indices = np.full((points_number,), -1, dtype=np.intp)
+    residuals = np.full((points_number,), np.inf)
+
+    while edge_points.size > 0:
+        # Every point proposes its cheapest edge, every key keeps its cheapest proposal.
+        proposals = np.sort(np.unique(edge_points, return_index=True)[1])
+        proposals = proposals[np.unique(edge_keys[proposals], return_index=True)[1]]
+
+        landmark_indices[edge_points[proposals]] = edge_keys[proposals] % landmarks_number
+        residuals[edge_points[proposals]] = edge_costs[proposals]
+
+        remaining = ~(np.in1d(edge_points, edge_points[proposals]) | np.in1d(edge_keys, edge_keys[proposals]))
+        edge_points, edge_keys, edge_costs = edge_points[remaining], edge_keys[remaining], edge_costs[remaining]
+
+    accepted = landmark_indices >= 0
+    matched_points = np.full(input_points.shape, np.nan)
+    matched_points[accepted] = arena_map.points[landmark_indices[accepted]][:, 0:input_points.shape[-1]]
+
+    has_candidates = np.any(valid, axis=1)
+    return Association(
+        accepted,
+        landmark_indices,
+        matched_points,
+        residuals,
+        np.flatnonzero(~has_candidates),
+        np.flatnonzero(has_candidates & ~accepted)
+    )
+
+
+class AssociationCache(object):
+    u"""
+    Keeps the last Association and reuses it while every point still snaps to the same landmark,
+    from the same camera and in the same order, as in the previous call: between two close frames,
+    only the distances to the landmarks are recomputed. The new Association shares the other arrays
+    of the previous one, which is left unchanged. Only for euclidean gates.
+    """
+    def __init__(self):
+        self._keys = None
+        self._association = None
+
+    def associate(self, input_points, arena_map, gate, camera_ids=None):
+        # type: (np.ndarray, GridLattice|SpatialIndex, float, np.ndarray)->Association
+        u"""
+        Same as associate_points.
+        """
+        if camera_ids is None:
+            camera_ids = np.zeros((input_points.shape[0],), dtype=np.intp)
+
+        _, snap_residuals, snapped_indices = arena_map.snap(input_points)
+        if isinstance(arena_map, GridLattice):
+            snapped_indices = arena_map.flat_indices(snapped_indices)
+        keys = camera_ids * arena_map.points.shape[0] + snapped_indices
 
-    matched_points = np.empty((0, input_points.shape[-1]))
+        previous = self._association
+        if previous is not None and np.array_equal(keys, self._keys):
+            deltas = input_points[previous.accepted] - previous.matched_points[previous.accepted]
+            residuals = np.full(previous.residuals.shape, np.inf)
+            residuals[previous.accepted] = np.sqrt(np.einsum('ij,ij->i', deltas, deltas))
+            # A point that had no landmark in the gate must still have none
+            if np.all(residuals[previous.accepted] <= gate) and np.all(snap_residuals[previous.unmatched] > gate):
+                self._association = Association(
+                    previous.accepted,
+                    previous.landmark_indices,
+                    previous.matched_points,
+                    residuals,
+                    previous.unmatched,
+                    previous.rejected
+                )
+                return self._association
 
-    for i in xrange(np.size(input_points, axis=0)):
-        position = input_points[i]
-        closest_point_index = closest_point(points_to_match_to, position)
-        matched_points = np.append(matched_points, np.array([points_to_match_to[closest_point_index]]), axis=0)
+        self._keys = keys
+        self._association = associate_points(input_points, arena_map, gate, camera_ids)
+        return self._association
 
-    return matched_points
+    def clear(self):
+        self._keys = None
+        self._association = None
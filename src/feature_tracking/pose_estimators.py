@@ -0,0 +1,541 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Robust drone pose estimators working on bearing/arena point correspondences.
+Every function here only needs numpy arrays, so it can be used and benchmarked without ROS.
+
+Conventions, as in opengv :
+ - bearings are unit vectors in their camera frame
+ - camera_translations and camera_rotations give the pose of every camera in the fcu frame
+ - the drone pose is the pose of the fcu in the arena frame
+"""
+import math
+
+import numpy as np
+
+# Variance given to the parts of a pose that an estimator does not estimate
+UNKNOWN_VARIANCE = 1e6
+
+
+def pose_covariance(translation_covariance, rotation_covariance=None):
+    # type: (np.ndarray, np.ndarray)->np.ndarray
+    u"""
+    6x6 covariance of a pose (x, y, z, rotation about x, y and z), like in geometry_msgs/PoseWithCovariance.
+    """
+    covariance = np.zeros((6, 6))
+    covariance[0:3, 0:3] = translation_covariance
+    covariance[3:6, 3:6] = rotation_covariance if rotation_covariance is not None else UNKNOWN_VARIANCE * np.identity(3)
+    return covariance
+
+
+def rotate_pose_covariance(covariance, rotation_matrix):
+    # type: (np.ndarray, np.ndarray)->np.ndarray
+    u"""
+    The 6x6 covariance of a pose with its rotation part expressed in another frame, rotated by
+    rotation_matrix (the drone rotation to go from the drone frame to the arena frame).
+    """
+    rotation = np.identity(6)
+    rotation[3:6, 3:6] = rotation_matrix
+    return np.dot(np.dot(rotation, covariance), rotation.T)
+
+
+def rays_in_arena(bearings, landmarks, camera_indices, camera_translations, camera_rotations, rotation_matrix):
+    # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)->tuple[np.ndarray, np.ndarray]
+    u"""
+    With the drone rotation known, every correspondence constrains the drone position to a line :
+    position = points - lambda * directions.
+    :param bearings: size:(x, 3)
+    :param landmarks: the arena points of the bearings, size:(x, 3)
+    :param camera_indices: the camera of every bearing, size:(x,)
+    :param camera_translations: size:(c, 3)
+    :param camera_rotations: size:(c, 3, 3)
+    :param rotation_matrix: the rotation of the drone in the arena, size:(3, 3)
+    :return: the points and unit directions of the lines, both size:(x, 3)
+    """
+    offsets = np.dot(camera_translations, rotation_matrix.T)[camera_indices]
+    camera_to_arena = np.matmul(rotation_matrix, camera_rotations)[camera_indices]
+    directions = np.einsum('ijk,ik->ij', camera_to_arena, bearings)
+    return landmarks - offsets, directions
+
+
+def translation_from_rays(points, directions, weights=None):
+    # type: (np.ndarray, np.ndarray, np.ndarray)->tuple[np.ndarray, np.ndarray]
+    u"""
+    Least squares position closest to all the lines. Any number of leading dimensions is
+    solved at once, so a whole batch of hypotheses is a single call.
+    :param points: size:(..., x, 3)
+    :param directions: unit directions, size:(..., x, 3)
+    :param weights: the weight of every line, size:(..., x), or None
+    :return: the positions size:(..., 3) and the normal matrices sum(w * (I - d.d^T)) size:(..., 3, 3)
+    """
+    projections = np.identity(3) - directions[..., :, np.newaxis] * directions[..., np.newaxis, :]
+    if weights is not None:
+        projections = projections * weights[..., np.newaxis, np.newaxis]
+    normal_matrices = np.sum(projections, axis=-3)
+    right_hand_sides = np.einsum('...ijk,...ik->...j', projections, points)
+    # Regularized so degenerate samples (parallel lines) give a bad hypothesis instead of an error
+    positions = np.linalg.solve(normal_matrices + 1e-9 * np.identity(3), right_hand_sides[..., np.newaxis])[..., 0]
+    return positions, normal_matrices
+
+
+def ray_angular_errors(positions, points, directions):
+    # type: (np.ndarray, np.ndarray, np.ndarray)->np.ndarray
+    u"""
+    1 - cos of the angle between every line direction and the direction from every hypothesis
+    position to the line point.
+    :param positions: the hypotheses, size:(k, 3)
+    :param points: size:(x, 3)
+    :param directions: size:(x, 3)
+    :return: the errors, size:(k, x)
+    """
+    deltas = points[np.newaxis, :, :] - positions[:, np.newaxis, :]
+    cosines = np.einsum('kij,ij->ki', deltas, directions) / np.sqrt(np.einsum('kij,kij->ki', deltas, deltas))
+    return 1 - cosines
+
+
+def inverse_square_distances(position, points, min_distance=0.1):
+    # type: (np.ndarray, np.ndarray, float)->np.ndarray
+    u"""
+    Weights of lines, the lateral error of a line grows with the distance to its point.
+    :param min_distance: the distances are floored to it, a point at the position does not get an
+     infinite weight
+    """
+    deltas = points - position
+    return 1 / np.maximum(np.einsum('ij,ij->i', deltas, deltas), min_distance ** 2)
+
+
+def robust_weights(residuals, scale, loss="huber"):
+    # type: (np.ndarray, float, str)->np.ndarray
+    u"""
+    IRLS weights of residual norms.
+    :param scale: the residual where the loss stops being quadratic ("huber") or where the
+     weight reaches 0 ("tukey")
+    """
+    if loss == "huber":
+        return scale / np.maximum(residuals, scale)
+    if loss == "tukey":
+        return np.square(np.maximum(1 - np.square(residuals / scale), 0))
+    raise ValueError("unknown robust loss '{0}'".format(loss))
+
+
+def robust_translation(deltas, prior_weights=None, scale=0.1, loss="huber", max_iterations=10, tolerance=1e-6):
+    # type: (np.ndarray, np.ndarray, float, str, int, float)->tuple[np.ndarray, np.ndarray, np.ndarray]
+    u"""
+    Robust weighted mean of the deltas between detected and matched points, by IRLS from their
+    median, so that a few mismatched points do not pull the translation.
+    :param deltas: size:(x, 3)
+    :param prior_weights: the weight of every delta before the robust weights, size:(x,), or None
+    :return: the translation size:(3,), its covariance size:(3, 3) and the final weights size:(x,),
+     or None if there is no delta or every weight is 0
+    """
+    if deltas.shape[0] == 0:
+        return None
+    if prior_weights is None:
+        prior_weights = np.ones((deltas.shape[0],))
+
+    translation = np.median(deltas, axis=0)
+    for _ in xrange(max_iterations):
+        residuals = deltas - translation
+        weights = prior_weights * robust_weights(np.sqrt(np.einsum('ij,ij->i', residuals, residuals)), scale, loss)
+        weights_sum = np.sum(weights)
+        if not weights_sum > 0:
+            return None
+        previous_translation = translation
+        translation = np.dot(weights, deltas) / weights_sum
+        if np.sum(np.square(translation - previous_translation)) < tolerance ** 2:
+            break
+
+    # Sandwich covariance of a weighted mean, floored by the loss scale for small samples
+    residuals = deltas - translation
+    normalized_weights = weights / weights_sum
+    covariance = np.einsum('i,ij,ik->jk', np.square(normalized_weights), residuals, residuals)
+    covariance += np.sum(np.square(normalized_weights)) * scale ** 2 * np.identity(3) / 3
+    return translation, covariance, weights
+
+
+def ransac_translation(points, directions, threshold, confidence=0.99, max_hypotheses=500, batch_size=100,
+                       sample_size=2, local_optimization_steps=2, angular_sigma=None, random_state=np.random):
+    # type: (np.ndarray, np.ndarray, float, float, int, int, int, int, float, np.random.RandomState)->tuple[np.ndarray, np.ndarray, np.ndarray]
+    u"""
+    LO-RANSAC of the drone position from the lines of rays_in_arena.
+    Hypotheses are the position closest to `sample_size` random lines (2 is the minimal sample).
+    They are generated and scored batch_size at a time against every line with
+    ray_angular_errors, and sampling stops as soon as the number of hypotheses drawn
+    reaches the usual bound for the best inlier ratio and confidence. The best hypothesis is then
+    refined on its inliers, with the lines weighted by the inverse of their squared length.
+    :param threshold: the maximal angle (rad) between an inlier line and its predicted direction
+    :param angular_sigma: the standard deviation (rad) of the bearings, for the covariance.
+     Estimated from the inliers if None.
+    :return: the position size:(3,), its covariance size:(3, 3) and the inliers mask size:(x,),
+     or None if there are less than sample_size lines
+    """
+    lines_number = points.shape[0]
+    if lines_number < sample_size:
+        return None
+
+    error_threshold = 1 - math.cos(threshold)
+    best_position = None
+    best_inliers = None
+    best_score = -1
+    hypotheses_drawn = 0
+    hypotheses_needed = max_hypotheses
+
+    while hypotheses_drawn < min(hypotheses_needed, max_hypotheses):
+        samples = np.argpartition(random_state.random_sample((batch_size, lines_number)), sample_size - 1, axis=1)[:, 0:sample_size]
+        positions = translation_from_rays(points[samples], directions[samples])[0]
+        inliers = ray_angular_errors(positions, points, directions) <= error_threshold
+        scores = np.count_nonzero(inliers, axis=1)
+        hypotheses_drawn += batch_size
+
+        best_in_batch = np.argmax(scores)
+        if scores[best_in_batch] > best_score:
+            best_score = scores[best_in_batch]
+            best_position = positions[best_in_batch]
+            best_inliers = inliers[best_in_batch]
+
+            inlier_ratio = float(best_score) / lines_number
+            if inlier_ratio >= 1:
+                break
+            if inlier_ratio > 0:
+                hypotheses_needed = math.log(1 - confidence) / math.log(1 - inlier_ratio ** sample_size)
+
+    if best_score < sample_size:
+        return None
+
+    # Local optimization : weighted least squares on the inliers, until the inliers do not change
+    position, inliers = best_position, best_inliers
+    for _ in xrange(local_optimization_steps):
+        if np.count_nonzero(inliers) < sample_size:
+            break
+        candidate = translation_from_rays(points[inliers], directions[inliers], inverse_square_distances(position, points[inliers]))[0]
+        candidate_inliers = ray_angular_errors(candidate[np.newaxis], points, directions)[0] <= error_threshold
+        if np.count_nonzero(candidate_inliers) < np.count_nonzero(inliers):
+            break
+        converged = np.array_equal(candidate_inliers, inliers)
+        position, inliers = candidate, candidate_inliers
+        if converged:
+            break
+
+    normal_matrix = translation_from_rays(points[inliers], directions[inliers], inverse_square_distances(position, points[inliers]))[1]
+
+    if angular_sigma is None:
+        errors = ray_angular_errors(position[np.newaxis], points[inliers], directions[inliers])[0]
+        # 1 - cos(a) ~ a^2 / 2
+        angular_sigma = math.sqrt(max(2 * np.mean(errors), 1e-12))
+    covariance = angular_sigma ** 2 * np.linalg.pinv(normal_matrix)
+
+    return position, covariance, inliers
+
+
+def _skew(vectors):
+    # type: (np.ndarray)->np.ndarray
+    u"""
+    Cross product matrices of vectors size:(x, 3), size:(x, 3, 3).
+    """
+    matrices = np.zeros(vectors.shape[:-1] + (3, 3))
+    matrices[..., 0, 1] = -vectors[..., 2]
+    matrices[..., 0, 2] = vectors[..., 1]
+    matrices[..., 1, 0] = vectors[..., 2]
+    matrices[..., 1, 2] = -vectors[..., 0]
+    matrices[..., 2, 0] = -vectors[..., 1]
+    matrices[..., 2, 1] = vectors[..., 0]
+    return matrices
+
+
+def rotation_matrix_from_vector(rotation_vector):
+    # type: (np.ndarray)->np.ndarray
+    u"""
+    Rodrigues' formula, exp([rotation_vector]x).
+    """
+    angle = np.sqrt(np.dot(rotation_vector, rotation_vector))
+    skew = _skew(rotation_vector)
+    if angle < 1e-12:
+        return np.identity(3) + skew
+    return np.identity(3) + math.sin(angle) / angle * skew + (1 - math.cos(angle)) / angle ** 2 * np.dot(skew, skew)
+
+
+def rotation_vector_from_matrix(rotation_matrix):
+    # type: (np.ndarray)->np.ndarray
+    u"""
+    Inverse of rotation_matrix_from_vector, the rotation vector of angle in [0, pi].
+    """
+    angle = math.acos(min(max((np.trace(rotation_matrix) - 1) / 2, -1.0), 1.0))
+    # sin(angle) * axis
+    sine_axis = np.array([
+        rotation_matrix[2, 1] - rotation_matrix[1, 2],
+        rotation_matrix[0, 2] - rotation_matrix[2, 0],
+        rotation_matrix[1, 0] - rotation_matrix[0, 1]
+    ]) / 2
+    if angle < 1e-6:
+        return sine_axis
+    if math.pi - angle < 1e-6:
+        # The axis is the dominant column of (R + I) / 2 = axis.axis^T
+        symmetric = (rotation_matrix + np.identity(3)) / 2
+        axis = symmetric[:, np.argmax(np.diag(symmetric))]
+        return angle * axis / np.linalg.norm(axis)
+    return angle / math.sin(angle) * sine_axis
+
+
+def bearing_residuals(bearings, landmarks, camera_indices, camera_translations, camera_rotations, translation, rotation_matrix):
+    # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)->tuple[np.ndarray, np.ndarray]
+    u"""
+    Difference between the predicted and observed bearings, and the jacobian of the predicted
+    bearings with respect to the pose perturbation (dx, dy, dz, d_theta) where the rotation becomes
+    rotation_matrix.exp([d_theta]x).
+    :return: the residuals size:(x, 3) and the jacobians size:(x, 3, 6)
+    """
+    points_fcu = np.dot(landmarks - translation, rotation_matrix)
+    arena_to_camera = camera_rotations.transpose((0, 2, 1))[camera_indices]
+    points_camera = np.einsum('ijk,ik->ij', arena_to_camera, points_fcu - camera_translations[camera_indices])
+    distances = np.sqrt(np.einsum('ij,ij->i', points_camera, points_camera))
+    predicted = points_camera / distances[:, np.newaxis]
+
+    # d(predicted)/d(points_camera) . d(points_camera)/d(points_fcu)
+    normalization = (np.identity(3) - predicted[:, :, np.newaxis] * predicted[:, np.newaxis, :]) / distances[:, np.newaxis, np.newaxis]
+    projection = np.matmul(normalization, arena_to_camera)
+
+    jacobians = np.empty(bearings.shape + (6,))
+    jacobians[:, :, 0:3] = -np.matmul(projection, rotation_matrix.T)
+    jacobians[:, :, 3:6] = np.matmul(projection, _skew(points_fcu))
+    return predicted - bearings, jacobians
+
+
+def refine_pose(bearings, landmarks, camera_indices, camera_translations, camera_rotations, translation, rotation_matrix,
+                max_iterations=5, tolerance=1e-6, huber_threshold=0.01, prior=None, bearing_variance=None):
+    # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, int, float, float, tuple[np.ndarray, np.ndarray, np.ndarray], float)->tuple[np.ndarray, np.ndarray, np.ndarray, int]
+    u"""
+    Gauss-Newton on the bearing residuals, from the given pose. Starting from the previous pose of
+    the drone, it usually converges in 1 or 2 iterations.
+    :param huber_threshold: residuals above it are down-weighted (Huber loss), None for plain least squares
+    :param prior: the translation, rotation matrix and 6x6 information matrix of a prior on the pose,
+     for the perturbation of bearing_residuals (rotation in the drone frame). None for no prior.
+    :param bearing_variance: the variance of a bearing residual, needed with a prior. If None, it is
+     estimated from the residuals.
+    :return: the translation, the rotation matrix, the 6x6 covariance of the pose (rotation in the
+     arena frame) and the number of iterations, or None if there are too few bearings or it did not converge
+    """
+    if bearings.shape[0] < (1 if prior is not None else 3):
+        return None
+    measurement_weight = 1.0 / bearing_variance if bearing_variance is not None else 1.0
+
+    for iteration in xrange(1, max_iterations + 1):
+        residuals, jacobians = bearing_residuals(
+            bearings, landmarks, camera_indices, camera_translations, camera_rotations, translation, rotation_matrix
+        )
+        residual_norms = np.sqrt(np.einsum('ij,ij->i', residuals, residuals))
+        weights = np.ones(residual_norms.shape)
+        if huber_threshold is not None:
+            large = residual_norms > huber_threshold
+            weights[large] = huber_threshold / residual_norms[large]
+
+        weighted_jacobians = jacobians * weights[:, np.newaxis, np.newaxis]
+        hessian = measurement_weight * np.einsum('nki,nkj->ij', weighted_jacobians, jacobians)
+        gradient = measurement_weight * np.einsum('nki,nk->i', weighted_jacobians, residuals)
+        if prior is not None:
+            prior_translation, prior_rotation_matrix, prior_information = prior
+            prior_error = np.concatenate([
+                translation - prior_translation,
+                rotation_vector_from_matrix(np.dot(prior_rotation_matrix.T, rotation_matrix))
+            ])
+            hessian = hessian + prior_information
+            gradient = gradient + np.dot(prior_information, prior_error)
+        try:
+            step = -np.linalg.solve(hessian, gradient)
+        except np.linalg.LinAlgError:
+            return None
+
+        translation = translation + step[0:3]
+        rotation_matrix = np.dot(rotation_matrix, rotation_matrix_from_vector(step[3:6]))
+        if np.dot(step, step) < tolerance ** 2:
+            break
+    else:
+        return None
+
+    if bearing_variance is not None:
+        covariance = np.linalg.inv(hessian)
+    else:
+        # Every bearing residual has two degrees of freedom
+        variance = np.sum(weights * residual_norms ** 2) / max(2 * bearings.shape[0] - 6, 1)
+        covariance = variance * np.linalg.inv(hessian)
+    covariance = rotate_pose_covariance(covariance, rotation_matrix)
+
+    return translation, rotation_matrix, covariance, iteration
+
+
+class IncrementalPoseEstimator(object):
+    u"""
+    Keeps the last pose and refines it with refine_pose on every new frame.
+    It must be seeded (with reset) by a closed form estimator on cold start and after a failure.
+    """
+    def __init__(self, max_iterations=5, max_angular_error=0.02, huber_threshold=0.01):
+        self.max_iterations = max_iterations
+        self.max_angular_error = max_angular_error
+        self.huber_threshold = huber_threshold
+        self.translation = None
+        self.rotation_matrix = None
+
+    def reset(self, translation=None, rotation_matrix=None):
+        # type: (np.ndarray, np.ndarray)->None
+        self.translation = translation
+        self.rotation_matrix = rotation_matrix
+
+    def is_seeded(self):
+        return self.translation is not None
+
+    def estimate(self, bearings, landmarks, camera_indices, camera_translations, camera_rotations):
+        # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)->tuple[np.ndarray, np.ndarray, np.ndarray]
+        u"""
+        :return: the translation, rotation matrix and covariance of the pose, or None if the
+         estimator is not seeded, did not converge, or the result does not explain the bearings.
+         The estimator is unseeded on failure.
+        """
+        if not self.is_seeded():
+            return None
+        result = refine_pose(
+            bearings, landmarks, camera_indices, camera_translations, camera_rotations,
+            self.translation, self.rotation_matrix,
+            max_iterations=self.max_iterations, huber_threshold=self.huber_threshold
+        )
+        if result is not None:
+            residuals = bearing_residuals(bearings, landmarks, camera_indices, camera_translations, camera_rotations, result[0], result[1])[0]
+            # |u - b| = 2 sin(angle / 2)
+            if np.median(np.sqrt(np.einsum('ij,ij->i', residuals, residuals))) > 2 * math.sin(self.max_angular_error / 2):
+                result = None
+
+        if result is None:
+            self.reset()
+            return None
+        self.reset(result[0], result[1])
+        return result[0:3]
+
+
+# Covariance given to a seed whose estimator does not give one
+DEFAULT_SEED_COVARIANCE = np.diag([1.0, 1.0, 1.0, 0.1, 0.1, 0.1])
+
+
+class SequentialPoseFilter(object):
+    u"""
+    Streaming fusion : the pose is updated by the bearings of one camera at a time, at the stamp of
+    its frame, instead of by the bundle of every camera. Between two updates, the pose follows the
+    motion of the FCU odometry and its uncertainty grows with the elapsed time. The update is an
+    iterated Kalman update : Gauss-Newton on the bearing residuals, with the predicted pose as prior.
+
+    The covariance is the one of the perturbation of bearing_residuals, with the rotation in the
+    drone frame. It must be seeded by another estimator on cold start and after a failure.
+    """
+    def __init__(self, bearing_noise=0.005, translation_noise=0.05, rotation_noise=0.01, max_gap=1.0,
+                 max_iterations=5, max_angular_error=0.02, huber_threshold=0.01):
+        u"""
+        :param bearing_noise: the standard deviation of a bearing residual
+        :param translation_noise: the drift of the odometry position, in m/sqrt(s)
+        :param rotation_noise: the drift of the odometry rotation, in rad/sqrt(s)
+        :param max_gap: the filter is unseeded when an update is further than this (s) from the last one
+        """
+        self.bearing_noise = bearing_noise
+        self.translation_noise = translation_noise
+        self.rotation_noise = rotation_noise
+        self.max_gap = max_gap
+        self.max_iterations = max_iterations
+        self.max_angular_error = max_angular_error
+        self.huber_threshold = huber_threshold
+        self.reset()
+
+    def reset(self):
+        self.stamp = None
+        self.fcu_translation = None
+        self.fcu_rotation_matrix = None
+        self.translation = None
+        self.rotation_matrix = None
+        self.covariance = None
+
+    def is_seeded(self):
+        return self.translation is not None
+
+    def seed(self, stamp, fcu_translation, fcu_rotation_matrix, translation, rotation_matrix, covariance=None):
+        # type: (float, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)->None
+        u"""
+        :param stamp: the time of the pose, in seconds
+        :param fcu_translation: the pose of the FCU at stamp, that the next predictions start from
+        :param covariance: the 6x6 covariance of the pose, rotation in the arena frame like the one
+         of refine_pose, DEFAULT_SEED_COVARIANCE if None
+        """
+        if covariance is None:
+            covariance = DEFAULT_SEED_COVARIANCE
+        self.stamp = stamp
+        self.fcu_translation = fcu_translation
+        self.fcu_rotation_matrix = fcu_rotation_matrix
+        self.translation = translation
+        self.rotation_matrix = rotation_matrix
+        self.covariance = rotate_pose_covariance(covariance, rotation_matrix.T)
+
+    def predict(self, stamp, fcu_translation, fcu_rotation_matrix):
+        # type: (float, np.ndarray, np.ndarray)->bool
+        u"""
+        Moves the pose by the motion of the FCU since the last update, forward or backward in time.
+        :return: False, and the filter is unseeded, if it is not seeded or the gap is over max_gap
+        """
+        if not self.is_seeded():
+            return False
+        elapsed = abs(stamp - self.stamp)
+        if elapsed > self.max_gap:
+            self.reset()
+            return False
+
+        # The motion in the frame of the FCU at the last update
+        delta_rotation = np.dot(self.fcu_rotation_matrix.T, fcu_rotation_matrix)
+        delta_translation = np.dot(self.fcu_rotation_matrix.T, fcu_translation - self.fcu_translation)
+
+        jacobian = np.identity(6)
+        jacobian[0:3, 3:6] = -np.dot(self.rotation_matrix, _skew(delta_translation))
+        jacobian[3:6, 3:6] = delta_rotation.T
+        process_noise = np.diag(
+            [self.translation_noise ** 2] * 3 + [self.rotation_noise ** 2] * 3
+        ) * elapsed
+
+        self.translation = self.translation + np.dot(self.rotation_matrix, delta_translation)
+        self.rotation_matrix = np.dot(self.rotation_matrix, delta_rotation)
+        self.covariance = np.dot(np.dot(jacobian, self.covariance), jacobian.T) + process_noise
+        self.stamp = stamp
+        self.fcu_translation = fcu_translation
+        self.fcu_rotation_matrix = fcu_rotation_matrix
+        return True
+
+    def update(self, bearings, landmarks, camera_indices, camera_translations, camera_rotations):
+        # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)->bool
+        u"""
+        Corrects the predicted pose with the bearings of a frame, of any number of cameras.
+        :return: False, and the filter is unseeded, if it is not seeded, did not converge, or the
+         result does not explain the bearings
+        """
+        if not self.is_seeded() or bearings.shape[0] == 0:
+            return False
+
+        result = refine_pose(
+            bearings, landmarks, camera_indices, camera_translations, camera_rotations,
+            self.translation, self.rotation_matrix,
+            max_iterations=self.max_iterations, huber_threshold=self.huber_threshold,
+            prior=(self.translation, self.rotation_matrix, np.linalg.inv(self.covariance)),
+            bearing_variance=self.bearing_noise ** 2
+        )
+        if result is None:
+            self.reset()
+            return False
+        translation, rotation_matrix, covariance, _ = result
+
+        residuals = bearing_residuals(bearings, landmarks, camera_indices, camera_translations, camera_rotations, translation, rotation_matrix)[0]
+        # |u - b| = 2 sin(angle / 2)
+        if np.median(np.sqrt(np.einsum('ij,ij->i', residuals, residuals))) > 2 * math.sin(self.max_angular_error / 2):
+            self.reset()
+            return False
+
+        self.translation = translation
+        self.rotation_matrix = rotation_matrix
+        self.covariance = rotate_pose_covariance(covariance, rotation_matrix.T)
+        return True
+
+    def arena_covariance(self):
+        # type: ()->np.ndarray
+        u"""
+        The covariance of the pose with the rotation in the arena frame, like the one of refine_pose.
+        """
+        return rotate_pose_covariance(self.covariance, self.rotation_matrix)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Output of the drone pose, sent by a dedicated thread so the estimation never waits on the sockets.
+"""
+import threading
+
+import numpy as np
+
+import rospy
+from geometry_msgs.msg import PoseWithCovarianceStamped
+from geometry_msgs.msg import TransformStamped
+
+import pose_estimators
+
+# Covariance sent when the estimator did not give one
+UNKNOWN_COVARIANCE = tuple((pose_estimators.UNKNOWN_VARIANCE * np.identity(6)).ravel())
+
+
+class PoseOutput(object):
+    u"""
+    Sends the latest pose as a tf from parent_frame to child_frame and, optionally, as
+    PoseWithCovarianceStamped and Odometry messages. The messages are built once with their frames,
+    only the stamp and the pose are filled for every output.
+    submit only puts the pose in a single-slot mailbox : a pose not yet sent when a newer one is
+    submitted is replaced, the output never lags behind the estimation.
+    """
+    def __init__(self, broadcaster, parent_frame, child_frame, pose_publisher=None, odometry_publisher=None, instruments=None):
+        # type: (tf.TransformBroadcaster, str, str, rospy.Publisher, rospy.Publisher, instrumentation.Instrumentation)->None
+        self.broadcaster = broadcaster
+        self.pose_publisher = pose_publisher
+        self.odometry_publisher = odometry_publisher
+        # If given, records the "send" stage and the "stamp_to_publish" latency
+        self.instruments = instruments
+        self.replaced_poses = 0
+
+        self._transform = TransformStamped()
+        self._transform.header.frame_id = parent_frame
+        self._transform.child_frame_id = child_frame
+        self._pose = None
+        if pose_publisher is not None:
+            self._pose = PoseWithCovarianceStamped()
+            self._pose.header.frame_id = parent_frame
+        self._odometry = None
+        if odometry_publisher is not None:
+            # nav_msgs is only loaded when the odometry is published
+            from nav_msgs.msg import Odometry
+            self._odometry = Odometry()
+            self._odometry.header.frame_id = parent_frame
+            self._odometry.child_frame_id = child_frame
+
+        self._mailbox = None
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="pose_output")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, translation, rotation, stamp, covariance=None):
+        # type: (np.ndarray, quaternion.quaternion, rospy.Time, np.ndarray)->None
+        u"""
+        :param translation: size:(3,)
+        :param rotation: the rotation quaternion
+        :param stamp: the time of the pose
+        :param covariance: the 6x6 covariance of the pose, or None if unknown
+        """
+        with self._condition:
+            if self._mailbox is not None:
+                self.replaced_poses += 1
+            self._mailbox = (translation, rotation, stamp, covariance)
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._mailbox is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                pose = self._mailbox
+                self._mailbox = None
+            send_start = self.instruments.now() if self.instruments is not None else None
+            try:
+                self.send(*pose)
+            except rospy.ROSException as e:
+                rospy.logwarn_throttle(5, "Pose output failed: {0}".format(e))
+            if self.instruments is not None:
+                self.instruments.lap("send", send_start)
+                self.instruments.record("stamp_to_publish", (rospy.Time.now() - pose[2]).to_sec())
+
+    def send(self, translation, rotation, stamp, covariance=None):
+        # type: (np.ndarray, quaternion.quaternion, rospy.Time, np.ndarray)->None
+        u"""
+        Sends a pose right away, from the calling thread.
+        """
+        x, y, z = float(translation[0]), float(translation[1]), float(translation[2])
+
+        self._transform.header.stamp = stamp
+        transform_translation = self._transform.transform.translation
+        transform_translation.x, transform_translation.y, transform_translation.z = x, y, z
+        transform_rotation = self._transform.transform.rotation
+        transform_rotation.x, transform_rotation.y, transform_rotation.z, transform_rotation.w = rotation.x, rotation.y, rotation.z, rotation.w
+        self.broadcaster.sendTransformMessage(self._transform)
+
+        if self.pose_publisher is None and self.odometry_publisher is None:
+            return
+        covariance = tuple(np.ravel(covariance)) if covariance is not None else UNKNOWN_COVARIANCE
+        for message, publisher in ((self._pose, self.pose_publisher), (self._odometry, self.odometry_publisher)):
+            if publisher is None:
+                continue
+            message.header.stamp = stamp
+            position = message.pose.pose.position
+            position.x, position.y, position.z = x, y, z
+            orientation = message.pose.pose.orientation
+            orientation.x, orientation.y, orientation.z, orientation.w = rotation.x, rotation.y, rotation.z, rotation.w
+            message.pose.covariance = covariance
+            publisher.publish(message)
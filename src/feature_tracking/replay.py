@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Replays a bag through the localization callback of fallback.py as fast as possible, without a ROS
+master, then reports the frame rate, the latency of every stage and the error of the poses against
+the ground truth.
+Usage : replay.py input.bag [--config cfg/feature_tracking.yaml] [--param pose_estimator=ransac]
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+import quaternion
+import yaml
+
+import rosbag
+import rospy
+import tf
+import message_filters
+
+import debug_output
+import fallback
+import localizer
+import transform_cache
+from transform_buffer import TransformBuffer
+
+
+class OfflineTransformer(tf.Transformer):
+    u"""
+    tf.Transformer filled from the bag. Every transform that will ever be available already is,
+    so waiting for one fails immediately instead of sleeping on the stopped clock.
+    """
+    def waitForTransform(self, target_frame, source_frame, time, timeout, polling_sleep_duration=None):
+        if not self.canTransform(target_frame, source_frame, time):
+            raise tf.Exception("no transform from '{0}' to '{1}' at {2} in the bag".format(source_frame, target_frame, time))
+
+
+class RecordingOutput(object):
+    u"""
+    Takes the place of pose_output.PoseOutput, keeps every submitted pose.
+    """
+    def __init__(self):
+        self.poses = []
+
+    def submit(self, translation, rotation, stamp, covariance=None):
+        self.poses.append((stamp.to_sec(), np.array(translation), rotation, covariance))
+
+
+class NullPublisher(object):
+
+    def get_num_connections(self):
+        return 0
+
+    def publish(self, message):
+        pass
+
+
+class ReplayHarness(object):
+    u"""
+    Sets up fallback.py as init_node does, with the subscribers replaced by filters fed from the bag.
+    """
+    def __init__(self, parameters=None, ground_truth_topic="/ground_truth"):
+        # type: (dict, str)->None
+        parameters = parameters if parameters is not None else {}
+        configuration = localizer.Configuration(lambda name, default: parameters.get(name.lstrip("~"), default))
+
+        rospy.rostime.set_rostime_initialized(True)
+
+        self.camera_topics = {}
+        sources = []
+        for i in xrange(configuration.camera_number):
+            points_input = message_filters.SimpleFilter()
+            camera_info_input = message_filters.SimpleFilter()
+            self.camera_topics[(configuration.topic_localization_points_prefix + str(i)).strip("/")] = points_input
+            self.camera_topics[(configuration.topic_camera_info_prefix + str(i)).strip("/")] = camera_info_input
+            sources.append((points_input, camera_info_input))
+        self.ground_truth_topic = ground_truth_topic.strip("/")
+
+        self.global_state = fallback.GlobalState(configuration, sources)
+        fallback.connect_localization(self.global_state)
+
+        self.transformer = OfflineTransformer(True, rospy.Duration(3600))
+        self.static_transforms = []
+        self.ground_truth = TransformBuffer(capacity=100000)
+        self.output = RecordingOutput()
+
+        fallback.g_tf_cache = transform_cache.TransformCache(self.transformer)
+        fallback.g_pose_output = self.output
+        fallback.g_debug_publisher = debug_output.DebugPublisher(NullPublisher(), enabled=False)
+
+    def feed(self, topic, message, bag_time):
+        # type: (str, genpy.Message, rospy.Time)->None
+        u"""
+        Gives a message of the bag to the node, at the time it was recorded.
+        """
+        rospy.rostime._set_rostime(bag_time)
+        topic = topic.strip("/")
+
+        if topic == "tf":
+            for transform in message.transforms:
+                self.transformer.setTransform(transform)
+        elif topic == "tf_static":
+            self.static_transforms.extend(message.transforms)
+            for transform in message.transforms:
+                self.transformer.setTransform(transform)
+        elif topic == self.ground_truth_topic:
+            position = message.pose.position
+            orientation = message.pose.orientation
+            self.ground_truth.insert(
+                message.header.stamp.to_sec(),
+                np.array([position.x, position.y, position.z]),
+                quaternion.quaternion(orientation.w, orientation.x, orientation.y, orientation.z)
+            )
+        elif topic in self.camera_topics:
+            # tf1 has no static transforms, they are stamped again at the time of every frame
+            for transform in self.static_transforms:
+                transform.header.stamp = message.header.stamp
+                self.transformer.setTransform(transform)
+            self.camera_topics[topic].signalMessage(message)
+
+    def run(self, bag_path):
+        # type: (str)->float
+        u"""
+        :return: the wall time of the replay, in seconds
+        """
+        start = time.time()
+        with rosbag.Bag(bag_path) as bag:
+            for topic, message, bag_time in bag.read_messages():
+                self.feed(topic, message, bag_time)
+        return time.time() - start
+
+    def pose_errors(self):
+        # type: ()->tuple[np.ndarray, np.ndarray]
+        u"""
+        :return: the position errors (m) and rotation errors (rad) of the poses with a ground truth
+        """
+        position_errors = []
+        rotation_errors = []
+        for stamp, translation, rotation, _ in self.output.poses:
+            truth = self.ground_truth.lookup(stamp)
+            if truth is None:
+                continue
+            position_errors.append(np.linalg.norm(translation - truth[0]))
+            cos_half_angle = abs(np.dot(quaternion.as_float_array(rotation), quaternion.as_float_array(truth[1])))
+            rotation_errors.append(2 * math.acos(min(cos_half_angle, 1.0)))
+        return np.array(position_errors), np.array(rotation_errors)
+
+    def report(self, wall_time):
+        # type: (float)->str
+        instruments = self.global_state.instrumentation
+        frames = self.global_state.total_messages_processed
+        lines = ["{0} frames in {1:.2f} s : {2:.1f} frames/s".format(frames, wall_time, frames / wall_time if wall_time > 0 else 0.0)]
+        total = instruments.histograms.get("total")
+        if total is not None and total.total > 0:
+            lines.append("callback only : {0:.1f} frames/s".format(total.count / total.total))
+        lines.extend("  {0} : {1}".format(key, value) for key, value in instruments.summary())
+
+        position_errors, rotation_errors = self.pose_errors()
+        if position_errors.size > 0:
+            lines.append("position error (m) : median {0:.4f} p95 {1:.4f} max {2:.4f} over {3} poses".format(
+                np.median(position_errors), np.percentile(position_errors, 95), np.max(position_errors), position_errors.size
+            ))
+            lines.append("rotation error (rad) : median {0:.4f} p95 {1:.4f} max {2:.4f}".format(
+                np.median(rotation_errors), np.percentile(rotation_errors, 95), np.max(rotation_errors)
+            ))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a bag through the localization without a ROS master.")
+    parser.add_argument("bag")
+    parser.add_argument("--config", help="a yaml file of the node parameters, like cfg/feature_tracking.yaml")
+    parser.add_argument("--param", action="append", default=[], help="name=value, overrides the config")
+    parser.add_argument("--ground-truth-topic", default="/ground_truth")
+    arguments = parser.parse_args()
+
+    parameters = {}
+    if arguments.config:
+        with open(arguments.config) as config_file:
+            parameters.update(yaml.safe_load(config_file) or {})
+    for parameter in arguments.param:
+        name, value = parameter.split("=", 1)
+        parameters[name] = yaml.safe_load(value)
+
+    harness = ReplayHarness(parameters, arguments.ground_truth_topic)
+    wall_time = harness.run(arguments.bag)
+    print harness.report(wall_time)
+
+
+if __name__ == '__main__':
+    main()
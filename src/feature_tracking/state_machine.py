@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Event-driven state machine of the node. Nothing polls : a state only runs when an event is
+dispatched to it, by a message, a transform becoming available or one of its timers.
+
+A state is a function (context, event)->state, returning itself to stay. Entering a state
+dispatches the "enter" event to it, so it can arm its timers, and it may transition right away.
+Leaving it dispatches "exit", whose result is ignored, then cancels its timers.
+"""
+import collections
+import threading
+
+import instrumentation
+
+ENTER = "enter"
+EXIT = "exit"
+
+
+def state_name(state):
+    # type: (function)->str
+    name = state.__name__
+    return name[len("state_"):] if name.startswith("state_") else name
+
+
+class StateMachine(object):
+    u"""
+    Dispatches events to the current state, from any thread. The time spent in every state is
+    recorded in the "state.<name>" stages of the instrumentation, the time taken by a transition,
+    from the event to the end of the "enter" of the new state, in the "transition" stage, and every
+    transition is counted as "transition.<from>.<to>".
+    """
+    def __init__(self, context, schedule, instruments=None, history_size=20):
+        # type: (object, callable, instrumentation.Instrumentation, int)->None
+        u"""
+        :param context: given to the states, the GlobalState of the node
+        :param schedule: schedule(delay, callback, oneshot) calls callback without arguments after delay
+         seconds, from another thread, and then every delay seconds if not oneshot. It returns a
+         handle with a shutdown method, that cancels it.
+        :param instruments: where the timings are recorded, a new Instrumentation if None
+        :param history_size: the number of transitions kept in history
+        """
+        self.context = context
+        self.schedule = schedule
+        self.instrumentation = instruments if instruments is not None else instrumentation.Instrumentation()
+        self.state = None
+        self.state_start = None
+        # (time, from, to, event) of the latest transitions
+        self.history = collections.deque(maxlen=history_size)
+        self._timers = {}
+        self._timer_count = 0
+        self._lock = threading.RLock()
+
+    def start(self, initial_state):
+        # type: (function)->None
+        with self._lock:
+            self._transition(initial_state, ENTER, self.instrumentation.now())
+
+    def dispatch(self, event):
+        # type: (str)->None
+        u"""
+        Runs the current state with event, and enters the state it returns.
+        """
+        with self._lock:
+            if self.state is None:
+                return
+            event_time = self.instrumentation.now()
+            next_state = self.state(self.context, event)
+            if next_state is not self.state:
+                self._transition(next_state, event, event_time)
+
+    def set_timer(self, event, delay, oneshot=True):
+        # type: (str, float, bool)->None
+        u"""
+        Dispatches event after delay seconds, unless the current state is left before. Setting a
+        timer again replaces it.
+        :param oneshot: if False, event is dispatched every delay seconds until the timer is cancelled
+         or the state is left, from a single timer
+        """
+        with self._lock:
+            self.cancel_timer(event)
+            self._timer_count += 1
+            token = self._timer_count
+            handle = self.schedule(delay, lambda: self._fire(event, token), oneshot)
+            self._timers[event] = (handle, token, oneshot)
+
+    def cancel_timer(self, event):
+        # type: (str)->None
+        with self._lock:
+            timer = self._timers.pop(event, None)
+            if timer is not None:
+                timer[0].shutdown()
+
+    def time_in_state(self):
+        # type: ()->float
+        with self._lock:
+            return self.instrumentation.now() - self.state_start if self.state_start is not None else 0.0
+
+    def summary(self):
+        # type: ()->list[tuple[str, str]]
+        u"""
+        Key-value pairs of the current state and of the latest transition.
+        """
+        with self._lock:
+            values = [
+                ("state", state_name(self.state) if self.state is not None else "none"),
+                ("time_in_state", "{0:.3f} s".format(self.time_in_state())),
+            ]
+            if self.history:
+                transition_time, previous, current, event = self.history[-1]
+                values.append(("last_transition", "{0} -> {1} on {2}, {3:.3f} s ago".format(
+                    previous, current, event, self.instrumentation.now() - transition_time
+                )))
+            return values
+
+    def _fire(self, event, token):
+        with self._lock:
+            timer = self._timers.get(event)
+            # Cancelled or replaced while it was firing
+            if timer is None or timer[1] != token:
+                return
+            if timer[2]:
+                del self._timers[event]
+            self.dispatch(event)
+
+    def _transition(self, next_state, event, event_time):
+        # The "enter" of a state may transition again
+        while next_state is not self.state:
+            now = self.instrumentation.now()
+            previous_name = state_name(self.state) if self.state is not None else "none"
+            if self.state is not None:
+                self.state(self.context, EXIT)
+                self.instrumentation.record("state." + previous_name, now - self.state_start)
+            for timer_event in list(self._timers.keys()):
+                self.cancel_timer(timer_event)
+
+            self.state = next_state
+            self.state_start = now
+            self.history.append((now, previous_name, state_name(next_state), event))
+            self.instrumentation.increment("transition.{0}.{1}".format(previous_name, state_name(next_state)))
+
+            event = ENTER
+            next_state = self.state(self.context, ENTER)
+        self.instrumentation.record("transition", self.instrumentation.now() - event_time)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Writes a bag of what the localization node receives while the drone flies a circle over the grid
+of the arena (rendered by synthetic_scene) : the intersections and camera info of every camera, the
+tf of the FCU (with a slow drift) and of the cameras, and the true pose of the drone on /ground_truth.
+Usage : synthetic_bag.py output.bag [--frames 300] [--cameras 2] [--outlier-rate 0.1]
+"""
+import argparse
+
+import numpy as np
+import quaternion
+
+import rosbag
+import rospy
+from geometry_msgs.msg import PoseStamped
+from geometry_msgs.msg import TransformStamped
+from sensor_msgs.msg import CameraInfo
+from tf2_msgs.msg import TFMessage
+import elikos_msgs.msg as elikos_msgs
+
+import synthetic_scene
+
+ARENA_FRAME = "elikos_arena_origin"
+FCU_FRAME = "elikos_fcu"
+GROUND_TRUTH_TOPIC = "/ground_truth"
+IMAGE_WIDTH = 640
+IMAGE_HEIGHT = 480
+CAMERA_MATRIX = np.array([[300.0, 0, 320.0], [0, 300.0, 240.0], [0, 0, 1]])
+
+
+def camera_frame(i):
+    return "camera_{0}".format(i)
+
+
+def transform_message(parent_frame, child_frame, stamp, translation, rotation):
+    # type: (str, str, rospy.Time, np.ndarray, quaternion.quaternion)->TransformStamped
+    message = TransformStamped()
+    message.header.stamp = stamp
+    message.header.frame_id = parent_frame
+    message.child_frame_id = child_frame
+    message.transform.translation.x, message.transform.translation.y, message.transform.translation.z = translation
+    orientation = message.transform.rotation
+    orientation.w, orientation.x, orientation.y, orientation.z = quaternion.as_float_array(rotation)
+    return message
+
+
+def camera_info_message(frame, stamp):
+    # type: (str, rospy.Time)->CameraInfo
+    message = CameraInfo()
+    message.header.stamp = stamp
+    message.header.frame_id = frame
+    message.width = IMAGE_WIDTH
+    message.height = IMAGE_HEIGHT
+    message.distortion_model = "plumb_bob"
+    message.D = [0.0] * 5
+    message.K = CAMERA_MATRIX.ravel().tolist()
+    return message
+
+
+def intersections_message(frame, stamp, pixels, ground_points):
+    # type: (str, rospy.Time, np.ndarray, np.ndarray)->elikos_msgs.IntersectionArray
+    message = elikos_msgs.IntersectionArray()
+    message.header.stamp = stamp
+    message.header.frame_id = frame
+    for pixel, ground_point in zip(pixels.tolist(), ground_points.tolist()):
+        intersection = elikos_msgs.Intersection()
+        intersection.imagePosition.x, intersection.imagePosition.y = pixel
+        intersection.arenaPosition.x, intersection.arenaPosition.y, intersection.arenaPosition.z = ground_point
+        message.intersections.append(intersection)
+    return message
+
+
+def write_synthetic_bag(path, frames=300, rate=30.0, camera_number=2, pixel_noise=0.5, outlier_rate=0.0,
+                        timestamp_skew=0.0, topic_localization_points_prefix="localization/features_",
+                        topic_camera_info_prefix="localization/camera_info_", seed=0):
+    # type: (str, int, float, int, float, float, float, str, str, int)->None
+    u"""
+    :param path: the bag to write
+    :param frames: the number of frames of every camera
+    :param rate: the frames per second
+    :param pixel_noise: the standard deviation of the detected intersections, in pixels
+    :param outlier_rate: the mean number of false intersections for every true one
+    :param timestamp_skew: the stamp of every image is off by up to this many seconds
+    """
+    times = np.arange(frames) / rate
+    translations, rotation_matrices = synthetic_scene.circle_trajectory(times)
+    believed_translations = translations + synthetic_scene.odometry_drift(times)
+    camera_translations, camera_rotations = synthetic_scene.camera_ring(camera_number)
+    scene = synthetic_scene.SyntheticScene(
+        camera_translations, camera_rotations, CAMERA_MATRIX, IMAGE_WIDTH, IMAGE_HEIGHT,
+        pixel_noise=pixel_noise, outlier_rate=outlier_rate, timestamp_skew=timestamp_skew
+    )
+    rendered = scene.render(times, translations, rotation_matrices, believed_translations,
+                            random_state=np.random.RandomState(seed))
+    rotations = quaternion.from_rotation_matrix(rotation_matrices)
+    start_time = rospy.Time(1000)
+
+    with rosbag.Bag(path, "w") as bag:
+        static_transforms = TFMessage([
+            transform_message(FCU_FRAME, camera_frame(i), start_time, camera_translations[i],
+                              quaternion.from_rotation_matrix(camera_rotations[i]))
+            for i in xrange(camera_number)
+        ])
+        bag.write("/tf_static", static_transforms, start_time)
+
+        for frame in xrange(frames):
+            stamp = start_time + rospy.Duration.from_sec(times[frame])
+
+            # tf before the intersections of the same stamp, as when it is received first
+            bag.write(
+                "/tf",
+                TFMessage([transform_message(ARENA_FRAME, FCU_FRAME, stamp, believed_translations[frame], rotations[frame])]),
+                stamp - rospy.Duration(0, 1000000)
+            )
+
+            ground_truth = PoseStamped()
+            ground_truth.header.stamp = stamp
+            ground_truth.header.frame_id = ARENA_FRAME
+            ground_truth.pose.position.x, ground_truth.pose.position.y, ground_truth.pose.position.z = translations[frame]
+            orientation = ground_truth.pose.orientation
+            orientation.w, orientation.x, orientation.y, orientation.z = quaternion.as_float_array(rotations[frame])
+            bag.write(GROUND_TRUTH_TOPIC, ground_truth, stamp)
+
+            for i in xrange(camera_number):
+                pixels, ground_points, _ = rendered.camera_frame(frame, i)
+                camera_stamp = start_time + rospy.Duration.from_sec(rendered.stamps[frame, i])
+                bag.write(topic_camera_info_prefix + str(i), camera_info_message(camera_frame(i), camera_stamp), stamp)
+                bag.write(
+                    topic_localization_points_prefix + str(i),
+                    intersections_message(camera_frame(i), camera_stamp, pixels, ground_points),
+                    stamp
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a synthetic bag for the localization replay.")
+    parser.add_argument("output")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=30.0)
+    parser.add_argument("--cameras", type=int, default=2)
+    parser.add_argument("--pixel-noise", type=float, default=0.5)
+    parser.add_argument("--outlier-rate", type=float, default=0.0)
+    parser.add_argument("--timestamp-skew", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    write_synthetic_bag(
+        arguments.output,
+        frames=arguments.frames,
+        rate=arguments.rate,
+        camera_number=arguments.cameras,
+        pixel_noise=arguments.pixel_noise,
+        outlier_rate=arguments.outlier_rate,
+        timestamp_skew=arguments.timestamp_skew,
+        seed=arguments.seed
+    )
+
+
+if __name__ == '__main__':
+    main()
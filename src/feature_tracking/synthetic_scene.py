@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Synthetic sensor model of the localization : the intersections of the arena seen by N pinhole
+cameras under the drone, with field of view culling, pixel noise, false intersections and timestamp
+skew. Every frame of every camera is rendered at once with numpy, without ROS.
+
+The detections are given like input_localization_points receives them : for every camera, the
+pixels of the intersections and their position in the camera frame, found by intersecting the rays
+of the pixels with the ground using the pose believed by the FCU.
+"""
+import math
+
+import numpy as np
+import quaternion
+
+import point_manipulation as pt_manip
+import point_matching as pt_match
+
+
+def camera_ring(camera_number, tilt=0.3, radius=0.1, height=-0.05):
+    # type: (int, float, float, float)->tuple[np.ndarray, np.ndarray]
+    u"""
+    Cameras evenly spread around the FCU, looking down and tilted outwards (a single camera looks straight down).
+    :return: the translations size:(c, 3) and rotations size:(c, 3, 3) of the cameras in the fcu frame
+    """
+    yaws = 2 * math.pi * np.arange(camera_number) / camera_number
+    headings = quaternion.as_rotation_matrix(quaternion.from_rotation_vector(
+        np.stack([np.zeros(camera_number), np.zeros(camera_number), yaws], axis=1)
+    ))
+    tilts = quaternion.as_rotation_matrix(quaternion.from_rotation_vector([0, tilt if camera_number > 1 else 0, 0]))
+    # The optical frame, z forward and y down in the image, looking down from the fcu
+    looking_down = np.diag([1.0, -1.0, -1.0])
+
+    translations = np.dot(headings, [radius, 0, height])
+    rotations = np.matmul(np.matmul(headings, tilts), looking_down)
+    return translations, rotations
+
+
+def circle_trajectory(times, radius=3.0, altitude=1.5):
+    # type: (np.ndarray, float, float)->tuple[np.ndarray, np.ndarray]
+    u"""
+    The drone flies a circle, turning on itself, with small oscillations of altitude, roll and pitch.
+    :param times: size:(f,)
+    :return: the translations size:(f, 3) and rotation matrices size:(f, 3, 3) of the drone in the arena
+    """
+    angles = 0.3 * times
+    translations = np.stack([radius * np.cos(angles), radius * np.sin(angles), altitude + 0.2 * np.sin(0.5 * times)], axis=1)
+    rotation_vectors = np.stack([0.03 * np.sin(times), 0.02 * np.cos(times), angles + 0.5], axis=1)
+    return translations, quaternion.as_rotation_matrix(quaternion.from_rotation_vector(rotation_vectors))
+
+
+def odometry_drift(times):
+    # type: (np.ndarray)->np.ndarray
+    u"""
+    Error of the FCU position, slow like the one of an optical flow odometry, size:(f, 3).
+    """
+    return np.stack([0.15 * np.sin(0.1 * times), 0.1 * np.cos(0.07 * times) - 0.1, np.zeros(times.shape)], axis=1)
+
+
+class SyntheticFrames(object):
+    u"""
+    The detections of every frame and camera, sorted by frame then camera, in flat arrays.
+    """
+    def __init__(self, frames_number, camera_number, stamps, pixels, ground_points, frame_indices, camera_indices, landmark_indices):
+        self.frames_number = frames_number
+        self.camera_number = camera_number
+        # Time of the image of every camera, size:(f, c)
+        self.stamps = stamps
+        # size:(x, 2)
+        self.pixels = pixels
+        # Where the detection puts the intersection, in the camera frame, size:(x, 3)
+        self.ground_points = ground_points
+        # size:(x,)
+        self.frame_indices = frame_indices
+        self.camera_indices = camera_indices
+        # The landmark detected, -1 for false intersections, size:(x,)
+        self.landmark_indices = landmark_indices
+        self._offsets = np.searchsorted(
+            frame_indices * camera_number + camera_indices,
+            np.arange(frames_number * camera_number + 1)
+        )
+
+    def camera_frame(self, frame, camera):
+        # type: (int, int)->tuple[np.ndarray, np.ndarray, np.ndarray]
+        u"""
+        :return: the pixels, ground points and landmark indices of a camera in a frame
+        """
+        key = frame * self.camera_number + camera
+        detections = slice(self._offsets[key], self._offsets[key + 1])
+        return self.pixels[detections], self.ground_points[detections], self.landmark_indices[detections]
+
+    def frame(self, frame):
+        # type: (int)->list[tuple[np.ndarray, np.ndarray, np.ndarray]]
+        return [self.camera_frame(frame, camera) for camera in xrange(self.camera_number)]
+
+
+class SyntheticScene(object):
+    u"""
+    The landmarks of the arena seen by pinhole cameras without distortion, fixed on the drone.
+    """
+    def __init__(self, camera_translations, camera_rotations, camera_matrices, width=640, height=480,
+                 landmarks=None, pixel_noise=0.5, outlier_rate=0.0, timestamp_skew=0.0, min_depth=0.1):
+        # type: (np.ndarray, np.ndarray, np.ndarray, int, int, np.ndarray, float, float, float, float)->None
+        u"""
+        :param camera_translations: the position of every camera in the fcu frame, size:(c, 3)
+        :param camera_rotations: the rotation of every camera in the fcu frame, size:(c, 3, 3)
+        :param camera_matrices: the K matrix shared by all the cameras size:(3, 3), or of every camera size:(c, 3, 3)
+        :param landmarks: the intersections of the arena, create_grid_mesh(21, 20) if None
+        :param pixel_noise: the standard deviation of the detected pixels
+        :param outlier_rate: the mean number of false intersections for every true one
+        :param timestamp_skew: the stamp of every image is off by up to this many seconds
+        :param min_depth: the closest a landmark can be to be detected
+        """
+        self.camera_translations = np.asarray(camera_translations, dtype=np.float)
+        self.camera_rotations = np.asarray(camera_rotations, dtype=np.float)
+        self.camera_number = self.camera_translations.shape[0]
+        self.camera_matrices = np.broadcast_to(camera_matrices, (self.camera_number, 3, 3)).astype(np.float)
+        self.width = width
+        self.height = height
+        self.landmarks = landmarks if landmarks is not None else pt_match.create_grid_mesh(21, 20)
+        self.pixel_noise = pixel_noise
+        self.outlier_rate = outlier_rate
+        self.timestamp_skew = timestamp_skew
+        self.min_depth = min_depth
+
+    def render(self, times, translations, rotation_matrices, believed_translations=None, believed_rotation_matrices=None,
+               random_state=np.random):
+        # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.random.RandomState)->SyntheticFrames
+        u"""
+        :param times: the time of every frame, size:(f,)
+        :param translations: the true position of the drone in every frame, size:(f, 3)
+        :param rotation_matrices: the true rotation of the drone in every frame, size:(f, 3, 3)
+        :param believed_translations: the position known by the FCU, used to find the ground points.
+         The true one if None.
+        :param believed_rotation_matrices: the rotation known by the FCU, the true one if None
+        """
+        frames_number = times.shape[0]
+        if believed_translations is None:
+            believed_translations = translations
+        if believed_rotation_matrices is None:
+            believed_rotation_matrices = rotation_matrices
+
+        # Landmarks in every camera of every frame, size:(f, c, l, 3)
+        to_fcu_translations, to_fcu_rotations = pt_manip.invert_transforms(translations, rotation_matrices)
+        points_fcu = pt_manip.apply_transforms(to_fcu_translations, to_fcu_rotations, self.landmarks)
+        points_camera = np.matmul(
+            points_fcu[:, np.newaxis] - self.camera_translations[np.newaxis, :, np.newaxis],
+            self.camera_rotations[np.newaxis]
+        )
+        depths = points_camera[..., 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse_depths = 1 / depths
+        matrices = self.camera_matrices[np.newaxis, :, np.newaxis]
+        pixels = np.empty(points_camera.shape[:-1] + (2,))
+        pixels[..., 0] = matrices[..., 0, 0] * points_camera[..., 0] * inverse_depths + matrices[..., 0, 2]
+        pixels[..., 1] = matrices[..., 1, 1] * points_camera[..., 1] * inverse_depths + matrices[..., 1, 2]
+
+        visible = (depths > self.min_depth) & \
+            (pixels[..., 0] >= 0) & (pixels[..., 0] < self.width) & \
+            (pixels[..., 1] >= 0) & (pixels[..., 1] < self.height)
+        frame_indices, camera_indices, landmark_indices = np.nonzero(visible)
+        pixels = pixels[visible] + random_state.normal(0, self.pixel_noise, (frame_indices.shape[0], 2))
+
+        if self.outlier_rate > 0:
+            outliers_number = random_state.poisson(self.outlier_rate * frame_indices.shape[0])
+            outlier_keys = random_state.randint(0, frames_number * self.camera_number, outliers_number)
+            outlier_pixels = random_state.random_sample((outliers_number, 2)) * [self.width, self.height]
+            keys = np.concatenate([frame_indices * self.camera_number + camera_indices, outlier_keys])
+            order = np.argsort(keys, kind='mergesort')
+            frame_indices = (keys // self.camera_number)[order]
+            camera_indices = (keys % self.camera_number)[order]
+            landmark_indices = np.concatenate([landmark_indices, np.full((outliers_number,), -1, dtype=np.intp)])[order]
+            pixels = np.concatenate([pixels, outlier_pixels])[order]
+
+        ground_points, on_ground = self.ground_points(
+            pixels, frame_indices, camera_indices, believed_translations, believed_rotation_matrices
+        )
+
+        stamps = times[:, np.newaxis] + random_state.uniform(-self.timestamp_skew, self.timestamp_skew, (frames_number, self.camera_number))
+        return SyntheticFrames(
+            frames_number,
+            self.camera_number,
+            stamps,
+            pixels[on_ground],
+            ground_points[on_ground],
+            frame_indices[on_ground],
+            camera_indices[on_ground],
+            landmark_indices[on_ground]
+        )
+
+    def ground_points(self, pixels, frame_indices, camera_indices, translations, rotation_matrices):
+        # type: (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)->tuple[np.ndarray, np.ndarray]
+        u"""
+        Intersects the rays of the pixels with the ground (z = 0), as the detection does.
+        :return: the ground points in the camera frame size:(x, 3) and the mask of the rays that
+         reach the ground size:(x,)
+        """
+        matrices = self.camera_matrices[camera_indices]
+        rays = np.ones((pixels.shape[0], 3))
+        rays[:, 0] = (pixels[:, 0] - matrices[:, 0, 2]) / matrices[:, 0, 0]
+        rays[:, 1] = (pixels[:, 1] - matrices[:, 1, 2]) / matrices[:, 1, 1]
+
+        drone_rotations = rotation_matrices[frame_indices]
+        camera_heights = translations[frame_indices, 2] + np.einsum('ij,ij->i', drone_rotations[:, 2], self.camera_translations[camera_indices])
+        # z of the rays in the arena
+        ray_heights = np.einsum('ij,ijk,ik->i', drone_rotations[:, 2], self.camera_rotations[camera_indices], rays)
+        on_ground = ray_heights < 0
+        depths = np.where(on_ground, -camera_heights / np.where(on_ground, ray_heights, -1), 0)
+        return rays * depths[:, np.newaxis], on_ground
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Time indexed buffer of rigid transforms, with interpolation between the samples.
+"""
+import numpy as np
+import quaternion
+
+
+def slerp(q0, q1, tau):
+    # type: (np.ndarray, np.ndarray, float)->np.ndarray
+    u"""
+    Spherical interpolation between two unit quaternions given as [w, x, y, z] arrays.
+    tau = 0 gives q0, tau = 1 gives q1, other values interpolate or extrapolate.
+    """
+    cos_angle = np.dot(q0, q1)
+    if cos_angle < 0:
+        q1 = -q1
+        cos_angle = -cos_angle
+    if cos_angle > 0.9995:
+        # Almost the same rotation, a normalized lerp is precise enough and well conditioned
+        q = q0 + tau * (q1 - q0)
+        return q / np.sqrt(np.dot(q, q))
+    angle = np.arccos(cos_angle)
+    return (np.sin((1 - tau) * angle) * q0 + np.sin(tau * angle) * q1) / np.sin(angle)
+
+
+class TransformBuffer(object):
+    u"""
+    Ring buffer of the last `capacity` samples of a transform, sorted by time.
+    Samples are stored in a linear array twice the capacity, so the valid samples are always
+    contiguous and can be searched with np.searchsorted. When the end of the array is reached,
+    the samples are moved back to the beginning, once every `capacity` insertions.
+    """
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self._times = np.empty((2 * capacity,))
+        self._translations = np.empty((2 * capacity, 3))
+        self._rotations = np.empty((2 * capacity, 4))
+        self._begin = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._begin
+
+    def oldest_time(self):
+        return self._times[self._begin] if len(self) > 0 else None
+
+    def newest_time(self):
+        return self._times[self._end - 1] if len(self) > 0 else None
+
+    def insert(self, time, translation, rotation):
+        # type: (float, np.ndarray, quaternion.quaternion)->None
+        u"""
+        Inserts a sample. Samples older than the oldest kept sample of a full buffer are ignored,
+        a sample with the same time as an existing one replaces it.
+        :param time: the time of the sample, in seconds
+        :param translation: the translation, size:(3,)
+        :param rotation: the rotation
+        """
+        times = self._times[self._begin:self._end]
+        position = np.searchsorted(times, time)
+        if position < times.shape[0] and times[position] == time:
+            self._translations[self._begin + position] = translation
+            self._rotations[self._begin + position] = quaternion.as_float_array(rotation)
+            return
+        if len(self) == self.capacity:
+            if position == 0:
+                return
+            self._begin += 1
+            position -= 1
+        if self._end == self._times.shape[0]:
+            self._compact()
+
+        # Shift the newer samples by one to make room
+        index = self._begin + position
+        for array in (self._times, self._translations, self._rotations):
+            array[index + 1:self._end + 1] = array[index:self._end].copy()
+        self._times[index] = time
+        self._translations[index] = translation
+        self._rotations[index] = quaternion.as_float_array(rotation)
+        self._end += 1
+
+    def _compact(self):
+        size = len(self)
+        for array in (self._times, self._translations, self._rotations):
+            array[0:size] = array[self._begin:self._end]
+        self._begin = 0
+        self._end = size
+
+    def lookup(self, time, max_interval=None, max_extrapolation=0.0):
+        # type: (float, float, float)->tuple[np.ndarray, quaternion.quaternion]
+        u"""
+        Interpolates the transform at time.
+        :param time: the time, in seconds
+        :param max_interval: if not None, the maximal time between the two samples interpolated
+        :param max_extrapolation: how far after the newest sample the transform is extrapolated,
+         using the motion between the two newest samples
+        :return: the translation and rotation, or None if time is not between two samples of the buffer
+         or less than max_extrapolation after the newest one
+        """
+        times = self._times[self._begin:self._end]
+        position = np.searchsorted(times, time)
+        if position == times.shape[0]:
+            if position == 0 or time - times[-1] > max_extrapolation:
+                return None
+            if position == 1:
+                return self._translations[self._begin].copy(), quaternion.quaternion(*self._rotations[self._begin])
+            return self._interpolate(self._end - 2, self._end - 1, time)
+        index = self._begin + position
+        if times[position] == time:
+            return self._translations[index].copy(), quaternion.quaternion(*self._rotations[index])
+        if position == 0:
+            return None
+        if max_interval is not None and self._times[index] - self._times[index - 1] > max_interval:
+            return None
+
+        return self._interpolate(index - 1, index, time)
+
+    def _interpolate(self, before, after, time):
+        # type: (int, int, float)->tuple[np.ndarray, quaternion.quaternion]
+        tau = (time - self._times[before]) / (self._times[after] - self._times[before])
+        translation = self._translations[before] + tau * (self._translations[after] - self._translations[before])
+        rotation = slerp(self._rotations[before], self._rotations[after], tau)
+        return translation, quaternion.quaternion(*rotation)
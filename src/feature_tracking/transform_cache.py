@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-u
+u"""
+Cache in front of the tf listener. Static transforms are resolved once, dynamic
+transforms are interpolated from the samples already looked up when possible.
+"""
+import threading
+
+import numpy as np
+import quaternion
+
+import rospy
+import tf
+from geometry_msgs.msg import PoseStamped
+
+import point_manipulation as pt_manip
+from transform_buffer import TransformBuffer
+
+
+class TransformUnavailableException(Exception):
+    u"""
+    Exception thrown when a transform cannot be looked up.
+    """
+    def __init__(self, message="transform was unavailable", cause=None):
+        super(TransformUnavailableException, self).__init__(message + u', caused by ' + (repr(cause) if cause is not None else ''))
+        self.cause = cause
+
+
+class StaticTransform(pt_manip.RigidTransform):
+    u"""
+    A transform that never changes, with its rotation matrix already computed.
+    """
+    __slots__ = ()
+
+    def __init__(self, translation, rotation):
+        # type: (np.ndarray, quaternion.quaternion)->None
+        super(StaticTransform, self).__init__(translation, rotation, quaternion.as_rotation_matrix(rotation))
+
+
+class TransformCache(object):
+    u"""
+    Every transform from source_frame to dest_frame that is looked up is kept in a TransformBuffer.
+    A later lookup between two kept samples is interpolated without querying tf. Otherwise tf is
+    queried without blocking, and waitForTransform is only called as a last resort.
+    """
+    def __init__(self, listener, buffer_capacity=64, max_interpolation_interval=0.1):
+        # type: (tf.TransformListener, int, float)->None
+        self.listener = listener
+        self.buffer_capacity = buffer_capacity
+        self.max_interpolation_interval = max_interpolation_interval
+        self._static_transforms = {}
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def lookup_static(self, source_frame, dest_frame, timeout=rospy.Duration(1)):
+        # type: (str, str, rospy.Duration)->StaticTransform
+        u"""
+        Looks up a transform that never changes, like the extrinsics of a camera.
+        Only the first call for a pair of frames queries tf.
+        """
+        key = (source_frame, dest_frame)
+        static_transform = self._static_transforms.get(key)
+        if static_transform is None:
+            translation, rotation = self._lookup_tf(source_frame, dest_frame, rospy.Time(0), timeout)
+            static_transform = StaticTransform(translation, rotation)
+            self._static_transforms[key] = static_transform
+        return static_transform
+
+    def lookup(self, source_frame, dest_frame, time, timeout):
+        # type: (str, str, rospy.Time, rospy.Duration)->tuple[np.ndarray, quaternion.quaternion]
+        u"""
+        Looks up the transform from source_frame to dest_frame at time.
+        :return: the translation and rotation
+        :raise TransformUnavailableException: if the transform is still unavailable after timeout
+        """
+        key = (source_frame, dest_frame)
+        with self._lock:
+            transform_buffer = self._buffers.get(key)
+            if transform_buffer is None:
+                transform_buffer = TransformBuffer(self.buffer_capacity)
+                self._buffers[key] = transform_buffer
+            transform = transform_buffer.lookup(time.to_sec(), self.max_interpolation_interval)
+        if transform is not None:
+            return transform
+
+        translation, rotation = self._lookup_tf(source_frame, dest_frame, time, timeout)
+
+        # The latest sample lets the next lookups up to its time be interpolated.
+        latest_sample = None
+        try:
+            latest_time = self.listener.getLatestCommonTime(dest_frame, source_frame)
+            if latest_time > time:
+                latest_sample = (latest_time,) + self._lookup_tf(source_frame, dest_frame, latest_time, None)
+        except (tf.Exception, TransformUnavailableException):
+            pass
+
+        with self._lock:
+            transform_buffer.insert(time.to_sec(), translation, rotation)
+            if latest_sample is not None:
+                transform_buffer.insert(latest_sample[0].to_sec(), latest_sample[1], latest_sample[2])
+
+        return translation, rotation
+
+    def _lookup_tf(self, source_frame, dest_frame, time, timeout):
+        # type: (str, str, rospy.Time, rospy.Duration)->tuple[np.ndarray, quaternion.quaternion]
+        u"""
+        Queries tf, only waiting for the transform if it is not already available and timeout is not None.
+        """
+        try:
+            if not self.listener.canTransform(dest_frame, source_frame, time):
+                if timeout is None:
+                    raise TransformUnavailableException(message="Tf not available yet")
+                self.listener.waitForTransform(dest_frame, source_frame, time, timeout)
+            (trans, rot) = self.listener.lookupTransform(dest_frame, source_frame, time)
+        except tf.Exception as e:
+            raise TransformUnavailableException(message="Tf lookup failed", cause=e)
+        return np.array(trans), pt_manip.create_quaterion_from_tf(rot)
+
+
+class PoseStreamBuffer(object):
+    u"""
+    Subscribes to a geometry_msgs/PoseStamped stream (like the pose of the FCU) and keeps it in a
+    TransformBuffer, so the pose at a given time is answered immediately, without waiting on tf.
+    Poses in another frame than dest_frame are converted with the static transform between the two.
+    """
+    def __init__(self, topic, dest_frame, transform_cache, max_extrapolation=0.05, max_staleness=0.25, capacity=256):
+        # type: (str, str, TransformCache, float, float, int)->None
+        self.dest_frame = dest_frame
+        self.transform_cache = transform_cache
+        self.max_extrapolation = max_extrapolation
+        self.max_staleness = max_staleness
+        self._buffer = TransformBuffer(capacity)
+        self._lock = threading.Lock()
+        self.subscriber = rospy.Subscriber(topic, PoseStamped, self._input_pose, queue_size=20)
+
+    def _input_pose(self, pose_msg):
+        # type: (PoseStamped)->None
+        position = pose_msg.pose.position
+        orientation = pose_msg.pose.orientation
+        translation = np.array([position.x, position.y, position.z])
+        rotation = quaternion.quaternion(orientation.w, orientation.x, orientation.y, orientation.z)
+
+        frame = pose_msg.header.frame_id
+        if frame and frame != self.dest_frame:
+            try:
+                frame_transform = self.transform_cache.lookup_static(frame, self.dest_frame)
+            except TransformUnavailableException as e:
+                rospy.logwarn_throttle(1, "Dropping pose in frame '{0}': {1}".format(frame, e))
+                return
+            pose = frame_transform.compose(pt_manip.RigidTransform(translation, rotation))
+            translation, rotation = pose.translation, pose.rotation
+
+        with self._lock:
+            self._buffer.insert(pose_msg.header.stamp.to_sec(), translation, rotation)
+
+    def lookup(self, time):
+        # type: (rospy.Time)->tuple[np.ndarray, quaternion.quaternion]
+        u"""
+        Interpolates the pose at time, or extrapolates it if time is at most max_extrapolation
+        after the newest pose. Never blocks.
+        :return: the translation and rotation
+        :raise TransformUnavailableException: if the stream is stale or time is out of the buffer
+        """
+        with self._lock:
+            newest_time = self._buffer.newest_time()
+            if newest_time is None or rospy.Time.now().to_sec() - newest_time > self.max_staleness:
+                raise TransformUnavailableException(message="Pose stream is stale")
+            transform = self._buffer.lookup(time.to_sec(), max_extrapolation=self.max_extrapolation)
+        if transform is None:
+            raise TransformUnavailableException(message="No pose at time {0}".format(time))
+        return transform
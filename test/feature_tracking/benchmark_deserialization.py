@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+u"""
+Per message cost of the IntersectionArray deserialization paths, for 50 and 500 intersections :
+ - baseline : genpy deserialization, then one numpy row assignment per intersection
+ - rospy : genpy deserialization, then deserialize_intersections
+ - buffers : same, with reused IntersectionBuffers
+ - raw : RawIntersectionDecoder on the serialized message (rospy.AnyMsg)
+"""
+import timeit
+from StringIO import StringIO
+
+import numpy as np
+import rospy
+import elikos_msgs.msg as elikos_msgs
+
+from feature_tracking import message_interface
+
+
+def create_serialized_message(intersection_number):
+    # type: (int)->str
+    message = elikos_msgs.IntersectionArray()
+    message.header.stamp = rospy.Time(1, 500)
+    message.header.frame_id = "elikos_ffmv_bottom"
+    for point_2d, point_3d in zip(np.random.random_sample((intersection_number, 2)) * 640,
+                                  np.random.random_sample((intersection_number, 3)) * 10):
+        intersection = elikos_msgs.Intersection()
+        intersection.imagePosition.x, intersection.imagePosition.y = point_2d
+        intersection.arenaPosition.x, intersection.arenaPosition.y, intersection.arenaPosition.z = point_3d
+        message.intersections.append(intersection)
+
+    buff = StringIO()
+    message.serialize(buff)
+    return buff.getvalue()
+
+
+def baseline_deserialize_intersections(localization_points):
+    # type: (elikos_msgs.IntersectionArray)->(np.ndarray,np.ndarray)
+    u"""
+    The deserialization before deserialize_intersections read the values in one pass.
+    """
+    intersection_number = len(localization_points.intersections)
+    array_2d_pts = np.empty((intersection_number, 2))
+    array_3d_pts = np.empty((intersection_number, 3))
+    for i, intersection in enumerate(localization_points.intersections):
+        array_2d_pts[i] = (intersection.imagePosition.x, intersection.imagePosition.y)
+        array_3d_pts[i] = (intersection.arenaPosition.x, intersection.arenaPosition.y, intersection.arenaPosition.z)
+    return array_2d_pts, array_3d_pts
+
+
+def benchmark(intersection_number, repetitions):
+    # type: (int, int)->dict
+    serialized = create_serialized_message(intersection_number)
+    raw_message = rospy.AnyMsg()
+    raw_message._buff = serialized
+
+    buffers = message_interface.IntersectionBuffers()
+    raw_decoder = message_interface.RawIntersectionDecoder()
+
+    def baseline_path():
+        baseline_deserialize_intersections(elikos_msgs.IntersectionArray().deserialize(serialized))
+
+    def rospy_path():
+        message_interface.deserialize_intersections(elikos_msgs.IntersectionArray().deserialize(serialized))
+
+    def buffers_path():
+        buffers.deserialize(elikos_msgs.IntersectionArray().deserialize(serialized))
+
+    def raw_path():
+        raw_decoder.decode(raw_message)
+
+    return dict(
+        (name, min(timeit.repeat(path, number=repetitions, repeat=5)) / repetitions)
+        for name, path in (("baseline", baseline_path), ("rospy", rospy_path), ("buffers", buffers_path), ("raw", raw_path))
+    )
+
+
+if __name__ == '__main__':
+    for intersection_number, repetitions in ((50, 2000), (500, 200)):
+        results = benchmark(intersection_number, repetitions)
+        print "{0} intersections : ".format(intersection_number) + ", ".join(
+            "{0} {1:.1f} us".format(name, results[name] * 1e6) for name in ("baseline", "rospy", "buffers", "raw")
+        )
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+u"""
+Latency of the per-camera stage of input_localization_points (deserialization and transform of the
+intersections to the arena frame), run serially in the callback thread and on the preprocessing
+pool, for 1, 4 and 8 cameras. Synthetic bags are replayed through the node without a ROS master.
+"""
+import os
+import shutil
+import tempfile
+
+from feature_tracking import replay
+from feature_tracking import synthetic_bag
+
+
+def benchmark(bag_path, camera_number, threads):
+    # type: (str, int, int)->tuple[float, float]
+    u"""
+    :param threads: preprocessing_threads, 1 for the serial path
+    :return: the mean and 95th percentile of the "preprocess" stage, in seconds
+    """
+    harness = replay.ReplayHarness({
+        "camera_number": camera_number,
+        "debug_output": False,
+        "preprocessing_threads": threads
+    })
+    harness.run(bag_path)
+    preprocess = harness.global_state.instrumentation.histograms["preprocess"]
+    return preprocess.mean(), preprocess.percentile(0.95)
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        for camera_number in (1, 4, 8):
+            bag_path = os.path.join(directory, "synthetic_{0}.bag".format(camera_number))
+            synthetic_bag.write_synthetic_bag(bag_path, frames=300, camera_number=camera_number)
+            for label, threads in (("serial", 1), ("pool", camera_number)):
+                mean, p95 = benchmark(bag_path, camera_number, threads)
+                print "{0} cameras, {1:<6} : mean {2:.3f} ms, p95 {3:.3f} ms".format(camera_number, label, mean * 1e3, p95 * 1e3)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+u"""
+Cold start of the localization node : the import time of every heavy dependency and of the
+feature_tracking modules, each in a new interpreter, then the time to build a Localizer and to
+localize the first frame. Exits with an error when a module is over its budget, so the startup
+time is tracked like the other benchmarks.
+Usage : benchmark_startup.py [--repetitions 5]
+"""
+import argparse
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+# Seconds, the median import time in a new interpreter
+COLD_START_BUDGETS = {
+    "feature_tracking.localizer": 0.5,
+    "feature_tracking.fallback": 2.0,
+}
+
+PROFILED_MODULES = (
+    "numpy",
+    "quaternion",
+    "scipy.spatial",
+    "cv2",
+    "pyopengv",
+    "rospy",
+    "tf",
+    "message_filters",
+    "feature_tracking.localizer",
+    "feature_tracking.fallback",
+)
+
+IMPORT_TIMER = """
+import time
+start = time.time()
+import {0}
+print(time.time() - start)
+"""
+
+
+def cold_import_time(module, repetitions):
+    # type: (str, int)->float
+    u"""
+    :return: the median import time of module in a new interpreter, None if it cannot be imported
+    """
+    durations = []
+    for _ in xrange(repetitions):
+        process = subprocess.Popen(
+            [sys.executable, "-W", "ignore", "-c", IMPORT_TIMER.format(module)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            return None
+        durations.append(float(output.split()[-1]))
+    return float(np.median(durations))
+
+
+def first_frame_time():
+    # type: ()->tuple[float, float]
+    u"""
+    :return: the time to build a Localizer from the default configuration, and to localize the first
+     frame of a synthetic scene with it
+    """
+    import quaternion
+    from feature_tracking import localizer
+    from feature_tracking import synthetic_scene
+
+    configuration = localizer.Configuration(lambda name, default: {"pose_estimator": "ransac"}.get(name.lstrip("~"), default))
+    start = timeit.default_timer()
+    estimator = localizer.Localizer(configuration)
+    construction = timeit.default_timer() - start
+
+    times = np.zeros(1)
+    translations, rotation_matrices = synthetic_scene.circle_trajectory(times)
+    frames = synthetic_scene.SyntheticScene(np.zeros((1, 3)), np.diag([1.0, -1.0, -1.0])[np.newaxis], np.array(
+        [[300.0, 0, 320], [0, 300, 240], [0, 0, 1]]
+    )).render(times, translations, rotation_matrices, random_state=np.random.RandomState(0))
+    pixels, ground_points, _ = frames.camera_frame(0, 0)
+    # Without extrinsics, so the first frame does not depend on opengv
+    observation = localizer.CameraObservation(
+        pixels,
+        np.dot(ground_points * [1, -1, -1], rotation_matrices[0].T) + translations[0],
+        None
+    )
+
+    start = timeit.default_timer()
+    estimator.localize([observation], (translations[0], quaternion.from_rotation_matrix(rotation_matrices[0])))
+    return construction, timeit.default_timer() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cold start time of the localization node.")
+    parser.add_argument("--repetitions", type=int, default=5)
+    arguments = parser.parse_args()
+
+    over_budget = []
+    for module in PROFILED_MODULES:
+        duration = cold_import_time(module, arguments.repetitions)
+        budget = COLD_START_BUDGETS.get(module)
+        if duration is None:
+            print "{0:<30} unavailable".format(module)
+            continue
+        line = "{0:<30} {1:7.1f} ms".format(module, duration * 1e3)
+        if budget is not None:
+            line += " (budget {0:.0f} ms)".format(budget * 1e3)
+            if duration > budget:
+                over_budget.append(module)
+        print line
+
+    construction, first_frame = first_frame_time()
+    print "Localizer construction : {0:.1f} ms, first frame : {1:.1f} ms".format(construction * 1e3, first_frame * 1e3)
+
+    if over_budget:
+        print "Over budget : " + ", ".join(over_budget)
+        sys.exit(1)
@@ -0,0 +1,37 @@
+#!usr/bin/env python
+u"""
+Stand-ins for the ROS objects used by the unit tests.
+"""
+
+
+class FakeTimer(object):
+    u"""
+    Returned by the schedule function of the tests, fired by calling its callback.
+    """
+    def __init__(self, delay, callback, oneshot=True):
+        self.delay = delay
+        self.callback = callback
+        self.oneshot = oneshot
+        self.cancelled = False
+
+    def shutdown(self):
+        self.cancelled = True
+
+
+class Header(object):
+
+    def __init__(self, frame_id):
+        self.frame_id = frame_id
+
+
+class CameraInfo(object):
+    u"""
+    The fields of sensor_msgs/CameraInfo read by the camera model.
+    """
+    def __init__(self, frame_id, K, D=(0.0,) * 5, width=640, height=480):
+        self.header = Header(frame_id)
+        self.width = width
+        self.height = height
+        self.distortion_model = "plumb_bob"
+        self.K = list(K)
+        self.D = list(D)
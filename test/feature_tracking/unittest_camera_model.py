@@ -0,0 +1,84 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+import numpy as np
+from feature_tracking import camera_model
+from fakes import CameraInfo
+
+
+K = [400.0, 0.0, 330.0, 0.0, 410.0, 235.0, 0.0, 0.0, 1.0]
+D = [-0.28, 0.07, 0.0005, -0.0002, 0.0]
+
+
+def project(intrinsics, bearings):
+    u"""
+    Forward plumb_bob projection of bearings to pixels.
+    """
+    x = bearings[:, 0] / bearings[:, 2]
+    y = bearings[:, 1] / bearings[:, 2]
+    k1, k2, p1, p2, k3 = intrinsics.distortion[0:5]
+    r2 = x * x + y * y
+    radial = 1 + k1 * r2 + k2 * r2 ** 2 + k3 * r2 ** 3
+    x_distorted = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    y_distorted = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+    return np.stack([x_distorted * intrinsics.fx + intrinsics.cx, y_distorted * intrinsics.fy + intrinsics.cy], axis=1)
+
+
+class TestCameraIntrinsics(unittest.TestCase):
+
+    def setUp(self):
+        self.bearings = np.random.random_sample((50, 3)) * np.array([0.6, 0.4, 0]) - np.array([0.3, 0.2, -1])
+        self.bearings /= np.linalg.norm(self.bearings, axis=1)[:, np.newaxis]
+
+    def test_undistorted_bearings(self):
+        intrinsics = camera_model.CameraIntrinsics(K, [], 640, 480)
+        np.testing.assert_allclose(intrinsics.pixels_to_bearings(project(intrinsics, self.bearings)), self.bearings)
+
+    def test_distorted_bearings(self):
+        intrinsics = camera_model.CameraIntrinsics(K, D, 640, 480)
+        bearings = intrinsics.pixels_to_bearings(project(intrinsics, self.bearings))
+        np.testing.assert_allclose(bearings, self.bearings, atol=1e-5)
+
+    def test_lookup_table(self):
+        intrinsics = camera_model.CameraIntrinsics(K, D, 640, 480)
+        pixels = np.rint(project(intrinsics, self.bearings))
+        expected = intrinsics.pixels_to_bearings(pixels)
+        intrinsics.build_lookup_table()
+        np.testing.assert_allclose(intrinsics.pixels_to_bearings(pixels), expected)
+
+
+class TestCameraInfoStore(unittest.TestCase):
+
+    def test_version_bumped_on_calibration_change(self):
+        store = camera_model.CameraInfoStore()
+        self.assertIsNone(store.get(0))
+        self.assertEqual(store.version(0), 0)
+
+        first = CameraInfo("camera_0", K, D)
+        self.assertTrue(store.update(first, 0))
+        # Same calibration, the first message is kept
+        self.assertFalse(store.update(CameraInfo("camera_0", K, D), 0))
+        self.assertIs(store.get(0), first)
+        self.assertEqual(store.version(0), 1)
+
+        recalibrated = CameraInfo("camera_0", K)
+        self.assertTrue(store.update(recalibrated, 0))
+        self.assertIs(store.get(0), recalibrated)
+        self.assertEqual(store.version(0), 2)
+        self.assertEqual(store.version(1), 0)
+
+    def test_intrinsics_cache_follows_the_store(self):
+        cache = camera_model.IntrinsicsCache()
+        first = CameraInfo("camera_0", K, D)
+        intrinsics = cache.get(first)
+        self.assertIs(cache.get(first), intrinsics)
+        self.assertIs(cache.get(CameraInfo("camera_0", K, D)), intrinsics)
+        self.assertIsNot(cache.get(CameraInfo("camera_0", K)), intrinsics)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_camera_intrinsics', TestCameraIntrinsics)
+    rosunit.unitrun(PKG, 'test_camera_info_store', TestCameraInfoStore)
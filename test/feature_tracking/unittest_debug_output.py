@@ -0,0 +1,71 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import threading
+import unittest
+
+import numpy as np
+from feature_tracking import debug_output
+
+
+class FakePublisher(object):
+
+    def __init__(self, connections=1):
+        self.connections = connections
+        self.messages = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_num_connections(self):
+        return self.connections
+
+    def publish(self, message):
+        self.release.wait()
+        self.messages.append(message)
+
+
+class TestDebugPublisher(unittest.TestCase):
+
+    def setUp(self):
+        self.static_points = np.arange(12, dtype=np.float).reshape((4, 3))
+
+    def test_nothing_built_without_subscribers(self):
+        publisher = debug_output.DebugPublisher(FakePublisher(connections=0), self.static_points)
+        points_built = []
+        publisher.publish("frame", lambda: points_built.append(True) or np.zeros((1, 3)), stamp=0)
+        publisher.stop()
+        self.assertEqual(points_built, [])
+
+    def test_disabled_without_publisher(self):
+        publisher = debug_output.DebugPublisher(None, self.static_points, enabled=False)
+        self.assertFalse(publisher.is_active())
+        publisher.publish("frame", np.zeros((1, 3)), stamp=0)
+        publisher.stop()
+
+    def test_static_points_appended(self):
+        publisher = debug_output.DebugPublisher(FakePublisher(), self.static_points)
+        message = publisher.build_message("frame", np.array([[1, 2]]), 0)
+        publisher.stop()
+        self.assertEqual(len(message.poses), 5)
+        self.assertEqual(message.header.frame_id, "frame")
+        self.assertEqual((message.poses[0].position.x, message.poses[0].position.z), (1, 0))
+        self.assertEqual(message.poses[4].position.z, 11)
+
+    def test_oldest_request_dropped(self):
+        fake_publisher = FakePublisher()
+        fake_publisher.release.clear()
+        publisher = debug_output.DebugPublisher(fake_publisher, queue_size=2)
+        for i in xrange(5):
+            publisher.publish("frame", np.full((1, 3), i), stamp=i)
+        self.assertGreaterEqual(publisher.dropped_requests, 2)
+
+        fake_publisher.release.set()
+        while len(publisher._queue) > 0:
+            threading.Event().wait(0.01)
+        publisher.stop()
+        self.assertEqual(fake_publisher.messages[-1].poses[0].position.x, 4)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_debug_publisher', TestDebugPublisher)
@@ -0,0 +1,60 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import threading
+import unittest
+
+from feature_tracking import instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_monotonic(self):
+        times = [instrumentation.monotonic() for _ in xrange(100)]
+        self.assertEqual(times, sorted(times))
+
+    def test_histogram_percentiles(self):
+        histogram = instrumentation.LatencyHistogram()
+        for _ in xrange(90):
+            histogram.record(1e-4)
+        for _ in xrange(10):
+            histogram.record(5e-2)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.mean(), 0.9 * 1e-4 + 0.1 * 5e-2)
+        self.assertAlmostEqual(histogram.percentile(0.5), 1e-4)
+        self.assertAlmostEqual(histogram.percentile(0.99), 5e-2)
+        self.assertEqual(histogram.maximum, 5e-2)
+
+    def test_laps_and_counters(self):
+        instruments = instrumentation.Instrumentation()
+        start = instruments.now()
+        start = instruments.lap("first", start)
+        instruments.lap("second", start)
+        instruments.increment("estimator.upnp")
+        instruments.increment("estimator.upnp")
+
+        self.assertEqual(instruments.histograms["first"].count, 1)
+        self.assertEqual(instruments.counters, {"estimator.upnp": 2})
+        self.assertEqual([key for key, _ in instruments.summary()], ["first", "second", "estimator.upnp"])
+
+    def test_concurrent_recording(self):
+        instruments = instrumentation.Instrumentation()
+
+        def record():
+            for _ in xrange(2000):
+                instruments.record("stage", 1e-3)
+                instruments.increment("counter")
+        threads = [threading.Thread(target=record) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(instruments.histograms["stage"].count, 8000)
+        self.assertEqual(sum(instruments.histograms["stage"].counts), 8000)
+        self.assertEqual(instruments.counters["counter"], 8000)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_instrumentation', TestInstrumentation)
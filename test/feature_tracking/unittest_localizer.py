@@ -0,0 +1,112 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+import numpy as np
+import quaternion
+from feature_tracking import localizer
+from feature_tracking import synthetic_scene
+from fakes import CameraInfo
+
+
+CAMERA_MATRIX = np.array([[300.0, 0, 320], [0, 300, 240], [0, 0, 1]])
+
+
+class Extrinsics(object):
+    def __init__(self, translation, rotation_matrix):
+        self.translation = translation
+        self.rotation_matrix = rotation_matrix
+
+
+class TestLocalizer(unittest.TestCase):
+
+    def setUp(self):
+        self.times = np.arange(30) / 30.0
+        self.translations, self.rotation_matrices = synthetic_scene.circle_trajectory(self.times)
+        self.believed_translations = self.translations + synthetic_scene.odometry_drift(self.times)
+        self.camera_translations, self.camera_rotations = synthetic_scene.camera_ring(2)
+        scene = synthetic_scene.SyntheticScene(self.camera_translations, self.camera_rotations, CAMERA_MATRIX)
+        self.frames = scene.render(
+            self.times, self.translations, self.rotation_matrices, self.believed_translations,
+            random_state=np.random.RandomState(3)
+        )
+        self.camera_infos = [CameraInfo("camera_{0}".format(i), CAMERA_MATRIX.ravel()) for i in xrange(2)]
+
+    def create_localizer(self, **parameters):
+        configuration = localizer.Configuration(lambda name, default: parameters.get(name.lstrip("~"), default))
+        return localizer.Localizer(configuration)
+
+    def observations(self, frame, with_extrinsics=True):
+        observations = []
+        for camera in xrange(2):
+            pixels, ground_points, _ = self.frames.camera_frame(frame, camera)
+            points_fcu = np.dot(ground_points, self.camera_rotations[camera].T) + self.camera_translations[camera]
+            points_arena = np.dot(points_fcu, self.rotation_matrices[frame].T) + self.believed_translations[frame]
+            extrinsics = Extrinsics(self.camera_translations[camera], self.camera_rotations[camera]) if with_extrinsics else None
+            observations.append(localizer.CameraObservation(pixels, points_arena, self.camera_infos[camera], extrinsics))
+        return observations
+
+    def fcu_pose(self, frame):
+        return self.believed_translations[frame], quaternion.from_rotation_matrix(self.rotation_matrices[frame])
+
+    def test_incremental(self):
+        estimator = self.create_localizer(pose_estimator="incremental")
+        estimator.incremental_estimator.reset(self.translations[0], self.rotation_matrices[0])
+        for frame in xrange(self.frames.frames_number):
+            result = estimator.localize(self.observations(frame), self.fcu_pose(frame))
+            self.assertEqual(result.estimator, "incremental")
+            np.testing.assert_allclose(result.translation, self.translations[frame], atol=0.02)
+            np.testing.assert_allclose(
+                quaternion.as_rotation_matrix(result.rotation), self.rotation_matrices[frame], atol=0.01
+            )
+            self.assertEqual(result.covariance.shape, (6, 6))
+        self.assertEqual(estimator.instrumentation.counters["estimator.incremental"], self.frames.frames_number)
+        self.assertEqual(estimator.instrumentation.histograms["estimate"].count, self.frames.frames_number)
+
+    def test_streaming(self):
+        estimator = self.create_localizer(pose_estimator="incremental", fusion_mode="streaming")
+        estimator.incremental_estimator.reset(self.translations[0], self.rotation_matrices[0])
+        for frame in xrange(self.frames.frames_number):
+            for observation in self.observations(frame):
+                result = estimator.update(estimator.associate([observation]), self.times[frame], self.fcu_pose(frame))
+                np.testing.assert_allclose(result.translation, self.translations[frame], atol=0.03)
+                np.testing.assert_allclose(
+                    quaternion.as_rotation_matrix(result.rotation), self.rotation_matrices[frame], atol=0.01
+                )
+        # Seeded by the first camera frame only
+        self.assertEqual(estimator.instrumentation.counters["estimator.incremental"], 1)
+        self.assertEqual(estimator.instrumentation.counters["estimator.sequential"], 2 * self.frames.frames_number - 1)
+
+    def test_falls_back_on_position_alone(self):
+        estimator = self.create_localizer(pose_estimator="ransac")
+        result = estimator.localize(self.observations(10, with_extrinsics=False), self.fcu_pose(10))
+        self.assertEqual(result.estimator, "position_alone")
+        np.testing.assert_allclose(result.translation[0:2], self.translations[10, 0:2], atol=0.05)
+        self.assertEqual(estimator.instrumentation.counters["unavailable.ransac"], 1)
+
+    def test_position_alone_with_a_point_under_the_fcu(self):
+        configuration = localizer.Configuration(lambda name, default: default)
+        fcu_pose = self.fcu_pose(0)
+        offset = np.array([0.1, -0.05, 0])
+        # The first intersection is detected right at the position of the FCU
+        detected = np.array([[0.0, 0, 0], [1, 0, -1], [0, 1, -1], [-1, 1, -1]]) + fcu_pose[0]
+        matched = detected - offset
+        translation = localizer.estimate_drone_position_alone(detected, matched, fcu_pose, configuration)[0]
+        self.assertTrue(np.all(np.isfinite(translation)))
+        np.testing.assert_allclose(translation[0:2], (fcu_pose[0] - offset)[0:2], atol=0.05)
+
+    def test_unavailable(self):
+        estimator = self.create_localizer()
+        with self.assertRaises(localizer.LocalizationUnavailableException):
+            estimator.localize([], self.fcu_pose(0))
+        self.assertEqual(estimator.instrumentation.counters["unavailable.simple"], 1)
+
+    def test_arena_map_from_configuration(self):
+        estimator = self.create_localizer(arena_size=10, arena_intersection_num=11)
+        self.assertEqual(estimator.arena_map.points.shape[0], 121)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_localizer', TestLocalizer)
@@ -0,0 +1,125 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import threading
+import unittest
+
+import message_filters
+import rospy
+from std_msgs.msg import Header
+from feature_tracking import message_filters_extras
+from fakes import FakeTimer
+
+
+class Stamped(object):
+
+    def __init__(self, stamp, name):
+        self.header = Header(stamp=rospy.Time.from_sec(stamp))
+        self.name = name
+
+
+class TestQuorumSynchronizer(unittest.TestCase):
+
+    def setUp(self):
+        self.inputs = [message_filters.SimpleFilter() for _ in xrange(3)]
+        self.bundles = []
+        self.timers = []
+
+    def create(self, quorum, deadline=None):
+        synchronizer = message_filters_extras.QuorumSynchronizer(self.inputs, quorum, 0.01, deadline, self.schedule)
+        synchronizer.registerCallback(lambda *bundle: self.bundles.append([
+            message.name if message is not None else None for message in bundle
+        ]))
+        return synchronizer
+
+    def schedule(self, delay, callback):
+        timer = FakeTimer(delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    def signal(self, input_index, stamp, name):
+        self.inputs[input_index].signalMessage(Stamped(stamp, name))
+
+    def test_full_bundle(self):
+        synchronizer = self.create(0)
+        self.signal(0, 1.0, "a")
+        self.signal(2, 1.005, "c")
+        self.assertEqual(self.bundles, [])
+        self.signal(1, 0.995, "b")
+        self.assertEqual(self.bundles, [["a", "b", "c"]])
+        self.assertEqual((synchronizer.emitted_bundles, synchronizer.partial_bundles), (1, 0))
+
+    def test_quorum(self):
+        synchronizer = self.create(2)
+        self.signal(1, 1.0, "b")
+        self.signal(2, 1.0, "c")
+        self.assertEqual(self.bundles, [[None, "b", "c"]])
+        # Too late for its bundle
+        self.signal(0, 0.98, "a")
+        self.assertEqual(synchronizer.dropped_messages, 1)
+        self.assertEqual(synchronizer.partial_bundles, 1)
+
+    def test_newer_message_flushes_the_bundle(self):
+        self.create(0)
+        self.signal(0, 1.0, "a0")
+        self.signal(1, 1.0, "b0")
+        self.signal(0, 1.033, "a1")
+        self.assertEqual(self.bundles, [["a0", "b0", None]])
+        # A second message of the same input also flushes it
+        self.signal(0, 1.034, "a2")
+        self.assertEqual(self.bundles[-1], ["a1", None, None])
+
+    def test_deadline(self):
+        synchronizer = self.create(0, deadline=0.05)
+        self.signal(0, 1.0, "a")
+        self.assertEqual(self.timers[0].delay, 0.05)
+        self.timers[0].callback()
+        self.assertEqual(self.bundles, [["a", None, None]])
+        self.assertEqual(synchronizer.expired_bundles, 1)
+
+        # The timer of an emitted bundle is cancelled, and ignored if it fires anyway
+        self.signal(0, 2.0, "a")
+        self.signal(1, 2.0, "b")
+        self.signal(2, 2.0, "c")
+        self.assertTrue(self.timers[1].cancelled)
+        self.timers[1].callback()
+        self.assertEqual(len(self.bundles), 2)
+        self.assertEqual(synchronizer.expired_bundles, 1)
+
+    def test_slow_callback_does_not_block_the_inputs(self):
+        synchronizer = message_filters_extras.QuorumSynchronizer(self.inputs, 0, 0.01, 0.05, self.schedule)
+        delivering = threading.Event()
+        release = threading.Event()
+
+        def slow_callback(*bundle):
+            self.bundles.append([message.name if message is not None else None for message in bundle])
+            delivering.set()
+            release.wait(5)
+        synchronizer.registerCallback(slow_callback)
+
+        def signal_full_bundle():
+            for input_index, name in enumerate(("a", "b", "c")):
+                self.signal(input_index, 1.0, name)
+        delivery_thread = threading.Thread(target=signal_full_bundle)
+        delivery_thread.start()
+        self.assertTrue(delivering.wait(5))
+
+        # The callback is still running, the inputs and the deadline keep working
+        self.signal(0, 2.0, "a2")
+        self.timers[1].callback()
+        self.assertEqual(synchronizer.expired_bundles, 1)
+        self.signal(1, 3.0, "b3")
+        self.timers[2].callback()
+        self.assertEqual(synchronizer.emitted_bundles, 3)
+        # Waiting behind the callback, the bundle of "a2" was replaced by the one of "b3"
+        self.assertEqual(synchronizer.dropped_messages, 1)
+        self.assertEqual(len(self.bundles), 1)
+
+        release.set()
+        delivery_thread.join(5)
+        self.assertEqual(self.bundles, [["a", "b", "c"], [None, "b3", None]])
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_quorum_synchronizer', TestQuorumSynchronizer)
@@ -0,0 +1,100 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+from StringIO import StringIO
+
+import numpy as np
+import rospy
+import elikos_msgs.msg as elikos_msgs
+from feature_tracking import message_interface
+
+
+def create_intersection_array(points_2d, points_3d):
+    message = elikos_msgs.IntersectionArray()
+    for point_2d, point_3d in zip(points_2d, points_3d):
+        intersection = elikos_msgs.Intersection()
+        intersection.imagePosition.x, intersection.imagePosition.y = point_2d
+        intersection.arenaPosition.x, intersection.arenaPosition.y, intersection.arenaPosition.z = point_3d
+        message.intersections.append(intersection)
+    return message
+
+
+class TestDeserializeIntersections(unittest.TestCase):
+
+    def setUp(self):
+        self.points_2d = np.random.random_sample((10, 2)) * 640
+        self.points_3d = np.random.random_sample((10, 3)) * 10
+        self.message = create_intersection_array(self.points_2d, self.points_3d)
+
+    def test_deserialize(self):
+        points_2d, points_3d = message_interface.deserialize_intersections(self.message)
+        np.testing.assert_allclose(points_2d, self.points_2d)
+        np.testing.assert_allclose(points_3d, self.points_3d)
+
+    def test_deserialize_empty(self):
+        points_2d, points_3d = message_interface.deserialize_intersections(elikos_msgs.IntersectionArray())
+        self.assertEqual(points_2d.shape, (0, 2))
+        self.assertEqual(points_3d.shape, (0, 3))
+
+    def test_buffers_are_reused(self):
+        buffers = message_interface.IntersectionBuffers(capacity=4)
+        points_2d, points_3d = buffers.deserialize(self.message)
+        np.testing.assert_allclose(points_2d, self.points_2d)
+        np.testing.assert_allclose(points_3d, self.points_3d)
+
+        points_2d_buffer = buffers.points_2d
+        points_2d, points_3d = buffers.deserialize(create_intersection_array(self.points_2d[0:3], self.points_3d[0:3]))
+        np.testing.assert_allclose(points_2d, self.points_2d[0:3])
+        np.testing.assert_allclose(points_3d, self.points_3d[0:3])
+        self.assertIs(points_3d.base, buffers.points_3d)
+        self.assertIs(buffers.points_2d, points_2d_buffer)
+
+    def test_deserialize_in_chunks(self):
+        points_2d = np.random.random_sample((300, 2)) * 640
+        points_3d = np.random.random_sample((300, 3)) * 10
+        result_2d, result_3d = message_interface.IntersectionBuffers().deserialize(
+            create_intersection_array(points_2d, points_3d)
+        )
+        np.testing.assert_allclose(result_2d, points_2d)
+        np.testing.assert_allclose(result_3d, points_3d)
+
+
+class TestRawIntersectionDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.points_2d = np.random.random_sample((10, 2)) * 640
+        self.points_3d = np.random.random_sample((10, 3)) * 10
+        self.decoder = message_interface.RawIntersectionDecoder()
+
+    def serialize(self, message):
+        buff = StringIO()
+        message.serialize(buff)
+        raw_message = rospy.AnyMsg()
+        raw_message._buff = buff.getvalue()
+        return raw_message
+
+    def test_decode(self):
+        message = create_intersection_array(self.points_2d, self.points_3d)
+        message.header.stamp = rospy.Time(12, 34)
+        message.header.frame_id = "camera"
+
+        decoded = self.decoder.decode(self.serialize(message))
+        self.assertEqual(decoded.header.stamp, message.header.stamp)
+        self.assertEqual(decoded.header.frame_id, "camera")
+        np.testing.assert_allclose(decoded.points_2d, self.points_2d)
+        np.testing.assert_allclose(decoded.points_3d, self.points_3d)
+
+        points_2d, points_3d = message_interface.deserialize_intersections(decoded)
+        np.testing.assert_allclose(points_3d, self.points_3d)
+
+    def test_decode_empty(self):
+        decoded = self.decoder.decode(self.serialize(elikos_msgs.IntersectionArray()))
+        self.assertEqual(decoded.points_2d.shape, (0, 2))
+        self.assertEqual(decoded.points_3d.shape, (0, 3))
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_deserialize_intersections', TestDeserializeIntersections)
+    rosunit.unitrun(PKG, 'test_raw_intersection_decoder', TestRawIntersectionDecoder)
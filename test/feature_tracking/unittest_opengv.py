@@ -0,0 +1,129 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+import numpy as np
+import quaternion
+from feature_tracking import opengv
+
+
+class RecordingSolver(object):
+    u"""
+    Takes the place of pyopengv, keeps the inputs of every solve and returns the given solutions.
+    """
+    def __init__(self, solutions):
+        self.solutions = solutions
+        self.calls = []
+
+    def epnp_multi_camera(self, bearings, coordinates, camera_translations, camera_rotations, algorithm):
+        self.calls.append((bearings, coordinates, camera_translations, camera_rotations, algorithm))
+        return self.solutions
+
+
+class TestOpengv(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(11)
+        self.bearings = random_state.normal(0, 1, (2, 6, 3))
+        self.bearings /= np.linalg.norm(self.bearings, axis=2)[:, :, np.newaxis]
+        self.coordinates = random_state.normal(0, 3, (2, 6, 3))
+        self.camera_indices = np.array([2, 0, 2, 0, 2, 0])
+        self.camera_translations = np.array([[0.1, 0, 0], [0, 0.1, 0], [0, 0, 0.1]])
+        self.camera_rotations = np.tile(np.identity(3), (3, 1, 1))
+        self.solution = np.hstack([np.identity(3), np.ones((3, 1))])
+        self.native_solver = opengv._pyopengv
+
+    def tearDown(self):
+        opengv._pyopengv = self.native_solver
+
+    def solve_stacked(self, **changes):
+        arguments = dict(
+            bearings=self.bearings,
+            coordinates=self.coordinates,
+            camera_indices=self.camera_indices,
+            camera_translations=self.camera_translations,
+            camera_rotations=self.camera_rotations
+        )
+        arguments.update(changes)
+        return opengv.solve_stacked(**arguments)
+
+    def test_rejects_invalid_inputs(self):
+        bearings = self.bearings.copy()
+        bearings[1, 3, 0] = np.nan
+        with self.assertRaises(ValueError):
+            self.solve_stacked(bearings=bearings)
+        with self.assertRaises(ValueError):
+            self.solve_stacked(coordinates=self.coordinates[:, 0:5])
+        with self.assertRaises(ValueError):
+            self.solve_stacked(camera_indices=self.camera_indices[0:5])
+        with self.assertRaises(ValueError):
+            self.solve_stacked(camera_indices=np.array([3, 0, 2, 0, 2, 0]))
+        with self.assertRaises(ValueError):
+            self.solve_stacked(camera_rotations=self.camera_rotations[0:2])
+        camera_translations = self.camera_translations.copy()
+        camera_translations[0, 0] = np.inf
+        with self.assertRaises(ValueError):
+            self.solve_stacked(camera_translations=camera_translations)
+
+    def test_splits_the_stack_by_frame_and_camera(self):
+        solver = RecordingSolver([self.solution])
+        opengv._pyopengv = solver
+        poses = self.solve_stacked()
+
+        self.assertEqual(len(poses), 2)
+        self.assertEqual(len(solver.calls), 2)
+        for frame, (bearings, coordinates, camera_translations, camera_rotations, algorithm) in enumerate(solver.calls):
+            np.testing.assert_allclose(poses[frame], self.solution)
+            self.assertEqual(algorithm, "upnp")
+            # Camera 1 has no point, it is left out
+            np.testing.assert_allclose(camera_translations, self.camera_translations[[0, 2]])
+            self.assertEqual(len(bearings), 2)
+            np.testing.assert_allclose(bearings[0], self.bearings[frame, [1, 3, 5]])
+            np.testing.assert_allclose(bearings[1], self.bearings[frame, [0, 2, 4]])
+            np.testing.assert_allclose(coordinates[1], self.coordinates[frame, [0, 2, 4]])
+
+    def test_camera_indices_per_frame(self):
+        solver = RecordingSolver([self.solution])
+        opengv._pyopengv = solver
+        self.solve_stacked(camera_indices=np.array([self.camera_indices, np.ones(6, dtype=np.intp)]))
+        self.assertEqual(len(solver.calls[1][0]), 1)
+        np.testing.assert_allclose(solver.calls[1][2], self.camera_translations[[1]])
+
+    def test_too_few_points(self):
+        solver = RecordingSolver([self.solution])
+        opengv._pyopengv = solver
+        self.assertEqual(self.solve_stacked(min_points=7), [None, None])
+        self.assertEqual(solver.calls, [])
+
+    def test_first_valid_pose(self):
+        invalid = self.solution.copy()
+        invalid[0, 3] = np.nan
+        self.assertIsNone(opengv._first_valid_pose(None))
+        self.assertIsNone(opengv._first_valid_pose([]))
+        self.assertIsNone(opengv._first_valid_pose([invalid, np.identity(3)]))
+        np.testing.assert_allclose(opengv._first_valid_pose([invalid, self.solution]), self.solution)
+
+        opengv._pyopengv = RecordingSolver([invalid])
+        self.assertEqual(self.solve_stacked(), [None, None])
+
+    def test_solves_the_pose(self):
+        rotation_matrix = quaternion.as_rotation_matrix(quaternion.from_euler_angles(0.1, 0.05, 0.4))
+        translation = np.array([1.0, -0.5, 1.5])
+        landmarks = np.random.RandomState(2).uniform(-3, 3, (12, 3)) * [1, 1, 0]
+        camera_indices = np.arange(12) % 3
+        points_camera = np.einsum(
+            'nji,nj->ni',
+            self.camera_rotations[camera_indices],
+            np.dot(landmarks - translation, rotation_matrix) - self.camera_translations[camera_indices]
+        )
+        bearings = points_camera / np.linalg.norm(points_camera, axis=1)[:, np.newaxis]
+
+        pose = opengv.solve(bearings, landmarks, camera_indices, self.camera_translations, self.camera_rotations)
+        np.testing.assert_allclose(pose[:, 3], translation, atol=1e-6)
+        np.testing.assert_allclose(pose[:, 0:3], rotation_matrix, atol=1e-6)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_opengv', TestOpengv)
@@ -0,0 +1,64 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+import numpy as np
+import quaternion
+from feature_tracking import point_manipulation
+
+
+class TestRigidTransform(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(5)
+        self.points = random_state.normal(0, 3, (20, 3))
+        self.first = point_manipulation.RigidTransform(
+            np.array([1.0, -2.0, 0.5]), quaternion.from_rotation_vector([0.3, -0.1, 1.2])
+        )
+        self.second = point_manipulation.RigidTransform(
+            np.array([-0.4, 0.2, 3.0]), quaternion.from_rotation_vector([-0.6, 0.2, 0.1])
+        )
+
+    def test_apply_matches_homogeneous_matrix(self):
+        np.testing.assert_allclose(
+            self.first.apply(self.points),
+            point_manipulation.transform_points(self.first.as_matrix(), self.points),
+            atol=1e-12
+        )
+        np.testing.assert_allclose(self.first.apply(self.points[0]), self.first.apply(self.points)[0], atol=1e-12)
+
+    def test_compose_and_inverse(self):
+        composed = self.first.compose(self.second)
+        np.testing.assert_allclose(composed.apply(self.points), self.first.apply(self.second.apply(self.points)), atol=1e-12)
+        np.testing.assert_allclose(composed.as_matrix(), np.dot(self.first.as_matrix(), self.second.as_matrix()), atol=1e-12)
+        np.testing.assert_allclose(self.first.inverse().apply(self.first.apply(self.points)), self.points, atol=1e-12)
+        np.testing.assert_allclose(
+            quaternion.as_rotation_matrix(self.first.inverse().rotation), self.first.rotation_matrix.T, atol=1e-12
+        )
+
+    def test_from_matrix(self):
+        transform = point_manipulation.RigidTransform.from_matrix(self.first.as_matrix()[0:3])
+        np.testing.assert_allclose(transform.apply(self.points), self.first.apply(self.points), atol=1e-12)
+
+    def test_stacks(self):
+        transforms = [self.first, self.second, self.first.compose(self.second)]
+        translations = np.array([transform.translation for transform in transforms])
+        rotation_matrices = np.array([transform.rotation_matrix for transform in transforms])
+
+        applied = point_manipulation.apply_transforms(translations, rotation_matrices, self.points)
+        self.assertEqual(applied.shape, (3, 20, 3))
+        for i, transform in enumerate(transforms):
+            np.testing.assert_allclose(applied[i], transform.apply(self.points), atol=1e-12)
+
+        inverse_translations, inverse_rotation_matrices = point_manipulation.invert_transforms(translations, rotation_matrices)
+        composed_translations, composed_rotation_matrices = point_manipulation.compose_transforms(
+            translations, rotation_matrices, inverse_translations, inverse_rotation_matrices
+        )
+        np.testing.assert_allclose(composed_translations, np.zeros((3, 3)), atol=1e-12)
+        np.testing.assert_allclose(composed_rotation_matrices, np.tile(np.identity(3), (3, 1, 1)), atol=1e-12)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_rigid_transform', TestRigidTransform)
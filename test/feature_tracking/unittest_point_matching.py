@@ -0,0 +1,149 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from feature_tracking import point_matching
+
+
+class TestGridLattice(unittest.TestCase):
+
+    def setUp(self):
+        self.lattice = point_matching.GridLattice(21, 20)
+        self.points = (np.random.random_sample((200, 3)) - 0.5) * np.array([24, 24, 0.4])
+
+    def test_lattice_points_are_grid_mesh(self):
+        np.testing.assert_allclose(self.lattice.points, point_matching.create_grid_mesh(21, 20))
+
+    def test_snap_matches_brute_force(self):
+        matched, residuals, lattice_indices = self.lattice.snap(self.points)
+
+        expected = np.array([
+            self.lattice.points[point_matching.closest_point(self.lattice.points, p)] for p in self.points
+        ])
+        np.testing.assert_allclose(matched, expected)
+        np.testing.assert_allclose(residuals, np.linalg.norm(self.points - expected, axis=1))
+        np.testing.assert_allclose(self.lattice.points[self.lattice.flat_indices(lattice_indices)], expected)
+
+    def test_match_points_generic_path(self):
+        expected = point_matching.match_points(self.points, self.lattice)
+        np.testing.assert_allclose(point_matching.match_points(self.points, self.lattice.points), expected)
+
+    def test_match_no_points(self):
+        self.assertEqual(point_matching.match_points(np.empty((0, 3)), self.lattice.points).shape, (0, 3))
+        self.assertEqual(point_matching.match_points(np.empty((0, 3)), self.lattice).shape, (0, 3))
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.landmarks = (np.random.random_sample((500, 3)) - 0.5) * np.array([20, 20, 0.1])
+        self.index = point_matching.SpatialIndex(self.landmarks)
+        self.points = (np.random.random_sample((100, 3)) - 0.5) * np.array([20, 20, 0.4])
+
+    def test_snap_matches_brute_force(self):
+        matched, residuals, indices = self.index.snap(self.points)
+        np.testing.assert_array_equal(indices, point_matching.closest_points(self.landmarks, self.points))
+        np.testing.assert_allclose(matched, self.landmarks[indices])
+        np.testing.assert_allclose(residuals, np.linalg.norm(self.points - matched, axis=1))
+
+    def test_query_radius(self):
+        neighbours = self.index.query_radius(self.points, 1.5)
+        for point, indices in zip(self.points, neighbours):
+            expected = np.flatnonzero(np.linalg.norm(self.landmarks - point, axis=1) <= 1.5)
+            self.assertEqual(sorted(indices), list(expected))
+
+    def test_load_landmarks_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "arena.txt")
+            np.savetxt(path, self.landmarks)
+            # Read-only by default
+            np.testing.assert_allclose(point_matching.load_landmarks(path), self.landmarks)
+            self.assertFalse(os.path.exists(path + ".npy"))
+            np.testing.assert_allclose(point_matching.load_landmarks(path, cache=True), self.landmarks)
+            self.assertTrue(os.path.exists(path + ".npy"))
+
+            # The cache is used while it is newer than the text map
+            np.save(path + ".npy", self.landmarks[0:10])
+            np.testing.assert_allclose(point_matching.load_landmarks(path, cache=True), self.landmarks[0:10])
+            np.testing.assert_allclose(point_matching.load_landmarks(path), self.landmarks)
+            os.utime(path + ".npy", (0, 0))
+            np.testing.assert_allclose(point_matching.load_landmarks(path, cache=True), self.landmarks)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestAssociatePoints(unittest.TestCase):
+
+    def setUp(self):
+        self.lattice = point_matching.GridLattice(21, 20)
+
+    def test_lattice_query_matches_spatial_index(self):
+        points = (np.random.random_sample((200, 3)) - 0.5) * np.array([22, 22, 0.2])
+        index = point_matching.SpatialIndex(self.lattice.points)
+        for k in (1, 4):
+            lattice_distances, _ = self.lattice.query(points, k=k, distance_upper_bound=0.9)
+            index_distances, _ = index.query(points, k=k, distance_upper_bound=0.9)
+            np.testing.assert_allclose(lattice_distances, index_distances)
+
+    def test_lattice_query_missing_neighbours(self):
+        # Only 4 of the 3x3 intersections around a corner are on the grid
+        corner = self.lattice.points[0:1]
+        distances, indices = self.lattice.query(corner, k=6)
+        self.assertTrue(np.all(np.isfinite(distances[0, 0:4])))
+        self.assertTrue(np.all(indices[0, 0:4] < len(self.lattice.points)))
+        self.assertTrue(np.all(np.isinf(distances[0, 4:])))
+        np.testing.assert_array_equal(indices[0, 4:], len(self.lattice.points))
+
+    def test_one_to_one_per_camera(self):
+        points = np.array([[0.1, 0, 0], [0.3, 0, 0], [0.45, 0, 0], [5, 5, 2], [0.1, 0.1, 0]])
+        association = point_matching.associate_points(points, self.lattice, 0.6, np.array([0, 0, 0, 0, 1]))
+
+        np.testing.assert_array_equal(association.accepted, [True, False, True, False, True])
+        np.testing.assert_allclose(association.matched_points[0], [0, 0, 0])
+        np.testing.assert_allclose(association.matched_points[2], [1, 0, 0])
+        np.testing.assert_allclose(association.matched_points[4], [0, 0, 0])
+        np.testing.assert_array_equal(association.unmatched, [3])
+        np.testing.assert_array_equal(association.rejected, [1])
+
+    def test_mahalanobis_gate(self):
+        points = np.array([[0.1, 0, 0], [2, 0.1, 0]])
+        covariance = np.diag([0.01, 0.04, 0.01])
+        association = point_matching.associate_points(points, self.lattice.points, 1.0, covariance=covariance)
+        np.testing.assert_array_equal(association.accepted, [True, True])
+        association = point_matching.associate_points(points, self.lattice.points, 0.75, covariance=covariance)
+        np.testing.assert_array_equal(association.accepted, [False, True])
+
+    def test_association_cache(self):
+        cache = point_matching.AssociationCache()
+        points = np.array([[0.1, 0, 0], [0.3, 0, 0], [2.1, 2.9, 0], [5.5, 5.5, 0]])
+        first = cache.associate(points, self.lattice, 0.4)
+        first_residuals = first.residuals.copy()
+
+        moved = points + np.array([0.05, 0.05, 0])
+        second = cache.associate(moved, self.lattice, 0.4)
+        # Reused, but the association returned before keeps its residuals
+        self.assertIs(second.landmark_indices, first.landmark_indices)
+        self.assertIsNot(second, first)
+        np.testing.assert_array_equal(first.residuals, first_residuals)
+        expected = point_matching.associate_points(moved, self.lattice, 0.4)
+        np.testing.assert_array_equal(second.accepted, expected.accepted)
+        np.testing.assert_allclose(second.residuals, expected.residuals)
+
+        # The last point moves inside the gate of its landmark
+        moved[3] = [5.8, 5.8, 0]
+        third = cache.associate(moved, self.lattice, 0.4)
+        self.assertIsNot(third.landmark_indices, first.landmark_indices)
+        self.assertTrue(third.accepted[3])
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_grid_lattice', TestGridLattice)
+    rosunit.unitrun(PKG, 'test_spatial_index', TestSpatialIndex)
+    rosunit.unitrun(PKG, 'test_associate_points', TestAssociatePoints)
@@ -0,0 +1,247 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+import numpy as np
+import quaternion
+from feature_tracking import point_matching
+from feature_tracking import pose_estimators
+
+
+class SyntheticCorrespondences(object):
+    u"""
+    Two cameras under a drone flying over the arena, looking at the intersections around it.
+    """
+    def __init__(self, random_state, bearing_noise=0.002):
+        self.rotation = quaternion.from_euler_angles(0.05, 0.04, 0.3)
+        self.rotation_matrix = quaternion.as_rotation_matrix(self.rotation)
+        self.translation = np.array([1.2, -0.7, 1.5])
+        self.camera_translations = np.array([[0.1, 0, 0], [0, 0.1, -0.05]])
+        self.camera_rotations = np.array([
+            np.diag([1, -1, -1]),
+            quaternion.as_rotation_matrix(quaternion.from_euler_angles(0.5, 2.8, 0))
+        ])
+
+        arena = point_matching.create_grid_mesh(21, 20)
+        self.landmarks = arena[np.linalg.norm(arena[:, 0:2] - self.translation[0:2], axis=1) < 3]
+        self.camera_indices = random_state.randint(0, 2, self.landmarks.shape[0])
+
+        points_fcu = np.dot(self.landmarks - self.translation, self.rotation_matrix)
+        points_camera = np.einsum(
+            'nji,nj->ni',
+            self.camera_rotations[self.camera_indices],
+            points_fcu - self.camera_translations[self.camera_indices]
+        )
+        self.bearings = points_camera + random_state.normal(0, bearing_noise, points_camera.shape) * np.linalg.norm(points_camera, axis=1)[:, np.newaxis]
+        self.bearings /= np.linalg.norm(self.bearings, axis=1)[:, np.newaxis]
+
+
+class TestRansacTranslation(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = np.random.RandomState(42)
+        self.scene = SyntheticCorrespondences(self.random_state)
+
+    def rays(self, landmarks):
+        return pose_estimators.rays_in_arena(
+            self.scene.bearings,
+            landmarks,
+            self.scene.camera_indices,
+            self.scene.camera_translations,
+            self.scene.camera_rotations,
+            self.scene.rotation_matrix
+        )
+
+    def test_translation_from_rays(self):
+        points, directions = self.rays(self.scene.landmarks)
+        position = pose_estimators.translation_from_rays(points, directions)[0]
+        np.testing.assert_allclose(position, self.scene.translation, atol=0.02)
+
+    def test_ransac_rejects_mismatches(self):
+        landmarks = self.scene.landmarks.copy()
+        outliers = self.random_state.random_sample(landmarks.shape[0]) < 0.3
+        landmarks[outliers] += np.array([1, 0, 0])
+
+        points, directions = self.rays(landmarks)
+        position, covariance, inliers = pose_estimators.ransac_translation(
+            points, directions, 0.02, random_state=self.random_state
+        )
+        np.testing.assert_allclose(position, self.scene.translation, atol=0.02)
+        np.testing.assert_array_equal(inliers, ~outliers)
+        self.assertTrue(np.all(np.linalg.eigvalsh(covariance) > 0))
+
+    def test_ransac_not_enough_lines(self):
+        points, directions = self.rays(self.scene.landmarks)
+        self.assertIsNone(pose_estimators.ransac_translation(points[0:1], directions[0:1], 0.02))
+
+
+class TestRobustTranslation(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = np.random.RandomState(3)
+        self.offset = np.array([0.2, -0.1, 0.05])
+        self.deltas = self.offset + self.random_state.normal(0, 0.01, (40, 3))
+        # Mismatched intersections are a whole cell away
+        self.deltas[0:6] += np.array([1, 0, 0])
+
+    def test_losses_ignore_mismatches(self):
+        for loss in ("huber", "tukey"):
+            translation, covariance, weights = pose_estimators.robust_translation(self.deltas, scale=0.05, loss=loss)
+            np.testing.assert_allclose(translation, self.offset, atol=0.01 if loss == "tukey" else 0.02)
+            self.assertTrue(np.all(weights[0:6] < weights[6:].min()))
+            self.assertTrue(np.all(np.linalg.eigvalsh(covariance) > 0))
+
+    def test_prior_weights(self):
+        prior_weights = np.ones((40,))
+        prior_weights[0:6] = 0
+        translation = pose_estimators.robust_translation(self.deltas, prior_weights, loss="tukey")[0]
+        np.testing.assert_allclose(translation, np.mean(self.deltas[6:], axis=0), atol=1e-3)
+
+    def test_inverse_square_distances_floor(self):
+        position = np.array([1.0, 2.0, 0.0])
+        points = np.array([[1.0, 2.0, 0.0], [1.0, 2.05, 0.0], [1.0, 3.0, 0.0]])
+        weights = pose_estimators.inverse_square_distances(position, points, 0.1)
+        np.testing.assert_allclose(weights, [100, 100, 1])
+
+    def test_no_deltas(self):
+        self.assertIsNone(pose_estimators.robust_translation(np.empty((0, 3))))
+        self.assertRaises(ValueError, pose_estimators.robust_weights, np.ones((2,)), 1.0, "cauchy")
+
+
+class TestIncrementalPoseEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = np.random.RandomState(7)
+        self.scene = SyntheticCorrespondences(self.random_state, 0.0)
+        self.correspondences = (
+            self.scene.bearings,
+            self.scene.landmarks,
+            self.scene.camera_indices,
+            self.scene.camera_translations,
+            self.scene.camera_rotations
+        )
+
+    def test_bearing_jacobian(self):
+        translation = self.scene.translation + np.array([0.05, -0.03, 0.02])
+        rotation_matrix = self.scene.rotation_matrix
+        residuals, jacobians = pose_estimators.bearing_residuals(*(self.correspondences + (translation, rotation_matrix)))
+
+        step = 1e-7
+        for i in xrange(6):
+            perturbation = np.zeros((6,))
+            perturbation[i] = step
+            perturbed = pose_estimators.bearing_residuals(*(self.correspondences + (
+                translation + perturbation[0:3],
+                np.dot(rotation_matrix, pose_estimators.rotation_matrix_from_vector(perturbation[3:6]))
+            )))[0]
+            np.testing.assert_allclose((perturbed - residuals) / step, jacobians[:, :, i], atol=1e-5)
+
+    def test_warm_start_converges_quickly(self):
+        translation = self.scene.translation + np.array([0.03, 0.02, -0.01])
+        rotation_matrix = np.dot(self.scene.rotation_matrix, pose_estimators.rotation_matrix_from_vector(np.array([0.01, 0, -0.02])))
+        result = pose_estimators.refine_pose(*(self.correspondences + (translation, rotation_matrix)))
+
+        np.testing.assert_allclose(result[0], self.scene.translation, atol=1e-6)
+        np.testing.assert_allclose(result[1], self.scene.rotation_matrix, atol=1e-6)
+        self.assertLessEqual(result[3], 3)
+
+    def test_refine_pose_with_prior(self):
+        translation = self.scene.translation + np.array([0.03, 0.02, -0.01])
+        # Two bearings do not constrain the pose, the prior does
+        prior = (self.scene.translation, self.scene.rotation_matrix, 1e6 * np.identity(6))
+        result = pose_estimators.refine_pose(*(tuple(c[0:2] for c in self.correspondences[0:3]) + self.correspondences[3:5] + (
+            translation, self.scene.rotation_matrix
+        )), prior=prior, bearing_variance=1e-4)
+        np.testing.assert_allclose(result[0], self.scene.translation, atol=1e-6)
+        self.assertLess(result[2][0, 0], 1e-5)
+        self.assertIsNone(pose_estimators.refine_pose(*(tuple(c[0:2] for c in self.correspondences[0:3]) + self.correspondences[3:5] + (
+            translation, self.scene.rotation_matrix
+        ))))
+
+    def test_estimator_needs_a_seed(self):
+        estimator = pose_estimators.IncrementalPoseEstimator()
+        self.assertIsNone(estimator.estimate(*self.correspondences))
+
+        estimator.reset(self.scene.translation + 0.05, self.scene.rotation_matrix)
+        translation, rotation_matrix, covariance = estimator.estimate(*self.correspondences)
+        np.testing.assert_allclose(translation, self.scene.translation, atol=1e-6)
+        self.assertEqual(covariance.shape, (6, 6))
+
+    def test_estimator_unseeded_when_lost(self):
+        estimator = pose_estimators.IncrementalPoseEstimator()
+        estimator.reset(self.scene.translation + np.array([0, 0, 5]), self.scene.rotation_matrix.T)
+        self.assertIsNone(estimator.estimate(*self.correspondences))
+        self.assertFalse(estimator.is_seeded())
+
+
+class TestSequentialPoseFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = SyntheticCorrespondences(np.random.RandomState(7), 0.001)
+        self.correspondences = (
+            self.scene.bearings,
+            self.scene.landmarks,
+            self.scene.camera_indices,
+            self.scene.camera_translations,
+            self.scene.camera_rotations
+        )
+
+    def test_rotation_vector_from_matrix(self):
+        for rotation_vector in (np.array([0.3, -0.2, 0.1]), np.array([1e-8, 0, 0]), np.array([0, 0, np.pi])):
+            rotation_matrix = pose_estimators.rotation_matrix_from_vector(rotation_vector)
+            np.testing.assert_allclose(
+                pose_estimators.rotation_matrix_from_vector(pose_estimators.rotation_vector_from_matrix(rotation_matrix)),
+                rotation_matrix,
+                atol=1e-9
+            )
+
+    def test_predict_follows_the_fcu(self):
+        sequential_filter = pose_estimators.SequentialPoseFilter()
+        self.assertFalse(sequential_filter.predict(0.0, np.zeros(3), np.identity(3)))
+
+        # The FCU believes it is 0.5 m off, the filter keeps the offset while it moves
+        fcu_translation = self.scene.translation + np.array([0.5, 0, 0])
+        sequential_filter.seed(0.0, fcu_translation, self.scene.rotation_matrix, self.scene.translation, self.scene.rotation_matrix)
+        motion = pose_estimators.rotation_matrix_from_vector(np.array([0, 0, 0.2]))
+        self.assertTrue(sequential_filter.predict(
+            0.1,
+            fcu_translation + np.array([0.3, 0.1, 0]),
+            np.dot(self.scene.rotation_matrix, motion)
+        ))
+        np.testing.assert_allclose(sequential_filter.translation, self.scene.translation + np.array([0.3, 0.1, 0]), atol=1e-9)
+        np.testing.assert_allclose(sequential_filter.rotation_matrix, np.dot(self.scene.rotation_matrix, motion), atol=1e-9)
+        self.assertGreater(sequential_filter.covariance[0, 0], pose_estimators.DEFAULT_SEED_COVARIANCE[0, 0])
+
+        self.assertFalse(sequential_filter.predict(5.0, fcu_translation, self.scene.rotation_matrix))
+        self.assertFalse(sequential_filter.is_seeded())
+
+    def test_update_with_a_single_camera(self):
+        sequential_filter = pose_estimators.SequentialPoseFilter()
+        translation = self.scene.translation + np.array([0.1, -0.05, 0.03])
+        sequential_filter.seed(0.0, translation, self.scene.rotation_matrix, translation, self.scene.rotation_matrix)
+
+        camera = self.scene.camera_indices == 0
+        self.assertTrue(sequential_filter.update(*(tuple(c[camera] for c in self.correspondences[0:3]) + self.correspondences[3:5])))
+        np.testing.assert_allclose(sequential_filter.translation, self.scene.translation, atol=0.02)
+        covariance = sequential_filter.arena_covariance()
+        self.assertLess(covariance[0, 0], pose_estimators.DEFAULT_SEED_COVARIANCE[0, 0])
+        np.testing.assert_allclose(covariance, covariance.T, atol=1e-12)
+
+    def test_unseeded_when_lost(self):
+        sequential_filter = pose_estimators.SequentialPoseFilter()
+        self.assertFalse(sequential_filter.update(*self.correspondences))
+        sequential_filter.seed(
+            0.0, self.scene.translation, self.scene.rotation_matrix,
+            self.scene.translation + np.array([0, 0, 5]), self.scene.rotation_matrix.T, 1e-6 * np.identity(6)
+        )
+        self.assertFalse(sequential_filter.update(*self.correspondences))
+        self.assertFalse(sequential_filter.is_seeded())
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_ransac_translation', TestRansacTranslation)
+    rosunit.unitrun(PKG, 'test_robust_translation', TestRobustTranslation)
+    rosunit.unitrun(PKG, 'test_incremental_pose_estimator', TestIncrementalPoseEstimator)
+    rosunit.unitrun(PKG, 'test_sequential_pose_filter', TestSequentialPoseFilter)
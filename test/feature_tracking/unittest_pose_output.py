@@ -0,0 +1,65 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import threading
+import unittest
+
+import numpy as np
+import quaternion
+from feature_tracking import pose_output
+
+
+class FakeBroadcaster(object):
+
+    def __init__(self):
+        self.transforms = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def sendTransformMessage(self, transform):
+        self.release.wait()
+        self.transforms.append((transform.header.stamp, transform.transform.translation.x, transform.transform.rotation.w))
+
+
+class FakePublisher(object):
+
+    def __init__(self):
+        self.covariances = []
+
+    def publish(self, message):
+        self.covariances.append(message.pose.covariance)
+
+
+class TestPoseOutput(unittest.TestCase):
+
+    def test_send(self):
+        publisher = FakePublisher()
+        output = pose_output.PoseOutput(FakeBroadcaster(), "arena", "vision", pose_publisher=publisher)
+        output.stop()
+        output.send(np.array([1, 2, 3]), quaternion.one, 5, np.identity(6))
+        output.send(np.array([1, 2, 3]), quaternion.one, 6)
+
+        self.assertEqual(output.broadcaster.transforms, [(5, 1, 1), (6, 1, 1)])
+        self.assertEqual(output._transform.header.frame_id, "arena")
+        self.assertEqual(output._transform.child_frame_id, "vision")
+        self.assertEqual(publisher.covariances[0], tuple(np.identity(6).ravel()))
+        self.assertEqual(publisher.covariances[1], pose_output.UNKNOWN_COVARIANCE)
+
+    def test_only_latest_pose_sent(self):
+        broadcaster = FakeBroadcaster()
+        broadcaster.release.clear()
+        output = pose_output.PoseOutput(broadcaster, "arena", "vision")
+        for i in xrange(5):
+            output.submit(np.array([i, 0, 0]), quaternion.one, i)
+        broadcaster.release.set()
+        while output._mailbox is not None:
+            threading.Event().wait(0.01)
+        output.stop()
+
+        self.assertGreaterEqual(output.replaced_poses, 3)
+        self.assertEqual(broadcaster.transforms[-1], (4, 4, 1))
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_pose_output', TestPoseOutput)
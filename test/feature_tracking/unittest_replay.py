@@ -0,0 +1,75 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rosbag
+from feature_tracking import replay
+from feature_tracking import synthetic_bag
+
+
+class TestReplay(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.bag_path = os.path.join(cls.directory, "synthetic.bag")
+        synthetic_bag.write_synthetic_bag(cls.bag_path, frames=60, camera_number=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_replay_synthetic_bag(self):
+        harness = replay.ReplayHarness({"camera_number": 2, "debug_output": False})
+        wall_time = harness.run(self.bag_path)
+
+        self.assertEqual(harness.global_state.total_messages_processed, 60)
+        self.assertEqual(len(harness.output.poses), 60)
+        position_errors, _ = harness.pose_errors()
+        self.assertLess(float(position_errors.mean()), 0.05)
+        self.assertIn("frames/s", harness.report(wall_time))
+
+    def test_preprocessing_pool_matches_serial(self):
+        poses = []
+        for threads in (1, 2):
+            harness = replay.ReplayHarness({"camera_number": 2, "debug_output": False, "preprocessing_threads": threads})
+            harness.run(self.bag_path)
+            self.assertEqual(harness.global_state.preprocessing_pool is None, threads == 1)
+            poses.append(np.array([translation for _, translation, _, _ in harness.output.poses]))
+        np.testing.assert_allclose(poses[0], poses[1])
+
+    def test_streaming_fusion_out_of_order(self):
+        harness = replay.ReplayHarness({"camera_number": 2, "debug_output": False, "fusion_mode": "streaming"})
+        self.assertIsNone(harness.global_state.synchonyser)
+
+        # The intersections of camera 1 arrive one frame late, after the next frame of camera 0
+        late_topic = "localization/features_1"
+        late_message = None
+        with rosbag.Bag(self.bag_path) as bag:
+            for topic, message, bag_time in bag.read_messages():
+                if topic.strip("/") == late_topic:
+                    if late_message is not None:
+                        harness.feed(*late_message)
+                    late_message = (topic, message, bag_time)
+                else:
+                    harness.feed(topic, message, bag_time)
+        harness.feed(*late_message)
+
+        # Every camera frame is published on its own, at its own stamp
+        self.assertEqual(harness.global_state.total_messages_processed, 120)
+        self.assertEqual(len(harness.output.poses), 120)
+        stamps = np.array([stamp for stamp, _, _, _ in harness.output.poses])
+        self.assertTrue(np.any(np.diff(stamps) < 0))
+        self.assertGreater(harness.global_state.instrumentation.counters["estimator.sequential"], 100)
+        position_errors, _ = harness.pose_errors()
+        self.assertLess(float(position_errors.mean()), 0.05)
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_replay', TestReplay)
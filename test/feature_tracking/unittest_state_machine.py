@@ -0,0 +1,141 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+from feature_tracking import state_machine
+from fakes import FakeTimer
+
+
+class Context(object):
+
+    def __init__(self):
+        self.events = []
+        self.machine = None
+        self.warnings = 0
+        self.ticks = 0
+
+
+def state_idle(context, event):
+    context.events.append(("idle", event))
+    if event == "go":
+        return state_waiting
+    return state_idle
+
+
+def state_waiting(context, event):
+    context.events.append(("waiting", event))
+    if event == state_machine.ENTER:
+        context.machine.set_timer("timeout", 2.0)
+    elif event == "timeout":
+        return state_passing
+    return state_waiting
+
+
+def state_ticking(context, event):
+    context.events.append(("ticking", event))
+    if event == state_machine.ENTER:
+        context.machine.set_timer("tick", 0.05, oneshot=False)
+    elif event == "tick":
+        context.ticks += 1
+    elif event == "go":
+        return state_idle
+    return state_ticking
+
+
+def state_passing(context, event):
+    # Like state_warn_no_messages, it is also run on EXIT, its action is only done on ENTER
+    context.events.append(("passing", event))
+    if event == state_machine.ENTER:
+        context.warnings += 1
+    return state_idle
+
+
+class TestStateMachine(unittest.TestCase):
+
+    def setUp(self):
+        self.timers = []
+        self.context = Context()
+        self.machine = state_machine.StateMachine(self.context, self.schedule)
+        self.context.machine = self.machine
+
+    def schedule(self, delay, callback, oneshot=True):
+        timer = FakeTimer(delay, callback, oneshot)
+        self.timers.append(timer)
+        return timer
+
+    def test_transitions_on_events_and_timers(self):
+        self.machine.start(state_idle)
+        self.assertIs(self.machine.state, state_idle)
+        self.assertEqual(self.timers, [])
+
+        self.machine.dispatch("go")
+        self.assertIs(self.machine.state, state_waiting)
+        self.assertEqual(len(self.timers), 1)
+        self.assertEqual(self.timers[0].delay, 2.0)
+
+        # passing goes back to idle as soon as it is entered
+        self.timers[0].callback()
+        self.assertIs(self.machine.state, state_idle)
+        self.assertEqual(self.context.events[-5:], [
+            ("waiting", "timeout"),
+            ("waiting", state_machine.EXIT),
+            ("passing", state_machine.ENTER),
+            ("passing", state_machine.EXIT),
+            ("idle", state_machine.ENTER)
+        ])
+
+        counters = self.machine.instrumentation.counters
+        self.assertEqual(counters["transition.none.idle"], 1)
+        self.assertEqual(counters["transition.idle.waiting"], 1)
+        self.assertEqual(counters["transition.passing.idle"], 1)
+        self.assertEqual(self.machine.instrumentation.histograms["state.waiting"].count, 1)
+        self.assertEqual(self.machine.instrumentation.histograms["transition"].count, 3)
+        self.assertEqual([transition[1:3] for transition in self.machine.history][-2:], [("waiting", "passing"), ("passing", "idle")])
+
+    def test_passing_state_acts_once(self):
+        self.machine.start(state_idle)
+        self.machine.dispatch("go")
+        self.timers[0].callback()
+        self.assertIn(("passing", state_machine.EXIT), self.context.events)
+        self.assertEqual(self.context.warnings, 1)
+
+    def test_timers_cancelled_when_leaving(self):
+        self.machine.start(state_idle)
+        self.machine.dispatch("go")
+        timer = self.timers[0]
+        self.machine.dispatch("go")
+        self.machine.set_timer("timeout", 1.0)
+        self.assertTrue(timer.cancelled)
+
+        # A timer that fires after being replaced does nothing
+        timer.callback()
+        self.assertIs(self.machine.state, state_waiting)
+        self.timers[-1].callback()
+        self.assertIs(self.machine.state, state_idle)
+
+    def test_periodic_timer(self):
+        self.machine.start(state_ticking)
+        self.assertEqual(len(self.timers), 1)
+        self.assertFalse(self.timers[0].oneshot)
+        for _ in xrange(3):
+            self.timers[0].callback()
+        # A single timer for all the ticks, cancelled when leaving
+        self.assertEqual(self.context.ticks, 3)
+        self.assertEqual(len(self.timers), 1)
+        self.machine.dispatch("go")
+        self.assertTrue(self.timers[0].cancelled)
+        self.timers[0].callback()
+        self.assertEqual(self.context.ticks, 3)
+
+    def test_summary(self):
+        self.machine.start(state_idle)
+        self.machine.dispatch("go")
+        summary = dict(self.machine.summary())
+        self.assertEqual(summary["state"], "waiting")
+        self.assertTrue(summary["last_transition"].startswith("idle -> waiting on go"))
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_state_machine', TestStateMachine)
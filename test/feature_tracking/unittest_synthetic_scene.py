@@ -0,0 +1,60 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+import numpy as np
+from feature_tracking import synthetic_scene
+
+
+class TestSyntheticScene(unittest.TestCase):
+
+    def setUp(self):
+        self.random_state = np.random.RandomState(5)
+        self.times = np.arange(50) / 30.0
+        self.translations, self.rotation_matrices = synthetic_scene.circle_trajectory(self.times)
+        self.camera_translations, self.camera_rotations = synthetic_scene.camera_ring(3)
+        camera_matrix = np.array([[300.0, 0, 320], [0, 300, 240], [0, 0, 1]])
+        self.scene = synthetic_scene.SyntheticScene(self.camera_translations, self.camera_rotations, camera_matrix, pixel_noise=0)
+
+    def to_arena(self, frames, frame, camera, translations):
+        ground_points = frames.camera_frame(frame, camera)[1]
+        points_fcu = np.dot(ground_points, self.camera_rotations[camera].T) + self.camera_translations[camera]
+        return np.dot(points_fcu, self.rotation_matrices[frame].T) + translations[frame]
+
+    def test_ground_points_are_the_landmarks(self):
+        frames = self.scene.render(self.times, self.translations, self.rotation_matrices, random_state=self.random_state)
+        for frame in (0, 20, 49):
+            for camera in xrange(3):
+                pixels, _, landmark_indices = frames.camera_frame(frame, camera)
+                self.assertGreater(pixels.shape[0], 2)
+                self.assertTrue(np.all((pixels >= 0) & (pixels < [640, 480])))
+                np.testing.assert_allclose(
+                    self.to_arena(frames, frame, camera, self.translations),
+                    self.scene.landmarks[landmark_indices],
+                    atol=1e-9
+                )
+
+    def test_ground_points_follow_the_believed_pose(self):
+        drift = synthetic_scene.odometry_drift(self.times + 20)
+        believed_translations = self.translations + drift
+        frames = self.scene.render(self.times, self.translations, self.rotation_matrices, believed_translations, random_state=self.random_state)
+        landmark_indices = frames.camera_frame(10, 1)[2]
+        deltas = self.to_arena(frames, 10, 1, believed_translations) - self.scene.landmarks[landmark_indices]
+        np.testing.assert_allclose(np.mean(deltas, axis=0)[0:2], drift[10, 0:2], atol=0.02)
+
+    def test_outliers_and_skew(self):
+        self.scene.outlier_rate = 0.2
+        self.scene.timestamp_skew = 0.01
+        frames = self.scene.render(self.times, self.translations, self.rotation_matrices, random_state=self.random_state)
+
+        outliers = frames.landmark_indices < 0
+        self.assertAlmostEqual(np.count_nonzero(outliers) / float(np.count_nonzero(~outliers)), 0.2, delta=0.05)
+        keys = frames.frame_indices * 3 + frames.camera_indices
+        self.assertTrue(np.all(np.diff(keys) >= 0))
+        self.assertTrue(np.all(np.abs(frames.stamps - self.times[:, np.newaxis]) <= 0.01))
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_synthetic_scene', TestSyntheticScene)
@@ -0,0 +1,58 @@
+#!usr/bin/env python
+PKG = 'elikos_localization'
+
+import unittest
+
+import numpy as np
+import quaternion
+from feature_tracking import transform_buffer
+
+
+class TestTransformBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = transform_buffer.TransformBuffer(capacity=4)
+
+    def insert_yaw(self, time, yaw):
+        self.buffer.insert(time, np.array([time, 2 * time, 0]), quaternion.from_euler_angles(0, 0, yaw))
+
+    def test_interpolation(self):
+        self.insert_yaw(1.0, 0)
+        self.insert_yaw(2.0, 0.5)
+
+        translation, rotation = self.buffer.lookup(1.5)
+        np.testing.assert_allclose(translation, [1.5, 3, 0])
+        expected = quaternion.from_euler_angles(0, 0, 0.25)
+        np.testing.assert_allclose(quaternion.as_float_array(rotation), quaternion.as_float_array(expected), atol=1e-9)
+
+    def test_outside_of_buffer(self):
+        self.insert_yaw(1.0, 0)
+        self.insert_yaw(2.0, 0)
+        self.assertIsNone(self.buffer.lookup(0.5))
+        self.assertIsNone(self.buffer.lookup(2.5))
+        self.assertIsNone(self.buffer.lookup(1.5, max_interval=0.5))
+
+    def test_bounded_extrapolation(self):
+        self.insert_yaw(1.0, 0)
+        self.assertIsNone(self.buffer.lookup(1.05))
+        np.testing.assert_allclose(self.buffer.lookup(1.05, max_extrapolation=0.1)[0], [1, 2, 0])
+
+        self.insert_yaw(2.0, 0.5)
+        translation, rotation = self.buffer.lookup(2.1, max_extrapolation=0.2)
+        np.testing.assert_allclose(translation, [2.1, 4.2, 0])
+        expected = quaternion.from_euler_angles(0, 0, 0.55)
+        np.testing.assert_allclose(quaternion.as_float_array(rotation), quaternion.as_float_array(expected), atol=1e-9)
+        self.assertIsNone(self.buffer.lookup(2.3, max_extrapolation=0.2))
+
+    def test_out_of_order_insertion_and_capacity(self):
+        for time in (5.0, 1.0, 3.0, 2.0, 4.0, 6.0, 7.0, 8.0, 9.0, 0.5):
+            self.insert_yaw(time, 0)
+        self.assertEqual(len(self.buffer), 4)
+        self.assertEqual(self.buffer.oldest_time(), 6.0)
+        self.assertEqual(self.buffer.newest_time(), 9.0)
+        np.testing.assert_allclose(self.buffer.lookup(7.5)[0], [7.5, 15, 0])
+
+
+if __name__ == '__main__':
+    import rosunit
+    rosunit.unitrun(PKG, 'test_transform_buffer', TestTransformBuffer)